@@ -0,0 +1,204 @@
+"""
+Offline benchmark of run_deployment against the fake Azure backend (deploy/resources/fake.py).
+
+Measures wall time, API calls, threads and throttling for each component set, schedule shape and
+worker count. The 'batch' shape deploys the components as one composite deployment (sync manager only). No Azure subscription or network access is needed.
+
+Usage:
+    python benchmarks/bench_deployment.py [--time-scale=<s>] [--throttle-rate=<p>] [--failure-rate=<p>]
+                                          [--fail=<component>...] [--repeat=<n>] [--async] [--events=<path>]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deploy.utils import log, trace, ratelimit, lro, events, secrets
+from deploy.resources.fake import FakeAzure
+from deploy import scheduler
+import deploy.common as common
+import deploy.deployment_manager as deployment_manager
+
+COMPONENT_SETS = {
+    'core': ['vnet', 'role', 'keyvault', 'acr', 'sa', 'dev_vm'],
+    'core+db': ['vnet', 'role', 'keyvault', 'acr', 'sa', 'dev_vm', 'db'],
+    'db-only': ['keyvault', 'db']
+}
+
+# 旧実装のグループ単位の実行 (グループ内は並列、グループ間は全完了待ち)
+BARRIER_GROUPS = [
+    ['vnet', 'acr', 'sa', 'keyvault'],
+    ['role'],
+    ['dev_vm'],
+    ['db', 'app_container'],
+    ['back', 'scheduler'],
+    ['front']
+]
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+def get_schedule_shapes() -> dict:
+    """
+    Returns:
+        dict: Shape name -> component dependencies
+    """
+    barrier = {}
+    previous = []
+    for group in BARRIER_GROUPS:
+        for component in group:
+            barrier[component] = list(previous)
+        previous = previous + group
+    order = [component for group in BARRIER_GROUPS for component in group]
+    serial = {component: order[:index] for index, component in enumerate(order)}
+    return {'dag': dict(common.component_dependencies), 'barrier': barrier, 'serial': serial,
+            'batch': dict(common.component_dependencies)}
+
+class ThreadSampler():
+    """Samples the number of live threads in the background."""
+    def __init__(self, interval: float = 0.002):
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.__run, daemon=True)
+        self.peak = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def __run(self):
+        while not self._stop.is_set():
+            # サンプラ自身のスレッドを除く
+            self.peak = max(self.peak, threading.active_count() - 1)
+            self._stop.wait(self._interval)
+
+def run_once(azure: FakeAzure, components: list, dependencies: dict, max_workers: int, use_async: bool,
+             batch: bool = False) -> dict:
+    with tempfile.TemporaryDirectory() as root_path:
+        conf = {
+            'subscription_id': '00000000-0000-0000-0000-000000000000',
+            'env_name': 'bench',
+            'location': 'japaneast',
+            'vnet_cidr': '10.0.0.0/16',
+            'dev_subnet_cidr': '10.0.24.0/24',
+            'UseSsh': 'True',
+            'AdminPassword': '',
+            'AdminUsername': 'azureadmin',
+            'OsDiskType': 'Standard_LRS',
+            'DevVmSize': 'Standard_D2s_v3',
+            'UbuntuOsVersion': 'Ubuntu-2204',
+            'DbName': 'backenddb',
+            'DbRootName': 'dbadmin',
+            'max_workers': max_workers,
+            'RootPath': root_path
+        }
+        if use_async:
+            # 同期版の計測が aio のスタックに依存しないよう、--async の場合のみ読み込む
+            import deploy.async_deployment_manager as async_deployment_manager
+            manager = async_deployment_manager
+        else:
+            manager = deployment_manager
+        saved_dependencies = manager.component_dependencies
+        manager.component_dependencies = dependencies
+        trace.tracer = trace.Tracer()
+        # 再試行の待ち時間もシミュレーション時間に合わせる
+        ratelimit.limiter = ratelimit.RateLimiter(base_delay=2 * azure.time_scale, max_delay=60 * azure.time_scale,
+                                                  pace_delay=5 * azure.time_scale)
+        lro.poller.configure(min_interval=5 * azure.time_scale, max_interval=30 * azure.time_scale)
+        secrets.cache.invalidate()
+        try:
+            with azure.install(manager), ThreadSampler() as sampler:
+                start = time.perf_counter()
+                if use_async:
+                    results = asyncio.run(manager.run_deployment(conf, components, force=True))
+                else:
+                    results = manager.run_deployment(conf, components, force=True, batch=batch)
+                elapsed = time.perf_counter() - start
+        finally:
+            manager.component_dependencies = saved_dependencies
+    return {
+        'wall': elapsed,
+        'failed': sum(result['status'] != scheduler.STATUS_SUCCEEDED for result in results.values()),
+        'peak_threads': sampler.peak,
+        'stats': ratelimit.limiter.stats()
+    }
+
+def run_benchmark(args) -> list:
+    rows = []
+    shapes = get_schedule_shapes()
+    for set_name, components in COMPONENT_SETS.items():
+        for shape_name, dependencies in shapes.items():
+            if shape_name == 'batch' and args.use_async:
+                continue
+            for max_workers in WORKER_COUNTS:
+                walls = []
+                for repeat in range(args.repeat):
+                    azure = FakeAzure(time_scale=args.time_scale, failure_rate=args.failure_rate,
+                                      throttle_rate=args.throttle_rate, failing_components=args.fail,
+                                      seed=repeat)
+                    try:
+                        result = run_once(azure, components, dependencies, max_workers, args.use_async,
+                                          batch=shape_name == 'batch')
+                    except ValueError as e:
+                        # パラメータ準備の失敗 (注入した障害によるもの)
+                        result = {'wall': float('nan'), 'failed': len(components), 'peak_threads': 0,
+                                  'stats': ratelimit.limiter.stats()}
+                        log.debug(f"Prepare failed: {e}")
+                    walls.append(result['wall'])
+                rows.append({
+                    'set': set_name,
+                    'shape': shape_name,
+                    'workers': max_workers,
+                    'wall': statistics.median(walls),
+                    'simulated': statistics.median(walls) / args.time_scale,
+                    'calls': azure.total_calls,
+                    'deploy_calls': azure.calls.get('deploy', 0),
+                    'poll_calls': azure.calls.get('poll', 0),
+                    'threads': azure.thread_count,
+                    'peak_threads': result['peak_threads'],
+                    'failed': result['failed'],
+                    'throttled': result['stats']['throttled_responses'],
+                    'retries': result['stats']['retries']
+                })
+    return rows
+
+def print_rows(rows: list):
+    header = (f"{'set':<10}{'shape':<9}{'workers':>8}{'wall[s]':>10}{'sim[s]':>9}"
+              f"{'calls':>7}{'deploys':>9}{'polls':>7}{'threads':>9}{'peak':>6}{'429s':>6}{'retries':>8}{'failed':>8}")
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['set']:<10}{row['shape']:<9}{row['workers']:>8}{row['wall']:>10.3f}{row['simulated']:>9.0f}"
+              f"{row['calls']:>7}{row['deploy_calls']:>9}{row['poll_calls']:>7}{row['threads']:>9}{row['peak_threads']:>6}"
+              f"{row['throttled']:>6}{row['retries']:>8}{row['failed']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline deployment benchmark with a fake Azure backend.')
+    parser.add_argument('--time-scale', type=float, default=0.002, help='Real seconds per simulated second.')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Probability of an HTTP 429 per API call.')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability of an HTTP 500 per API call.')
+    parser.add_argument('--fail', action='append', default=[], help='Component whose deployment always fails.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per configuration (the median is reported).')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Benchmark the asyncio manager.')
+    parser.add_argument('--events', help='Write the progress events of all runs as JSON lines.')
+    args = parser.parse_args()
+
+    log.set_console_handler('CRITICAL')
+    if args.events:
+        events.bus.subscribe(events.JsonLinesWriter(args.events))
+    try:
+        print_rows(run_benchmark(args))
+    finally:
+        events.bus.close()
+
+if __name__ == '__main__':
+    main()
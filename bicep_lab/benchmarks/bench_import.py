@@ -0,0 +1,69 @@
+"""
+Import-time benchmark of the CLI entry points.
+
+Each scenario runs in a fresh interpreter with `-X importtime`. The benchmark reports the
+median wall time of the process, the total import time and how many `azure` modules were loaded.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat=<n>]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+import statistics
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# シナリオ名 -> 実行するコード
+SCENARIOS = {
+    'import main': "import main",
+    'usage error': "import sys; sys.argv = ['main.py', '--no-such-option']; import main; main.main()",
+    'destroy classes': "from deploy.resources import ResourceGroup, Subscription",
+    'deployment_manager': "import deploy.deployment_manager",
+    'async_deployment_manager': "import deploy.async_deployment_manager"
+}
+
+__IMPORT_TIME_PATTERN__ = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def run_scenario(code: str) -> dict:
+    # 読み込まれた azure モジュール数を終了時に出力する
+    probe = ("import atexit, sys; atexit.register(lambda: print('AZURE_MODULES=%d' % "
+             "sum(1 for name in list(sys.modules) if name == 'azure' or name.startswith('azure.'))))\n")
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe + code], cwd=ROOT_PATH,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+
+    import_us = 0
+    for line in completed.stderr.splitlines():
+        match = __IMPORT_TIME_PATTERN__.match(line)
+        # インデントの無い行がトップレベルの import (cumulative に子を含む)
+        if match and len(match.group(3)) == 1:
+            import_us += int(match.group(2))
+    azure_modules = re.search(r'AZURE_MODULES=(\d+)', completed.stdout)
+    return {
+        'wall': elapsed,
+        'imports': import_us / 1e6,
+        'azure_modules': int(azure_modules.group(1)) if azure_modules else -1,
+        'returncode': completed.returncode
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time benchmark of the CLI entry points.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario (the median is reported).')
+    args = parser.parse_args()
+
+    header = f"{'scenario':<26}{'wall[s]':>10}{'imports[s]':>12}{'azure mods':>12}{'exit':>6}"
+    print(header)
+    print('-' * len(header))
+    for name, code in SCENARIOS.items():
+        runs = [run_scenario(code) for _ in range(args.repeat)]
+        print(f"{name:<26}{statistics.median(run['wall'] for run in runs):>10.3f}"
+              f"{statistics.median(run['imports'] for run in runs):>12.3f}"
+              f"{runs[-1]['azure_modules']:>12}{runs[-1]['returncode']:>6}")
+
+if __name__ == '__main__':
+    main()
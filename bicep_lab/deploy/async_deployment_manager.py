@@ -0,0 +1,176 @@
+import os
+import asyncio
+from deploy.utils import log, context, files
+from deploy.utils import fingerprint, trace, ratelimit
+from deploy.utils.state import StateStore, get_state_dir
+from deploy.utils.template_cache import TemplateCache
+from deploy.resources.aio import Bicep, Vnet, Keyvault, StorageAccount, Inventory, registry
+from deploy.common import component_dependencies, prepare_dependencies, resource_name_params, default_max_workers
+from deploy.deployment_manager import (get_template_cache_dir, get_vm_conf_dir, get_template_path, get_deployment,
+                                       needs_deployment_tags, is_unchanged, record_deployment, check_prepared_params,
+                                       prepare_role_params, build_sa_params, build_vnet_params, build_acr_params,
+                                       build_keyvault_params, prepare_dev_vmss_params, build_sql_db_params,
+                                       prepare_app_container_params, build_app_params, check_keyvault_found)
+from deploy import scheduler
+
+async def run_deployment(conf: dict, sorted_components: list, force: bool = False, prepared: dict = None) -> dict:
+    """
+    asyncio version of deployment_manager.run_deployment.
+    Lookups, secret reads and deployment polling all run concurrently on the current event loop.
+    """
+    try:
+        with trace.span(conf['env_name'], 'run'):
+            return await __run_deployment(conf, sorted_components, force, prepared)
+    finally:
+        await registry.close()
+
+async def __run_deployment(conf: dict, sorted_components: list, force: bool, prepared: dict) -> dict:
+    bicep_dir_path = os.path.join(conf['RootPath'], 'bicep')
+    tmp_dir_path = os.path.join(conf['RootPath'], 'tmp')
+    rg_name = context.get_main_rg_name(conf['env_name'])
+    template_cache = TemplateCache(get_template_cache_dir(conf))
+    bicep = Bicep(conf['subscription_id'], tmp_dir_path, conf.get('deploy_engine', 'sdk'), template_cache)
+    state = StateStore(get_state_dir(conf), conf['subscription_id'], conf['env_name'])
+    inventory = Inventory(conf['subscription_id'], rg_name, state=state, ttl=conf.get('state_ttl'))
+    files.remove_stale_params_files(tmp_dir_path)
+    if prepared is None:
+        prepared = await prepare_all(conf, sorted_components, inventory)
+
+    async def deploy_component(component: str):
+        template_path = get_template_path(bicep_dir_path, component)
+        log.info(f"Deploying component: {component}")
+
+        with trace.span('compile'):
+            template = await bicep.build_template(template_path)
+        deployment = get_deployment(conf, component, template_path, template, prepared[component],
+                                    state.get_key())
+        tags = None
+        if needs_deployment_tags(bicep, state, component, force):
+            tags = await bicep.get_deployment_tags(rg_name, deployment['name'])
+        if not force and is_unchanged(state, component, deployment, tags):
+            log.info(f"Skipping unchanged component: {component}")
+            if component == 'sa':
+                await __sync_vm_conf(conf, prepared[component])
+            return {'name': deployment['name'], 'status': 'Unchanged', 'outputs': {}}
+
+        with trace.span('submit'):
+            result = await ratelimit.retry_async(
+                lambda: bicep.deploy(deploy_name=deployment['name'], template_file_path=template_path,
+                                     rg_name=rg_name, params=deployment['params'],
+                                     tags={fingerprint.FINGERPRINT_TAG: deployment['fingerprint']}),
+                f"Deployment {deployment['name']}", conf['subscription_id'].lower())
+        record_deployment(state, inventory, component, prepared[component], deployment, result)
+        log.info(f"Successfully deployed component: {component} ({result['status']})")
+        if component == 'sa':
+            await __sync_vm_conf(conf, prepared[component])
+        return result
+
+    max_concurrency = conf.get('max_workers') or default_max_workers
+    results = await scheduler.run_dag_async(sorted_components, component_dependencies, deploy_component,
+                                            max_concurrency=max_concurrency, category='deploy')
+    for component in sorted_components:
+        log.info(f"{component}: {results[component]['status']}")
+    return results
+
+async def prepare_all(conf: dict, components: list, inventory: Inventory) -> dict:
+    """
+    asyncio version of deployment_manager.prepare_all.
+    """
+    rg_name = context.get_main_rg_name(conf['env_name'])
+    prepared = {}
+
+    async def prepare(component: str):
+        upstream = {dep: prepared[dep] for dep in prepare_dependencies.get(component, []) if dep in prepared}
+        params = await __prepare_params(component, rg_name, conf, inventory, upstream)
+        prepared[component] = check_prepared_params(component, params)
+
+    results = await scheduler.run_dag_async(components, prepare_dependencies, prepare, category='prepare')
+    failures = [f"{component}: {result['error'] or result['status']}"
+                for component, result in results.items() if result['status'] != scheduler.STATUS_SUCCEEDED]
+    if failures:
+        log.error("Failed to prepare the parameters of the components:")
+        for failure in failures:
+            log.error(f"  {failure}")
+        for component in resource_name_params:
+            inventory.forget(component)
+        raise ValueError(f"Failed to prepare the parameters of {len(failures)} component(s): {'; '.join(failures)}")
+    return prepared
+
+async def __sync_vm_conf(conf: dict, params: dict):
+    sa = StorageAccount(conf['subscription_id'])
+    result = await sa.sync_directory(params['storage_account_name'], params['dev_container_name'], get_vm_conf_dir(conf),
+                                     delete=conf.get('vm_conf_delete_orphans', False))
+    log.info(f"Synchronized VM configuration files: {len(result['uploaded'])} uploaded, "
+             f"{len(result['unchanged'])} unchanged, {len(result['deleted'])} deleted")
+
+async def __prepare_params(component: str, rg_name: str, conf: dict, inventory: Inventory, upstream: dict):
+    # パラメータの組み立ては deployment_manager と共通で、ここでは検索のみを非同期に行う
+    env_name = conf['env_name']
+    if component == 'role':
+        return prepare_role_params(conf)
+    elif component == 'sa':
+        return build_sa_params(conf, await inventory.find_storage_account(env_name))
+    elif component == 'vnet':
+        return await __prepare_vnet_params(rg_name, conf)
+    elif component == 'acr':
+        return build_acr_params(conf, await inventory.find_acr(env_name))
+    elif component == 'keyvault':
+        return await __prepare_keyvault_params(conf, inventory)
+    elif component == 'dev_vm':
+        return prepare_dev_vmss_params(conf)
+    elif component == 'db':
+        return await __prepare_sql_db_params(conf, inventory, upstream)
+    elif component == 'app_container':
+        return prepare_app_container_params(conf)
+    elif component in ('scheduler', 'back', 'front'):
+        return await __prepare_app_params(component, conf, inventory, upstream)
+    else:
+        raise ValueError(f"Invalid component: {component}")
+
+async def __prepare_vnet_params(rg_name: str, conf: dict):
+    vnet = Vnet(conf['subscription_id'])
+    vnet_name = context.get_vnet_name(conf['env_name'])
+    # VNetの取得とサブスクリプション全体のCIDR一覧の取得を並行して行う
+    existing_vnet, vnet_index = await asyncio.gather(vnet.get_vnet_by_name(rg_name, vnet_name),
+                                                     vnet.get_cidr_index())
+    if existing_vnet:
+        return build_vnet_params(conf, vnet_index, existing_vnet.id,
+                                 subnet_index=await vnet.get_subnet_cidr_index(vnet_name, rg_name))
+    return build_vnet_params(conf, vnet_index)
+
+async def __prepare_keyvault_params(conf: dict, inventory: Inventory):
+    env_name = conf['env_name']
+    keyvault_name = await inventory.find_keyvault(env_name)
+    sql_pass = None
+    if keyvault_name:
+        keyvault = Keyvault(conf['subscription_id'])
+        sql_pass = await keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
+    return build_keyvault_params(conf, keyvault_name, sql_pass)
+
+async def __prepare_sql_db_params(conf: dict, inventory: Inventory, upstream: dict):
+    env_name = conf['env_name']
+    if 'keyvault' in upstream:
+        sql_server_name = await inventory.find_sql_server(env_name)
+        keyvault_name = upstream['keyvault']['vaultName']
+        sql_pass = upstream['keyvault']['sql_pass']
+    else:
+        sql_server_name, keyvault_name = await asyncio.gather(inventory.find_sql_server(env_name),
+                                                              inventory.find_keyvault(env_name))
+        check_keyvault_found(conf, keyvault_name)
+        keyvault = Keyvault(conf['subscription_id'])
+        sql_pass = await keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
+    return build_sql_db_params(conf, sql_server_name, keyvault_name, sql_pass)
+
+async def __prepare_app_params(component: str, conf: dict, inventory: Inventory, upstream: dict):
+    env_name = conf['env_name']
+    if 'acr' in upstream:
+        acr_name = upstream['acr']['acr_name']
+    else:
+        acr_name = await inventory.find_acr(env_name)
+    keyvault_name = None
+    if component == 'back':
+        if 'keyvault' in upstream:
+            keyvault_name = upstream['keyvault']['vaultName']
+        else:
+            keyvault_name = await inventory.find_keyvault(env_name)
+    return build_app_params(component, conf, acr_name, keyvault_name)
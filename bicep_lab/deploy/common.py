@@ -8,21 +8,68 @@ core_deploy_files = {
 }
 
 apps_deploy_files = {
-    'db': 'db.bicep',
+    'db': 'sqldb.bicep',
     'app_container': 'appcontainer.bicep',
-    'front': 'front.bicep',
-    'back': 'back.bicep',
-    'scheduler': 'scheduler.bicep'
+    'front': 'frontendapp.bicep',
+    'back': 'backendapp.bicep',
+    'scheduler': 'scheduleapp.bicep'
 }
 
-core_parallel_groups = [
-    ['vnet', 'acr', 'sa', 'keyvault'],
-    ['role'],
-    ['dev_vm']
-]
+# 各コンポーネントがデプロイ開始前に完了を待つ必要があるコンポーネント
+# (今回のデプロイ対象に含まれない依存先はデプロイ済みとして扱う)
+component_dependencies = {
+    'vnet': [],
+    'role': [],
+    'keyvault': [],
+    'acr': ['role'],
+    'sa': ['role'],
+    'dev_vm': ['vnet', 'role'],
+    'db': ['keyvault'],
+    'app_container': [],
+    'scheduler': ['app_container', 'acr'],
+    'back': ['app_container', 'acr', 'keyvault', 'db', 'scheduler'],
+    'front': ['app_container', 'acr', 'back']
+}
+
+# パラメータ準備時に他コンポーネントの準備結果を使うコンポーネント
+# (例: db は同じ実行で keyvault に登録されるSQLパスワードを使う)
+prepare_dependencies = {
+    'db': ['keyvault'],
+    'scheduler': ['acr'],
+    'back': ['acr', 'keyvault'],
+    'front': ['acr']
+}
+
+# パラメータを準備できるコンポーネントと、準備するパラメータ
+# (起動時にテンプレートの param と照合する。テンプレートに無い名前や、既定値の無い param の不足はエラー)
+component_parameters = {
+    'vnet': ['vnet_name', 'vnet_address_prefix', 'dev_subnet_name', 'subnet_address_prefix'],
+    'role': ['location', 'vm_id_name', 'backend_id_name', 'frontend_id_name', 'schedule_id_name'],
+    'keyvault': ['vaultName', 'sql_pass', 'sql_secret_name'],
+    'acr': ['acr_name', 'vm_id_name'],
+    'sa': ['storage_account_name', 'dev_container_name', 'vm_id_name'],
+    'dev_vm': ['dev_vm_name', 'dev_vmss_name', 'vm_id_name', 'vm_nsg_name', 'admin_username', 'admin_password',
+               'use_ssh', 'vm_size', 'ubuntu_os_version', 'vnet_name', 'subnet_name', 'os_disk_type'],
+    'db': ['sql_name', 'sql_pass', 'db_name', 'admin_name'],
+    'app_container': ['env_name'],
+    'scheduler': ['env_name', 'acrName', 'ai_connection_string', 'imageTag'],
+    'back': ['env_name', 'acrName', 'vaultName', 'ai_connection_string', 'imageTag', 'app_name'],
+    'front': ['env_name', 'acrName', 'imageTag', 'app_name']
+}
+
+# コンテナアプリの名前 (scheduler はテンプレートの既定値 'schedule' を使い、back はその名前で参照する)
+app_names = {
+    'back': 'backend',
+    'front': 'frontend'
+}
+
+# 生成した名前 (ランダムな接尾辞付き) を持つコンポーネントと、その名前のパラメータ
+# (デプロイ後に状態ファイルへ記録し、次回以降はリソースグループを検索せずに使う)
+resource_name_params = {
+    'acr': 'acr_name',
+    'keyvault': 'vaultName',
+    'sa': 'storage_account_name',
+    'db': 'sql_name'
+}
 
-apps_parallel_groups = [
-    ['db', 'app_container'],
-    ['back', 'scheduler'],
-    ['front']
-]
+default_max_workers = 4
@@ -1,72 +1,308 @@
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import ipaddress
+from concurrent.futures import Future
 from deploy.utils import log, context, files
-from deploy.resources import Bicep, Vnet, Acr, Keyvault, SqlDb, StorageAccount
-from deploy.common import core_deploy_files, apps_deploy_files, core_parallel_groups, apps_parallel_groups
+from deploy.utils import fingerprint, trace, ratelimit, secrets
+from deploy.utils.state import StateStore, get_state_dir
+from deploy.utils.template_cache import TemplateCache, get_template_cache_dir
+from deploy.utils.cidr_index import CidrIndex
+from deploy.resources import Bicep, Vnet, Keyvault, StorageAccount, Inventory
+from deploy.common import (core_deploy_files, apps_deploy_files, component_dependencies, prepare_dependencies,
+                           component_parameters, resource_name_params, app_names, default_max_workers)
+from deploy import scheduler
 
-def run_deployment(conf: dict, sorted_components: list):
+def run_deployment(conf: dict, sorted_components: list, force: bool = False, limits=None, prepared: dict = None,
+                   batch: bool = False) -> dict:
+    """
+    Deploys the components of one environment.
+
+    Args:
+        conf (dict): Configuration of the environment
+        sorted_components (list): Components to deploy
+        force (bool): Deploy the components even if they are unchanged.
+        limits (ConcurrencyLimits): Deployment slots shared with other environments (see deploy.fanout).
+        prepared (dict): Parameters already prepared by prepare_all (e.g. during the preflight).
+            Prepared here if omitted.
+        batch (bool): Deploy the changed components as nested deployments of one composite deployment,
+            ordered by ARM (see Bicep.submit_batch), instead of one deployment per component.
+
+    Returns:
+        dict: Component name -> {'status', 'result', 'error'}
+    """
+    with trace.span(conf['env_name'], 'run'):
+        return __run_deployment(conf, sorted_components, force, limits, prepared, batch)
+
+def __run_deployment(conf: dict, sorted_components: list, force: bool, limits, prepared: dict, batch: bool) -> dict:
     bicep_dir_path = os.path.join(conf['RootPath'], 'bicep')
     tmp_dir_path = os.path.join(conf['RootPath'], 'tmp')
-    parallel_groups = core_parallel_groups + apps_parallel_groups
-    bicep = Bicep(conf['subscription_id'])
+    template_cache = TemplateCache(get_template_cache_dir(conf))
+    bicep = Bicep(conf['subscription_id'], tmp_dir_path, conf.get('deploy_engine', 'sdk'), template_cache)
+    state = StateStore(get_state_dir(conf), conf['subscription_id'], conf['env_name'])
+    inventory = Inventory(conf['subscription_id'], context.get_main_rg_name(conf['env_name']),
+                          state=state, ttl=conf.get('state_ttl'))
+    files.remove_stale_params_files(tmp_dir_path)
+    if prepared is None:
+        prepared = prepare_all(conf, sorted_components, inventory)
+
+    rg_name = context.get_main_rg_name(conf['env_name'])
 
-    def deploy_component(component: str, template_path: str):
+    def check_component(component: str):
         """
-        Deploys a component using the provided Bicep template.
+        Compiles the template of a component and compares its fingerprint with the last deployment.
 
         Args:
             component (str): Component name.
-            template_path (str): Path to the Bicep template file.
+
+        Returns:
+            dict: {'name', 'template_path', 'params', 'fingerprint'} of the deployment, or None if it is unchanged.
         """
-        deploy_name = context.get_deployment_name(conf['env_name'], component)
-        rg_name = context.get_main_rg_name(conf['env_name'])
-        params = __prepare_params(component, rg_name, conf)
-        formatted_params = format_parameters_for_bicep(params)
-        params_file_path = files.write_params_to_tempfile(tmp_dir_path, formatted_params)
-        if bicep.deploy(deploy_name=deploy_name, template_file_path=template_path,
-                     rg_name=rg_name, params_file_path =params_file_path ):
-            log.info(f"Successfully deployed component: {component}")
-
-    for group in parallel_groups:
-        common_components = list(set(group) & set(sorted_components))
-        if not common_components:
-            continue
-
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for component in common_components:
-                template_file_name = core_deploy_files.get(component) or apps_deploy_files.get(component)
-                template_file_path = os.path.join(bicep_dir_path, template_file_name)
-
-                log.info(f"Deploying component: {component}")
-                futures.append(executor.submit(deploy_component, component, template_file_path))
-            
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    log.error(f"Error deploying component: {component}")
-                    log.error(e)
-
-def __prepare_params(component: str, rg_name: str, conf: dict):
+        template_path = get_template_path(bicep_dir_path, component)
+        with trace.span('compile'):
+            template = bicep.build_template(template_path)
+        deployment = get_deployment(conf, component, template_path, template, prepared[component],
+                                    state.get_key())
+        tags = None
+        if needs_deployment_tags(bicep, state, component, force):
+            tags = bicep.get_deployment_tags(rg_name, deployment['name'])
+        if not force and is_unchanged(state, component, deployment, tags):
+            log.info(f"Skipping unchanged component: {component}")
+            if component == 'sa':
+                __sync_vm_conf(conf, prepared[component])
+            return None
+        return deployment
+
+    def on_deployed(component: str, deployment: dict, result: dict):
+        record_deployment(state, inventory, component, prepared[component], deployment, result)
+        log.info(f"Successfully deployed component: {component} ({result['status']})")
+        if component == 'sa':
+            __sync_vm_conf(conf, prepared[component])
+        return result
+
+    def deploy_component(component: str):
+        """
+        Deploys a component using its Bicep template.
+
+        Args:
+            component (str): Component name.
+        """
+        log.info(f"Deploying component: {component}")
+        deployment = check_component(component)
+        if deployment is None:
+            return {'name': context.get_deployment_name(conf['env_name'], component), 'status': 'Unchanged',
+                    'outputs': {}}
+
+        # デプロイの枠は完了まで保持する
+        release = limits.hold(conf['subscription_id'], rg_name) if limits else None
+        with trace.span('submit'):
+            # 送信のみ行い、完了は OperationPoller が確認する (スレッドを占有しない)
+            # スロットリングや一時的なエラーで失敗したデプロイは待ってから再実行する
+            operation = ratelimit.retry_future(
+                lambda: bicep.submit(deploy_name=deployment['name'], template_file_path=deployment['template_path'],
+                                     rg_name=rg_name, params=deployment['params'],
+                                     tags={fingerprint.FINGERPRINT_TAG: deployment['fingerprint']}),
+                f"Deployment {deployment['name']}", conf['subscription_id'].lower())
+        if release:
+            operation.add_done_callback(lambda _: release())
+        return scheduler.Continuation(operation, lambda result: on_deployed(component, deployment, result))
+
+    max_workers = conf.get('max_workers') or default_max_workers
+    if not batch:
+        results = scheduler.run_dag(sorted_components, component_dependencies, deploy_component,
+                                    max_workers=max_workers, category='deploy')
+    else:
+        results = __run_batch(conf, sorted_components, bicep, rg_name, limits, check_component, on_deployed,
+                              max_workers)
+    for component in sorted_components:
+        log.info(f"{component}: {results[component]['status']}")
+    return results
+
+def __run_batch(conf: dict, sorted_components: list, bicep: Bicep, rg_name: str, limits, check_component,
+                on_deployed, max_workers: int) -> dict:
+    # 全コンポーネントのテンプレートを先に確認し、変更のあるものを一つのデプロイメントで送信する
+    checked = scheduler.run_dag(sorted_components, {}, check_component, max_workers=max_workers, category='compile')
+    failed = {component for component, result in checked.items() if result['status'] != scheduler.STATUS_SUCCEEDED}
+    # 確認に失敗したコンポーネントに依存するものは送信しない (run_dag でスキップされる)
+    blocked = set(failed)
+    while True:
+        dependents = {component for component in sorted_components if component not in blocked
+                      and any(dep in blocked for dep in component_dependencies.get(component, []))}
+        if not dependents:
+            break
+        blocked |= dependents
+    deployments = {component: checked[component]['result'] for component in sorted_components
+                   if component not in blocked and checked[component]['result'] is not None}
+
+    settled = None
+    if deployments:
+        batch_name = context.get_deployment_name(conf['env_name'], 'batch')
+        log.info(f"Deploying components as one deployment {batch_name}: {', '.join(deployments)}")
+        # 依存先が今回のバッチに含まれない場合はデプロイ済みとして扱う
+        nested = [{'name': deployment['name'], 'template_file_path': deployment['template_path'],
+                   'params': deployment['params'], 'tags': {fingerprint.FINGERPRINT_TAG: deployment['fingerprint']},
+                   'depends_on': [deployments[dep]['name'] for dep in component_dependencies.get(component, [])
+                                  if dep in deployments]}
+                  for component, deployment in deployments.items()]
+
+        def submit_batch(_):
+            release = limits.hold(conf['subscription_id'], rg_name) if limits else None
+            with trace.span('submit'):
+                operation = ratelimit.retry_future(lambda: bicep.submit_batch(batch_name, rg_name, nested),
+                                                   f"Deployment {batch_name}", conf['subscription_id'].lower())
+            if release:
+                operation.add_done_callback(lambda _: release())
+            # 入れ子の結果の取得は ARM を呼び出すため、完了後にワーカーで行う (ポーリングのスレッドでは行わない)
+            return scheduler.Continuation(__outcome(operation),
+                                          lambda error: bicep.settle_batch(rg_name, batch_name, nested, error))
+
+        settled = scheduler.run_dag([batch_name], {}, submit_batch, max_workers=1, category='deploy')[batch_name]
+
+    def finish_component(component: str):
+        if component in failed:
+            raise checked[component]['error']
+        deployment = checked[component]['result']
+        if deployment is None:
+            return {'name': context.get_deployment_name(conf['env_name'], component), 'status': 'Unchanged',
+                    'outputs': {}}
+        if settled['status'] != scheduler.STATUS_SUCCEEDED:
+            raise settled['error']
+        # 各コンポーネントの入れ子のデプロイメントの結果を反映する
+        return scheduler.Continuation(settled['result'][deployment['name']],
+                                      lambda result: on_deployed(component, deployment, result))
+
+    return scheduler.run_dag(sorted_components, component_dependencies, finish_component,
+                             max_workers=max_workers, category='deploy')
+
+def __outcome(future: Future) -> Future:
+    # 失敗した場合も完了とし、例外 (成功時は None) を結果とする
+    outcome = Future()
+    outcome.set_running_or_notify_cancel()
+    future.add_done_callback(lambda done: outcome.set_result(done.exception()))
+    return outcome
+
+def prepare_all(conf: dict, components: list, inventory: Inventory) -> dict:
+    """
+    Resolves the parameters of every component in parallel before any deployment starts.
+
+    A component listed in prepare_dependencies is prepared after the components it uses,
+    and receives their parameters instead of looking the values up again.
+
+    Returns:
+        dict: Component name -> parameters
+
+    Raises:
+        ValueError: If the parameters of any component could not be prepared. All failures are reported together.
+    """
+    rg_name = context.get_main_rg_name(conf['env_name'])
+    prepared = {}
+
+    def prepare(component: str):
+        upstream = {dep: prepared[dep] for dep in prepare_dependencies.get(component, []) if dep in prepared}
+        params = __prepare_params(component, rg_name, conf, inventory, upstream)
+        prepared[component] = check_prepared_params(component, params)
+
+    results = scheduler.run_dag(components, prepare_dependencies, prepare, max_workers=max(len(components), 1),
+                                category='prepare')
+    failures = [f"{component}: {result['error'] or result['status']}"
+                for component, result in results.items() if result['status'] != scheduler.STATUS_SUCCEEDED]
+    if failures:
+        log.error("Failed to prepare the parameters of the components:")
+        for failure in failures:
+            log.error(f"  {failure}")
+        # 記録した名前が古い可能性があるため、次回はリソースグループを検索し直す
+        for component in resource_name_params:
+            inventory.forget(component)
+        raise ValueError(f"Failed to prepare the parameters of {len(failures)} component(s): {'; '.join(failures)}")
+    return prepared
+
+def check_prepared_params(component: str, params: dict) -> dict:
+    """
+    Checks that the prepared parameters are the ones registered in component_parameters
+    (which are checked against the templates at startup), and returns them.
+    """
+    expected = set(component_parameters.get(component, []))
+    if set(params) != expected:
+        raise ValueError(f"Prepared parameters of {component} do not match component_parameters: "
+                         f"missing {sorted(expected - set(params))}, unexpected {sorted(set(params) - expected)}")
+    return params
+
+def get_template_path(bicep_dir_path: str, component: str) -> str:
+    template_file_name = core_deploy_files.get(component) or apps_deploy_files.get(component)
+    return os.path.join(bicep_dir_path, template_file_name)
+
+def get_deployment(conf: dict, component: str, template_path: str, template: dict, params: dict,
+                   key: bytes) -> dict:
+    """
+    Describes the deployment of a component from its compiled template and prepared parameters.
+    The secure parameters are hashed into the fingerprint with the environment key (StateStore.get_key).
+
+    Returns:
+        dict: {'name', 'template_path', 'params' (formatted for Bicep), 'fingerprint'}
+    """
+    formatted_params = format_parameters_for_bicep(params)
+    return {'name': context.get_deployment_name(conf['env_name'], component), 'template_path': template_path,
+            'params': formatted_params, 'fingerprint': fingerprint.compute(template, formatted_params, key)}
+
+def needs_deployment_tags(bicep, state: StateStore, component: str, force: bool) -> bool:
+    """
+    Returns True if the fingerprint of the last deployment has to be read from the deployment tags
+    (the local state file has none). Only the SDK engine can read the tags.
+    """
+    return not force and bicep.engine == 'sdk' and state.get('fingerprints', component) is None
+
+def is_unchanged(state: StateStore, component: str, deployment: dict, tags: dict = None) -> bool:
+    """
+    Compares the fingerprint of a deployment with the last one of the component.
+
+    Args:
+        state (StateStore): Local state of the environment
+        component (str): Component name
+        deployment (dict): Deployment returned by get_deployment
+        tags (dict): Tags of the last deployment, read when needs_deployment_tags is True
+    """
+    # ローカルの状態ファイルを優先し、無い場合はデプロイメントのタグを確認する
+    stored = state.get('fingerprints', component)
+    if stored is None and tags:
+        stored = tags.get(fingerprint.FINGERPRINT_TAG)
+    return stored == deployment['fingerprint']
+
+def record_deployment(state: StateStore, inventory, component: str, params: dict, deployment: dict, result: dict):
+    """
+    Records a successful deployment: fingerprint and outputs in the state file, the created resource names
+    in the inventory, and the SQL password registered in the Key Vault in the secret cache.
+    """
+    state.set('fingerprints', component, deployment['fingerprint'])
+    state.put('outputs', component, result['outputs'])
+    # デプロイで作成されたリソースを以降の検索に反映する
+    inventory.invalidate()
+    if component in resource_name_params:
+        inventory.remember(component, params[resource_name_params[component]])
+    if component == 'keyvault':
+        # デプロイで登録したパスワードを以降の参照に使う
+        secrets.cache.put(params['vaultName'], params['sql_secret_name'], params['sql_pass'])
+
+def __prepare_params(component: str, rg_name: str, conf: dict, inventory: Inventory, upstream: dict):
     if component == 'role':
-        return __prepare_role_params(conf)
+        return prepare_role_params(conf)
     elif component == 'sa':
-        return __prepare_sa_params(conf)
+        return build_sa_params(conf, inventory.find_storage_account(conf['env_name']))
     elif component == 'vnet':
         return __prepare_vnet_params(rg_name, conf)
     elif component == 'acr':
-        return __prepare_acr_params(rg_name, conf) 
+        return build_acr_params(conf, inventory.find_acr(conf['env_name']))
     elif component == 'keyvault':
-        return __prepare_keyvault_params(rg_name, conf)
+        return __prepare_keyvault_params(conf, inventory)
     elif component == 'dev_vm':
-        return __prepare_dev_vmss_params(conf)
+        return prepare_dev_vmss_params(conf)
     elif component == 'db':
-        return __prepare_sql_db_params(rg_name, conf)
+        return __prepare_sql_db_params(conf, inventory, upstream)
+    elif component == 'app_container':
+        return prepare_app_container_params(conf)
+    elif component in ('scheduler', 'back', 'front'):
+        return __prepare_app_params(component, conf, inventory, upstream)
     else:
         raise ValueError(f"Invalid component: {component}") 
 
-def __prepare_role_params(conf: dict):
+def prepare_role_params(conf: dict):
     env_name = conf['env_name']
     params = {}
     params['location'] = conf['location']
@@ -77,12 +313,13 @@ def __prepare_role_params(conf: dict):
 
     return params
 
-def __prepare_sa_params(conf: dict):
+def build_sa_params(conf: dict, sa_name: str):
+    """
+    Args:
+        sa_name (str): Existing storage account of the environment, or '' to create one.
+    """
     env_name = conf['env_name']
-    rg_name = context.get_main_rg_name(env_name)
     params = {}
-    sa = StorageAccount(conf['subscription_id'])
-    sa_name = sa.find_storage_account_by_prefix(rg_name, env_name)
     if sa_name:
         params['storage_account_name'] = sa_name
     else:
@@ -94,29 +331,71 @@ def __prepare_sa_params(conf: dict):
     return params
 
 def __prepare_vnet_params(rg_name: str, conf: dict):
+    vnet = Vnet(conf['subscription_id'])
+    env_name = conf['env_name']
+    vnet_name = context.get_vnet_name(env_name)
+    existing_vnet = vnet.get_vnet_by_name(rg_name, vnet_name)
+    if existing_vnet:
+        return build_vnet_params(conf, vnet.get_cidr_index(), existing_vnet.id,
+                                 subnet_index=vnet.get_subnet_cidr_index(vnet_name, rg_name))
+    return build_vnet_params(conf, vnet.get_cidr_index())
+
+def build_vnet_params(conf: dict, vnet_index: CidrIndex, vnet_id: str = None, subnet_index: CidrIndex = None):
+    """
+    Checks the CIDRs of the configuration and returns the VNet parameters.
+
+    Args:
+        vnet_index (CidrIndex): Address spaces of the VNets in the subscription
+        vnet_id (str): Resource ID of the VNet of the environment (None if it does not exist)
+        subnet_index (CidrIndex): Subnets of the VNet (needed if the VNet exists)
+
+    Raises:
+        ValueError: If a CIDR overlaps another VNet or subnet, or the subnet is outside the VNet.
+    """
     env_name = conf['env_name']
     vnet_cidr = conf['vnet_cidr']
     dev_subnet_cidr = conf['dev_subnet_cidr']
-    vnet = Vnet(conf['subscription_id'])
     vnet_name = context.get_vnet_name(env_name)
-    vnet_exists = vnet.get_vnet_by_name(rg_name, vnet_name)
-    cidr_available = vnet.check_vnet_cidr_availability(vnet_cidr)
-    if not ( vnet_exists or cidr_available):
-        raise ValueError(f"Vnet does not exist, but VNet CIDR {vnet_cidr} is already in use.")
+    dev_subnet_name = context.get_dev_subnet_name(env_name)
+    # 既存の VNet のアドレス空間を変更する場合も他の VNet と重ならないか確認する (自身は除く)
+    conflicts = vnet_index.overlaps(vnet_cidr, exclude_owner=vnet_id)
+    for network, other_vnet_id in conflicts:
+        log.info(f"CIDR {vnet_cidr} overlaps {network} of {other_vnet_id}")
+    if conflicts:
+        suggestion = vnet_index.next_free(__get_prefixlen(vnet_cidr), exclude_owner=vnet_id)
+        existence = f"Vnet {vnet_name} exists" if vnet_id else "Vnet does not exist"
+        raise ValueError(f"{existence}, but VNet CIDR {vnet_cidr} overlaps another VNet. "
+                         f"Next free block: {suggestion or 'none'}")
+    if not Vnet.is_subnet_of(dev_subnet_cidr, vnet_cidr):
+        raise ValueError(f"Dev subnet CIDR {dev_subnet_cidr} is not inside VNet CIDR {vnet_cidr}.")
+    if vnet_id:
+        conflicts = subnet_index.overlaps(dev_subnet_cidr, exclude_owner=dev_subnet_name)
+        for network, subnet_name in conflicts:
+            log.info(f"CIDR {dev_subnet_cidr} overlaps {network} of subnet {subnet_name}")
+        if conflicts:
+            suggestion = subnet_index.next_free(__get_prefixlen(dev_subnet_cidr), vnet_cidr,
+                                                exclude_owner=dev_subnet_name)
+            raise ValueError(f"Dev subnet CIDR {dev_subnet_cidr} overlaps another subnet of {vnet_name}. "
+                             f"Next free block: {suggestion or 'none'}")
     
     params = {}
-    params['vnet_name'] = context.get_vnet_name(env_name)
-    params['vnet_cidr'] = vnet_cidr
-    params['dev_subnet_name'] = context.get_dev_subnet_name(env_name)
-    params['dev_subnet_cidr'] = dev_subnet_cidr
+    params['vnet_name'] = vnet_name
+    params['vnet_address_prefix'] = vnet_cidr
+    params['dev_subnet_name'] = dev_subnet_name
+    params['subnet_address_prefix'] = dev_subnet_cidr
     
     return params
 
-def __prepare_acr_params(rg_name: str, conf: dict):
+def __get_prefixlen(cidr: str) -> int:
+    return ipaddress.ip_network(cidr, strict=False).prefixlen
+
+def build_acr_params(conf: dict, acr_name: str):
+    """
+    Args:
+        acr_name (str): Existing container registry of the environment, or '' to create one.
+    """
     env_name = conf['env_name']
     params = {}
-    acr = Acr(conf['subscription_id'])
-    acr_name = acr.find_acr_by_prefix(rg_name, env_name)
     if acr_name:
         params['acr_name'] = acr_name
     else:
@@ -125,27 +404,40 @@ def __prepare_acr_params(rg_name: str, conf: dict):
     
     return params
 
-def __prepare_keyvault_params(rg_name: str, conf: dict):
+def __prepare_keyvault_params(conf: dict, inventory: Inventory):
+    env_name = conf['env_name']
+    keyvault_name = inventory.find_keyvault(env_name)
+    sql_pass = None
+    if keyvault_name:
+        keyvault = Keyvault(conf['subscription_id'])
+        sql_pass = keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
+    return build_keyvault_params(conf, keyvault_name, sql_pass)
+
+def build_keyvault_params(conf: dict, keyvault_name: str, sql_pass: str):
+    """
+    Args:
+        keyvault_name (str): Existing Key Vault of the environment, or '' to create one.
+        sql_pass (str): SQL password stored in the existing Key Vault. Generated for a new Key Vault.
+    """
     params = {}
     env_name = conf['env_name']
-    keyvault = Keyvault(conf['subscription_id'])
-    keyvault_name = keyvault.find_keyvault_by_prefix(rg_name, env_name)
     if keyvault_name:
-        params['keyvault_name'] = keyvault_name
-        params['sql_pass'] = keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
+        params['vaultName'] = keyvault_name
+        params['sql_pass'] = sql_pass
     else:
-        params['keyvault_name'] = context.get_unique_keyvault_name(env_name)
-        params['sql_pass'] = keyvault.generate_password()
+        params['vaultName'] = context.get_unique_keyvault_name(env_name)
+        params['sql_pass'] = Keyvault.generate_password()
     params['sql_secret_name'] = context.get_sql_secret_name(env_name)
     
     return params
 
-def __prepare_dev_vmss_params(conf: dict):
+def prepare_dev_vmss_params(conf: dict):
     params = {}
     env_name = conf['env_name']
     params['dev_vm_name'] = context.get_dev_vm_name(env_name)
     params['dev_vmss_name'] = context.get_dev_vmss_name(env_name)
     params['vm_id_name'] = context.get_vm_id_name(env_name)
+    params['vm_nsg_name'] = context.get_dev_vm_nsg_name(env_name)
     params['admin_username'] = conf['AdminUsername']
     params['admin_password'] = conf['AdminPassword']
     params['use_ssh'] = True if conf['UseSsh'].lower() == 'true' else False
@@ -157,57 +449,129 @@ def __prepare_dev_vmss_params(conf: dict):
     
     return params
 
-def __prepare_sql_db_params(rg_name: str, conf: dict):
-    params = {}
+def __prepare_sql_db_params(conf: dict, inventory: Inventory, upstream: dict):
     env_name = conf['env_name']
-    rg_name = context.get_main_rg_name(env_name)
-    sql_db = SqlDb(conf['subscription_id'])
-    keyvault = Keyvault(conf['subscription_id'])
+    sql_server_name = inventory.find_sql_server(env_name)
+    if 'keyvault' in upstream:
+        # 同じ実行でデプロイされる Key Vault のパスワードを使う
+        keyvault_name = upstream['keyvault']['vaultName']
+        sql_pass = upstream['keyvault']['sql_pass']
+    else:
+        keyvault_name = check_keyvault_found(conf, inventory.find_keyvault(env_name))
+        keyvault = Keyvault(conf['subscription_id'])
+        sql_pass = keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
+    return build_sql_db_params(conf, sql_server_name, keyvault_name, sql_pass)
 
-    sql_db_name  = sql_db.find_sql_db_by_prefix(rg_name, env_name)
-    if sql_db_name:
-        params['sql_db_name'] = sql_db_name
+def check_keyvault_found(conf: dict, keyvault_name: str) -> str:
+    """
+    Returns the Key Vault name found by the inventory.
+
+    Raises:
+        ValueError: If the environment has no Key Vault (the SQL password cannot be read).
+    """
+    # 空の名前で SecretClient を作ると存在しない URL への再試行が続くため、先に止める
+    if not keyvault_name:
+        raise ValueError(f"Key Vault of {conf['env_name']} not found, so the SQL password cannot be read. "
+                         f"Deploy keyvault before db.")
+    return keyvault_name
+
+def build_sql_db_params(conf: dict, sql_server_name: str, keyvault_name: str, sql_pass: str):
+    """
+    Args:
+        sql_server_name (str): Existing SQL server of the environment, or '' to create one.
+        keyvault_name (str): Key Vault the password was read from (for the error message)
+        sql_pass (str): SQL password of the Key Vault
+
+    Raises:
+        ValueError: If the password was not found.
+    """
+    params = {}
+    env_name = conf['env_name']
+    if sql_server_name:
+        params['sql_name'] = sql_server_name
     else:
-        params['sql_db_name'] = context.get_unique_sql_server_name(env_name)
+        params['sql_name'] = context.get_unique_sql_server_name(env_name)
 
-    keyvault_name = keyvault.find_keyvault_by_prefix(rg_name, env_name)
-    sql_pass = keyvault.get_sql_password_from_keyvault(keyvault_name, context.get_sql_secret_name(env_name))
     if not sql_pass:
         raise ValueError(f"SQL password not found in Key Vault {keyvault_name}")
     params['sql_pass'] = sql_pass
     params['db_name'] = conf['DbName']
     params['admin_name'] = conf['DbRootName']
 
-def __prepare_app_container_params(rg_name: str, conf: dict):
+    return params
+
+def prepare_app_container_params(conf: dict):
     params = {}
+    params['env_name'] = context.get_apps_container_env_name(conf['env_name'])
+
+    return params
+
+def __prepare_app_params(component: str, conf: dict, inventory: Inventory, upstream: dict):
     env_name = conf['env_name']
-    acr = Acr(conf['subscription_id'])
-    acr_name = acr.find_acr_by_prefix(rg_name, env_name)
+    # 同じ実行でデプロイされる ACR / Key Vault の名前を使う
+    if 'acr' in upstream:
+        acr_name = upstream['acr']['acr_name']
+    else:
+        acr_name = inventory.find_acr(env_name)
+    keyvault_name = None
+    if component == 'back':
+        if 'keyvault' in upstream:
+            keyvault_name = upstream['keyvault']['vaultName']
+        else:
+            keyvault_name = inventory.find_keyvault(env_name)
+    return build_app_params(component, conf, acr_name, keyvault_name)
+
+def build_app_params(component: str, conf: dict, acr_name: str, keyvault_name: str = None):
+    """
+    Returns the parameters of a container app (scheduler, back or front).
+
+    Args:
+        component (str): Component name
+        acr_name (str): Container registry of the environment
+        keyvault_name (str): Key Vault of the environment (back only)
+
+    Raises:
+        ValueError: If the registry or the Key Vault does not exist, or the Application Insights
+            connection string is not configured.
+    """
     if not acr_name:
-        raise ValueError(f"ACR not found for the environment {env_name}")
-    params['acr_name'] = acr_name
-    params['dev_container_name'] = context.get_backend_id_name(env_name)
-    params['vm_id_name'] = context.get_vm_id_name(env_name)
-    params['app_container_env_name'] = context.get_apps_container_env_name(env_name)
+        raise ValueError(f"Container registry of {conf['env_name']} not found. Deploy acr before {component}.")
+    params = {}
+    params['env_name'] = context.get_apps_container_env_name(conf['env_name'])
+    params['acrName'] = acr_name
+    params['imageTag'] = conf['ImageTag']
+    if component in app_names:
+        params['app_name'] = app_names[component]
+    if component == 'back':
+        if not keyvault_name:
+            raise ValueError(f"Key Vault of {conf['env_name']} not found. Deploy keyvault before {component}.")
+        params['vaultName'] = keyvault_name
+    if component in ('scheduler', 'back'):
+        ai_connection_string = conf['AppInsightsConnectionString']
+        if not ai_connection_string:
+            raise ValueError(f"AppInsightsConnectionString is not set in config/config.yml (needed by {component}).")
+        log.add_secret(ai_connection_string)
+        params['ai_connection_string'] = ai_connection_string
 
     return params
 
 
-def __upload_vm_conf(conf: dict, params: dict):
+def __sync_vm_conf(conf: dict, params: dict):
     storage_account_name = params['storage_account_name']
     dev_container_name = params['dev_container_name']
-    vm_conf_dir_path = os.path.join(conf['RootPath'], 'vm_conf')
     sa = StorageAccount(conf['subscription_id'])
     try:
-        file_names = files.get_file_names(vm_conf_dir_path)
-        for file_name in file_names:
-            log.info(f"Uploading file {file_name} to the container {dev_container_name} in the storage account {storage_account_name}")
-            file_path = os.path.join(vm_conf_dir_path, file_name)
-            sa.upload_file_to_container(storage_account_name, dev_container_name, file_path)
+        result = sa.sync_directory(storage_account_name, dev_container_name, get_vm_conf_dir(conf),
+                                   delete=conf.get('vm_conf_delete_orphans', False))
+        log.info(f"Synchronized VM configuration files: {len(result['uploaded'])} uploaded, "
+                 f"{len(result['unchanged'])} unchanged, {len(result['deleted'])} deleted")
     except Exception as e:
         log.error(f"An error occurred while uploading the VM configuration files: {e}")
         raise e
 
+def get_vm_conf_dir(conf: dict) -> str:
+    return os.path.join(conf['RootPath'], 'deploy', 'vm_conf')
+
 def format_parameters_for_bicep(input_dict):
     """
     Azure Bicep CLI 用にパラメータを整形する関数
@@ -0,0 +1,182 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from deploy.utils import log, context
+from deploy.utils.cidr_index import CidrIndex
+from deploy import scheduler
+
+class ConcurrencyLimits():
+    """
+    Bounds the number of component deployments that run at the same time,
+    across all environments of a run.
+
+    A deployment holds one slot of its resource group, one of its subscription and
+    one of the global budget. A limit of None (or 0) means unlimited.
+
+    Args:
+        max_total (int): Global budget.
+        max_per_subscription (int): Limit per subscription.
+        max_per_resource_group (int): Limit per resource group.
+    """
+    def __init__(self, max_total: int = None, max_per_subscription: int = None, max_per_resource_group: int = None):
+        self._total = threading.BoundedSemaphore(max_total) if max_total else None
+        self._max_per_subscription = max_per_subscription
+        self._max_per_resource_group = max_per_resource_group
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._resource_groups = {}
+
+    @classmethod
+    def from_config(cls, conf: dict):
+        return cls(conf.get('max_concurrent_deployments'), conf.get('max_deployments_per_subscription'),
+                   conf.get('max_deployments_per_resource_group'))
+
+    @contextmanager
+    def acquire(self, subscription_id: str, rg_name: str):
+        """
+        Holds a deployment slot while the enclosed block runs.
+        """
+        release = self.hold(subscription_id, rg_name)
+        try:
+            yield
+        finally:
+            release()
+
+    def hold(self, subscription_id: str, rg_name: str):
+        """
+        Takes a deployment slot, blocking until one is free.
+
+        Returns:
+            callable: Releases the slot (e.g. when a submitted deployment completes).
+        """
+        # 狭い範囲から順に確保する (待っている間に全体の枠を占有しないように)
+        semaphores = [
+            self.__get_semaphore(self._resource_groups, (subscription_id, rg_name), self._max_per_resource_group),
+            self.__get_semaphore(self._subscriptions, subscription_id, self._max_per_subscription),
+            self._total
+        ]
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                if semaphore is not None:
+                    semaphore.acquire()
+                    acquired.append(semaphore)
+        except BaseException:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            raise
+
+        def release():
+            for semaphore in reversed(acquired):
+                semaphore.release()
+        return release
+
+    def __get_semaphore(self, semaphores: dict, key, limit: int):
+        if not limit:
+            return None
+        with self._lock:
+            if key not in semaphores:
+                semaphores[key] = threading.BoundedSemaphore(limit)
+            return semaphores[key]
+
+def get_environments(config: dict, env_names: str = None) -> list:
+    """
+    Expands the `environments` list of the configuration into one configuration per environment.
+
+    Each entry overrides the top-level values (env_name, subscription_id, vnet_cidr, ...).
+    Without an `environments` list, the top-level configuration is the only environment.
+
+    Args:
+        config (dict): Configuration read from config.yml
+        env_names (str): Comma separated environment names to select. All environments if omitted.
+
+    Returns:
+        list: Configurations, in the order of the config file
+
+    Raises:
+        ValueError: If an environment name is duplicated or unknown, or two environments
+            of a subscription use overlapping VNet CIDRs.
+    """
+    base = {key: value for key, value in config.items() if key != 'environments'}
+    environments = [{**base, **(environment or {})} for environment in (config.get('environments') or [{}])]
+
+    names = [environment['env_name'] for environment in environments]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        log.error(f"Duplicated environment names: {', '.join(duplicated)}")
+        raise ValueError(f"Duplicated environment names: {', '.join(duplicated)}")
+
+    if env_names:
+        selected = [name.strip() for name in env_names.split(',') if name.strip()]
+        unknown = [name for name in selected if name not in names]
+        if unknown:
+            log.error(f"Unknown environments: {', '.join(unknown)}")
+            raise ValueError(f"Unknown environments: {', '.join(unknown)}")
+        environments = [environment for environment in environments if environment['env_name'] in selected]
+
+    __check_vnet_cidrs(environments)
+    return environments
+
+def deploy_environments(environments: list, run, max_parallel: int = None) -> dict:
+    """
+    Deploys several environments at the same time.
+
+    Args:
+        environments (list): Configurations returned by get_environments
+        run (callable): Deploys one environment. Called with its configuration and returns
+            the results of scheduler.run_dag (component -> {'status', 'result', 'error'}).
+        max_parallel (int): Maximum number of environments deployed at the same time. All if omitted.
+
+    Returns:
+        dict: Environment name -> {'subscription_id', 'status', 'results', 'error', 'elapsed'}
+    """
+    summary = {}
+
+    def deploy_environment(conf: dict):
+        env_name = conf['env_name']
+        start = time.perf_counter()
+        try:
+            results = run(conf)
+            failed = any(result['status'] != scheduler.STATUS_SUCCEEDED for result in results.values())
+            entry = {'status': scheduler.STATUS_FAILED if failed else scheduler.STATUS_SUCCEEDED,
+                     'results': results, 'error': None}
+        except Exception as e:
+            log.error(f"Error deploying the environment {env_name}: {e}")
+            entry = {'status': scheduler.STATUS_FAILED, 'results': {}, 'error': e}
+        entry['subscription_id'] = conf['subscription_id']
+        entry['elapsed'] = time.perf_counter() - start
+        summary[env_name] = entry
+
+    with ThreadPoolExecutor(max_workers=max_parallel or max(len(environments), 1)) as executor:
+        list(executor.map(deploy_environment, environments))
+    return {conf['env_name']: summary[conf['env_name']] for conf in environments}
+
+def log_summary(summary: dict):
+    """
+    Logs one line per environment with the number of components in each state.
+    """
+    log.info("Environment summary:")
+    for env_name, entry in summary.items():
+        counts = {}
+        for result in entry['results'].values():
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        details = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+        if entry['error'] is not None:
+            details = f"{details}, error: {entry['error']}" if details else f"error: {entry['error']}"
+        log.info(f"  {env_name:<20} {entry['status']:<10} {entry['elapsed']:>8.1f}s  "
+                 f"rg={context.get_main_rg_name(env_name)} sub={entry['subscription_id']}  {details}")
+
+def __check_vnet_cidrs(environments: list):
+    # 同じサブスクリプションで同時に作成される VNet のアドレス空間が重ならないことを確認する
+    indexes = {}
+    for conf in environments:
+        if not conf.get('vnet_cidr'):
+            continue
+        index = indexes.setdefault(conf['subscription_id'], CidrIndex())
+        overlaps = index.overlaps(conf['vnet_cidr'])
+        if overlaps:
+            others = ', '.join(owner for _, owner in overlaps)
+            log.error(f"VNet CIDR {conf['vnet_cidr']} of {conf['env_name']} overlaps the environments: {others}")
+            raise ValueError(f"VNet CIDR {conf['vnet_cidr']} of {conf['env_name']} overlaps the environments: {others}")
+        index.add(conf['vnet_cidr'], conf['env_name'])
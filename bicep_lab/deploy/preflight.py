@@ -0,0 +1,175 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from deploy import resources
+from deploy.utils import log, context, trace, bicep_analyzer
+from deploy.utils.state import StateStore, get_state_dir
+from deploy.utils.template_cache import TemplateCache, get_template_cache_dir
+from deploy.common import core_deploy_files, apps_deploy_files, component_dependencies, component_parameters
+
+class Preflight():
+    """
+    Checks that run before anything is deployed, all at the same time.
+
+    The checks start when the object is created, so they run while the user reads the
+    confirmation prompt. For every environment the subscription is looked up (and must be
+    enabled); when components are given, the resource group is checked for application
+    components, the templates of the components are compiled, and the parameters of the
+    components are prepared (CIDR conflicts, missing ACR, missing SQL secret, ...).
+
+    Args:
+        environments (list): Configurations returned by fanout.get_environments
+        components (list): Components to deploy. Only the subscriptions are checked if omitted.
+    """
+    def __init__(self, environments: list, components: list = None):
+        self._environments = environments
+        self._components = components or []
+        self._subscriptions = {}
+        self._checks = {}
+        self._prepared = {}
+        templates = {core_deploy_files.get(component) or apps_deploy_files.get(component) for component in self._components}
+        max_workers = len({conf['subscription_id'] for conf in environments}) + len(templates)
+        if self._components:
+            max_workers += 2 * len(environments)
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='preflight')
+
+        for conf in environments:
+            if conf['subscription_id'] not in self._subscriptions:
+                self._subscriptions[conf['subscription_id']] = self.__submit(
+                    f"subscription {conf['subscription_id']}", self.__check_subscription, conf['subscription_id'])
+        if not self._components:
+            return
+        if environments:
+            template_cache = TemplateCache(get_template_cache_dir(environments[0]))
+            bicep_dir_path = os.path.join(environments[0]['RootPath'], 'bicep')
+            for template in sorted(templates):
+                self.__submit(f"template {template}", template_cache.get, os.path.join(bicep_dir_path, template))
+        for conf in environments:
+            if not any(component in core_deploy_files for component in self._components):
+                self.__submit(f"{conf['env_name']}: resource group", self.__check_resource_group, conf)
+            self._prepared[conf['env_name']] = self.__submit(f"{conf['env_name']}: parameters", self.__prepare, conf)
+
+    def get_subscription_info(self, subscription_id: str) -> dict:
+        """Waits for the lookup of the subscription and returns its information."""
+        return self._subscriptions[subscription_id].result()
+
+    def result(self) -> dict:
+        """
+        Waits for every check.
+
+        Returns:
+            dict: Environment name -> prepared parameters of the components (component -> parameters)
+
+        Raises:
+            ValueError: If any check failed. All failures are reported together.
+        """
+        failures = []
+        for name, future in self._checks.items():
+            try:
+                future.result()
+            except Exception as e:
+                failures.append(f"{name}: {e}")
+        self._executor.shutdown()
+        if failures:
+            log.error("Preflight checks failed:")
+            for failure in failures:
+                log.error(f"  {failure}")
+            raise ValueError(f"{len(failures)} preflight check(s) failed: {'; '.join(failures)}")
+        return {env_name: future.result() for env_name, future in self._prepared.items()}
+
+    def cancel(self):
+        """Stops the checks that have not started (e.g. when the user cancels)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __submit(self, name: str, func, *args):
+        def check():
+            with trace.span(name, 'preflight'):
+                return func(*args)
+        future = self._executor.submit(check)
+        self._checks[name] = future
+        return future
+
+    @staticmethod
+    def __check_subscription(subscription_id: str) -> dict:
+        info = resources.Subscription(subscription_id).get_subscription_info()
+        # state は SubscriptionState (文字列の列挙型)
+        state = getattr(info['state'], 'value', info['state'])
+        if state and str(state).lower() != 'enabled':
+            raise ValueError(f"Subscription {subscription_id} is {state}")
+        return info
+
+    @staticmethod
+    def __check_resource_group(conf: dict):
+        rg_name = context.get_main_rg_name(conf['env_name'])
+        if not resources.ResourceGroup(conf['subscription_id']).check_resource_group_exists(rg_name):
+            raise ValueError(f"Before deploying the application components, the resource group {rg_name} must exist.")
+
+    def __prepare(self, conf: dict) -> dict:
+        import deploy.deployment_manager as deployment_manager
+        state = StateStore(get_state_dir(conf), conf['subscription_id'], conf['env_name'])
+        inventory = resources.Inventory(conf['subscription_id'], context.get_main_rg_name(conf['env_name']),
+                                        state=state, ttl=conf.get('state_ttl'))
+        return deployment_manager.prepare_all(conf, self._components, inventory)
+
+def check_templates(bicep_dir_path: str, components: list) -> dict:
+    """
+    Checks the component registry (deploy.common) against the Bicep templates, without any cloud call.
+
+    For every registered component, the template and its modules must exist, the components whose
+    resources the template references with `existing` must be in component_dependencies, and the
+    parameters in component_parameters must be declared by the template and include every parameter
+    without a default value. The components to deploy must have their parameters in component_parameters.
+    Dependencies the templates do not show (e.g. db waits for the Key Vault holding its password) are allowed.
+    Problems of components that are not deployed are only logged as warnings.
+
+    Args:
+        bicep_dir_path (str): Directory of the Bicep files.
+        components (list): Components to deploy.
+
+    Returns:
+        dict: Result of bicep_analyzer.analyze
+
+    Raises:
+        ValueError: If the registry does not match the templates of the components to deploy.
+            All problems are reported together.
+    """
+    analysis = bicep_analyzer.analyze(bicep_dir_path, {**core_deploy_files, **apps_deploy_files})
+    problems = []
+    for component, result in analysis.items():
+        template = os.path.basename(result['template'])
+        if result['errors']:
+            problems += [(component, error) for error in result['errors']]
+            continue
+        declared = set(component_dependencies.get(component, []))
+        missing = result['dependencies'] - declared
+        if missing:
+            problems.append((component, f"{template} references resources of {', '.join(sorted(missing))}, "
+                                        f"which are not in component_dependencies"))
+        if declared - result['dependencies']:
+            log.debug(f"{component}: waits for {', '.join(sorted(declared - result['dependencies']))} "
+                      f"without references in {template}")
+        for resource_type, name in result['unresolved']:
+            log.debug(f"{component}: existing {resource_type} {name} is not created by a single component")
+
+        if component not in component_parameters:
+            problems.append((component, "its parameters cannot be prepared (not in component_parameters)"))
+            continue
+        prepared = set(component_parameters[component])
+        unknown = prepared - set(result['params'])
+        if unknown:
+            problems.append((component, f"{template} has no parameter {', '.join(sorted(unknown))}"))
+        required = result['required'] - prepared
+        if required:
+            problems.append((component, f"required parameter {', '.join(sorted(required))} of {template} "
+                                        f"is not prepared"))
+    # 今回デプロイしないコンポーネントの不整合では停止しない
+    for component, problem in problems:
+        if component not in components:
+            log.warning(f"{component}: {problem}")
+    errors = [f"{component}: {problem}" for component, problem in problems if component in components]
+    if errors:
+        log.error("The components do not match the Bicep templates:")
+        for error in errors:
+            log.error(f"  {error}")
+        raise ValueError(f"The components do not match the Bicep templates ({len(errors)} problem(s)): "
+                         f"{'; '.join(errors)}")
+    return analysis
@@ -3,26 +3,52 @@
 # such as Bicep templates, Virtual Networks (VNet), Azure Container Registries (ACR),
 # Azure Key Vaults, and Azure SQL Databases.
 
-# Import Bicep class for managing Bicep template deployments
-from .bicep import Bicep
-
-# Import Vnet class for managing Virtual Networks
-from .vnet import Vnet
-
-# Import Acr class for managing Azure Container Registries
-from .acr import Acr
-
-# Import Keyvault class for managing Azure Key Vaults
-from .keyvault import Keyvault
-
-# Import SqlDb class for managing Azure SQL Databases
-from .sql_db import SqlDb
-
-# Import StorageAccount class for managing Azure Storage Accounts
-from .storage_account import StorageAccount
-
-# Import ResourceGroup class for managing Azure Resource Groups
-from .resource_group import ResourceGroup
-
-# Import Subscription class for managing Azure Subscriptions
-from .subscription import Subscription
\ No newline at end of file
+# The classes below are loaded on first use, so that importing this package does not
+# import every Azure management SDK (e.g. `--destroy` needs only ResourceGroup).
+import sys
+import importlib
+
+# 属性名 -> 定義しているモジュール
+__LAZY_ATTRIBUTES__ = {
+    # Bicep class for managing Bicep template deployments
+    'Bicep': '.bicep',
+    # Vnet class for managing Virtual Networks
+    'Vnet': '.vnet',
+    # Acr class for managing Azure Container Registries
+    'Acr': '.acr',
+    # Keyvault class for managing Azure Key Vaults
+    'Keyvault': '.keyvault',
+    # SqlDb class for managing Azure SQL Databases
+    'SqlDb': '.sql_db',
+    # StorageAccount class for managing Azure Storage Accounts
+    'StorageAccount': '.storage_account',
+    # ResourceGroup class for managing Azure Resource Groups
+    'ResourceGroup': '.resource_group',
+    # Subscription class for managing Azure Subscriptions
+    'Subscription': '.subscription',
+    # Inventory class for indexed lookups over a resource group snapshot
+    'Inventory': '.inventory',
+    # The process-wide registry of shared Azure SDK clients
+    'registry': '.clients'
+}
+
+__all__ = list(__LAZY_ATTRIBUTES__.keys())
+
+def __getattr__(name: str):
+    module_name = __LAZY_ATTRIBUTES__.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
+
+def close_registry():
+    """
+    Closes the shared Azure SDK clients. Does nothing if no client module was ever loaded.
+    """
+    clients = sys.modules.get(f"{__name__}.clients")
+    if clients is not None:
+        clients.registry.close()
@@ -9,7 +9,7 @@ class Acr(Base):
         self._set_clients()
     
     def _set_clients(self):
-        self._acr_client = ContainerRegistryManagementClient(self.credential, self.subscription_id)
+        self._acr_client = self._get_client(ContainerRegistryManagementClient)
 
     def find_acr_by_prefix(self, resource_group_name, env_name) -> str:
         prefix = context.get_acr_name_prefix(env_name)
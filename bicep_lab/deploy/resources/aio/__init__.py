@@ -0,0 +1,45 @@
+# This directory contains asyncio versions of the resource classes in deploy.resources.
+# They are built on the `aio` clients and credentials of the Azure SDK, so lookups,
+# secret reads, blob uploads and long-running operations can run concurrently on one thread.
+# Use them from a single event loop and call `await registry.close()` when the loop ends.
+
+# The classes below are loaded on first use, so that importing this package does not
+# import every Azure SDK aio module.
+import importlib
+
+# 属性名 -> 定義しているモジュール
+__LAZY_ATTRIBUTES__ = {
+    # Bicep class for managing Bicep template deployments
+    'Bicep': '.bicep',
+    # Vnet class for managing Virtual Networks
+    'Vnet': '.vnet',
+    # Acr class for managing Azure Container Registries
+    'Acr': '.acr',
+    # Keyvault class for managing Azure Key Vaults
+    'Keyvault': '.keyvault',
+    # SqlDb class for managing Azure SQL Databases
+    'SqlDb': '.sql_db',
+    # StorageAccount class for managing Azure Storage Accounts
+    'StorageAccount': '.storage_account',
+    # ResourceGroup class for managing Azure Resource Groups
+    'ResourceGroup': '.resource_group',
+    # Subscription class for managing Azure Subscriptions
+    'Subscription': '.subscription',
+    # Inventory class for indexed lookups over a resource group snapshot
+    'Inventory': '.inventory',
+    # The registry of shared async Azure SDK clients
+    'registry': '.clients'
+}
+
+__all__ = list(__LAZY_ATTRIBUTES__.keys())
+
+def __getattr__(name: str):
+    module_name = __LAZY_ATTRIBUTES__.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -0,0 +1,25 @@
+from azure.identity.aio import DefaultAzureCredential
+from .clients import registry
+
+class Base():
+    def __init__(self, subscription_id):
+        self._credential = registry.credential
+        self._subscription_id = subscription_id
+
+    def _set_clients(self):
+        '''OVERWRITE THIS METHOD IN CHILD CLASSES'''
+        pass
+
+    def _get_client(self, client_cls, scoped: bool = True):
+        return registry.get_client(client_cls, self.subscription_id, scoped=scoped)
+
+    def _get_data_client(self, client_cls, url: str, **client_kwargs):
+        return registry.get_data_client(client_cls, url, self.subscription_id, **client_kwargs)
+
+    @property
+    def credential(self) -> DefaultAzureCredential:
+        return self._credential
+    
+    @property
+    def subscription_id(self) -> str:
+        return self._subscription_id
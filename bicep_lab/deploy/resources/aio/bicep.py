@@ -0,0 +1,120 @@
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+from azure.mgmt.resource.resources.models import DeploymentMode
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from deploy.utils import log, files, process
+from deploy.utils.template_cache import TemplateCache, compile_bicep
+from deploy.resources.bicep import ENGINE_SDK, ENGINE_CLI, _flatten_outputs
+from .base import Base
+import asyncio
+import json
+import os
+import tempfile
+
+class Bicep(Base):
+    def __init__(self, subscription_id, tmp_dir_path: str = None, engine: str = ENGINE_SDK,
+                 template_cache: TemplateCache = None):
+        super().__init__(subscription_id)
+        if engine not in (ENGINE_SDK, ENGINE_CLI):
+            raise ValueError(f"Invalid deploy engine: {engine}")
+        self._tmp_dir_path = tmp_dir_path or tempfile.gettempdir()
+        self._engine = engine
+        self._template_cache = template_cache
+        self._templates = {}
+        self._set_clients()
+    
+    def _set_clients(self):
+        self._resource_client = self._get_client(ResourceManagementClient)
+
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    async def deploy(self, deploy_name: str, template_file_path: str, rg_name: str,
+                     params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
+        """
+        Deploys a Bicep template and waits for the deployment without blocking the event loop.
+
+        Returns:
+            dict: {'name': str, 'status': str, 'outputs': dict}
+        """
+        if mode not in ('incremental', 'complete'):
+            raise ValueError(f"Invalid deployment mode: {mode}")
+        if not os.path.isfile(template_file_path):
+            log.error(f"Template file not found: {template_file_path}")
+            raise FileNotFoundError(template_file_path)
+        try:
+            if self._engine == ENGINE_SDK:
+                return await self.deploy_template_with_sdk(deploy_name, template_file_path, rg_name, params, mode, tags)
+            with files.params_file(self._tmp_dir_path, params) as params_file_path:
+                return await self.deploy_bicep_with_params(deploy_name, template_file_path, rg_name, params_file_path, mode)
+        except Exception as e:
+            log.error(f"Error during deployment: {deploy_name}")
+            log.error(e)
+            raise e
+
+    async def build_template(self, template_file_path: str) -> dict:
+        """
+        Compiles a Bicep template in a worker thread. Concurrent callers share one compile.
+        """
+        key = os.path.abspath(template_file_path)
+        if key not in self._templates:
+            compiler = self._template_cache.get if self._template_cache else compile_bicep
+            self._templates[key] = asyncio.ensure_future(asyncio.to_thread(compiler, template_file_path))
+        try:
+            return await asyncio.shield(self._templates[key])
+        except Exception:
+            self._templates.pop(key, None)
+            raise
+
+    async def deploy_template_with_sdk(self, deploy_name: str, template_file_path: str, rg_name: str,
+                                       params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
+        template = await self.build_template(template_file_path)
+        deployment = {
+            'tags': tags or {},
+            'properties': {
+                'template': template,
+                'parameters': params,
+                'mode': DeploymentMode.INCREMENTAL if mode == 'incremental' else DeploymentMode.COMPLETE
+            }
+        }
+        poller = await self._resource_client.deployments.begin_create_or_update(rg_name, deploy_name, deployment)
+        result = await poller.result()
+        return {
+            'name': result.name,
+            'status': result.properties.provisioning_state,
+            'outputs': _flatten_outputs(result.properties.outputs)
+        }
+
+    async def get_deployment_tags(self, rg_name: str, deploy_name: str) -> dict:
+        try:
+            deployment = await self._resource_client.deployments.get(rg_name, deploy_name)
+        except ResourceNotFoundError:
+            return {}
+        except HttpResponseError as e:
+            log.error(f"An error occurred while getting the deployment {deploy_name}: {e}")
+            raise e
+        if deployment.properties.provisioning_state != 'Succeeded':
+            return {}
+        return deployment.tags or {}
+
+    @staticmethod
+    async def deploy_bicep_with_params(deploy_name, template_file, resource_group, params_file_path, mode='incremental') -> dict:
+        cmd = [
+            "az", "deployment", "group", "create",
+            "--name", deploy_name,
+            "--resource-group", resource_group,
+            "--template-file", template_file,
+            "--parameters", f"@{params_file_path}",
+            "--mode", mode.capitalize(),
+            "--output", "json"
+        ]
+        # stderr はログに流し、エラー内容 (スロットリング等の判定に使う) は例外に含める
+        completed = await process.run_async(cmd, name=f"az {deploy_name}")
+        stdout = completed.stdout
+        result = json.loads(stdout) if stdout.strip() else {}
+        properties = result.get('properties', {})
+        return {
+            'name': result.get('name', deploy_name),
+            'status': properties.get('provisioningState'),
+            'outputs': _flatten_outputs(properties.get('outputs'))
+        }
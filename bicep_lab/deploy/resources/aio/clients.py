@@ -0,0 +1,107 @@
+import random
+import aiohttp
+from azure.identity.aio import DefaultAzureCredential
+from azure.core.pipeline.policies import AsyncHTTPPolicy, AsyncRetryPolicy
+from azure.core.pipeline.transport import AioHttpTransport
+from deploy.utils import log, ratelimit
+from deploy.resources.clients import TracePolicy
+
+class RateLimitPolicy(AsyncHTTPPolicy):
+    """asyncio version of deploy.resources.clients.RateLimitPolicy."""
+    async def send(self, request):
+        key = ratelimit.get_key(request.http_request.url)
+        await ratelimit.limiter.wait_async(key)
+        response = await self.next.send(request)
+        ratelimit.limiter.observe(key, response.http_response.status_code, response.http_response.headers)
+        return response
+
+class JitterRetryPolicy(AsyncRetryPolicy):
+    """AsyncRetryPolicy whose exponential backoff uses full jitter."""
+    def get_backoff_time(self, settings):
+        backoff = random.uniform(0, super().get_backoff_time(settings))
+        ratelimit.limiter.record_retry(backoff)
+        return backoff
+
+class ClientRegistry():
+    """
+    Registry of async Azure SDK clients shared by every coroutine of a run.
+
+    All clients share one async DefaultAzureCredential, and the clients of a subscription
+    share one keep-alive aiohttp session. Clients must be created and used on the same
+    event loop; call `await registry.close()` before the loop ends.
+    """
+    POOL_MAXSIZE = 100
+
+    def __init__(self):
+        self._credential = None
+        self._sessions = {}
+        self._transports = {}
+        self._clients = {}
+
+    @property
+    def credential(self) -> DefaultAzureCredential:
+        if self._credential is None:
+            self._credential = DefaultAzureCredential()
+        return self._credential
+
+    def get_client(self, client_cls, subscription_id: str, scoped: bool = True):
+        """
+        Returns the shared async management client of the given class for the subscription.
+
+        Args:
+            client_cls (type): Async management client class (e.g. azure.mgmt.network.aio.NetworkManagementClient).
+            subscription_id (str): Subscription ID.
+            scoped (bool): False for clients that do not take a subscription ID (e.g. SubscriptionClient).
+        """
+        key = (client_cls, subscription_id)
+        if key not in self._clients:
+            args = [self.credential, subscription_id] if scoped else [self.credential]
+            self._clients[key] = client_cls(*args, transport=self._get_transport(subscription_id),
+                                            per_retry_policies=self._get_policies(),
+                                            retry_policy=self._get_retry_policy())
+        return self._clients[key]
+
+    def get_data_client(self, client_cls, url: str, subscription_id: str, **client_kwargs):
+        """
+        Returns the shared async data plane client (e.g. SecretClient, BlobServiceClient) for the URL.
+        """
+        key = (client_cls, url)
+        if key not in self._clients:
+            self._clients[key] = client_cls(url, self.credential, transport=self._get_transport(subscription_id),
+                                            per_retry_policies=self._get_policies(),
+                                            retry_policy=self._get_retry_policy(), **client_kwargs)
+        return self._clients[key]
+
+    async def close(self):
+        for client in self._clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                log.warning(f"An error occurred while closing the client: {e}")
+        for session in self._sessions.values():
+            await session.close()
+        if self._credential is not None:
+            await self._credential.close()
+        self._clients.clear()
+        self._transports.clear()
+        self._sessions.clear()
+        self._credential = None
+
+    @staticmethod
+    def _get_policies() -> list:
+        return [TracePolicy(), RateLimitPolicy()]
+
+    @staticmethod
+    def _get_retry_policy() -> JitterRetryPolicy:
+        limiter = ratelimit.limiter
+        return JitterRetryPolicy(retry_total=limiter.max_attempts - 1, retry_backoff_factor=limiter.base_delay / 2,
+                                 retry_backoff_max=limiter.max_delay)
+
+    def _get_transport(self, subscription_id: str) -> AioHttpTransport:
+        if subscription_id not in self._transports:
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.POOL_MAXSIZE))
+            self._sessions[subscription_id] = session
+            self._transports[subscription_id] = AioHttpTransport(session=session, session_owner=False)
+        return self._transports[subscription_id]
+
+registry = ClientRegistry()
@@ -0,0 +1,94 @@
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from deploy.utils import context, log
+from deploy.utils.state import StateStore
+from deploy.resources.inventory import (ACR_TYPE, KEYVAULT_TYPE, SQL_SERVER_TYPE, STORAGE_ACCOUNT_TYPE, NAMES_SECTION,
+                                        _get_known_name, _remember_name)
+from .base import Base
+import asyncio
+import bisect
+
+class Inventory(Base):
+    """
+    Async snapshot of the resources in one resource group.
+    Concurrent lookups share one listing of the resource group.
+    Names are remembered in the state store as in deploy.resources.Inventory.
+    """
+    def __init__(self, subscription_id, rg_name: str, state: StateStore = None, ttl: float = None):
+        super().__init__(subscription_id)
+        self._rg_name = rg_name
+        self._state = state
+        self._ttl = ttl
+        self._index = None
+        self._set_clients()
+
+    def _set_clients(self):
+        self._resource_client = self._get_client(ResourceManagementClient)
+
+    @property
+    def rg_name(self) -> str:
+        return self._rg_name
+
+    async def refresh(self):
+        """Lists the resource group and rebuilds the index."""
+        self._index = asyncio.ensure_future(self.__list_resources())
+        await self._index
+
+    def invalidate(self):
+        """Drops the snapshot. The next lookup lists the resource group again."""
+        self._index = None
+
+    async def __list_resources(self) -> dict:
+        index = {}
+        try:
+            async for resource in self._resource_client.resources.list_by_resource_group(self._rg_name):
+                index.setdefault(resource.type.lower(), []).append(resource.name)
+        except ResourceNotFoundError:
+            log.info(f"Resource group {self._rg_name} not found. The inventory is empty.")
+        except HttpResponseError as e:
+            log.error(f"An error occurred while listing the resource group {self._rg_name}: {e}")
+            raise e
+        for names in index.values():
+            names.sort()
+        return index
+
+    async def find_by_prefix(self, resource_type: str, prefix: str) -> str:
+        if self._index is None:
+            self._index = asyncio.ensure_future(self.__list_resources())
+        try:
+            index = await asyncio.shield(self._index)
+        except Exception:
+            self._index = None
+            raise
+        names = index.get(resource_type.lower(), [])
+        position = bisect.bisect_left(names, prefix)
+        if position < len(names) and names[position].startswith(prefix):
+            return names[position]
+        return ''
+
+    async def find_acr(self, env_name: str) -> str:
+        return await self.__find('acr', ACR_TYPE, context.get_acr_name_prefix(env_name))
+
+    async def find_keyvault(self, env_name: str) -> str:
+        return await self.__find('keyvault', KEYVAULT_TYPE, context.get_keyvault_name_prefix(env_name))
+
+    async def find_sql_server(self, env_name: str) -> str:
+        return await self.__find('db', SQL_SERVER_TYPE, context.get_sql_name_prefix(env_name))
+
+    async def find_storage_account(self, env_name: str) -> str:
+        return await self.__find('sa', STORAGE_ACCOUNT_TYPE, context.get_storage_account_name_prefix(env_name))
+
+    def remember(self, component: str, name: str):
+        _remember_name(self._state, component, name)
+
+    def forget(self, component: str):
+        if self._state is not None:
+            self._state.delete(NAMES_SECTION, component)
+
+    async def __find(self, component: str, resource_type: str, prefix: str) -> str:
+        name = _get_known_name(self._state, component, prefix, self._ttl)
+        if name:
+            return name
+        name = await self.find_by_prefix(resource_type, prefix)
+        _remember_name(self._state, component, name)
+        return name
@@ -0,0 +1,43 @@
+from azure.mgmt.keyvault.aio import KeyVaultManagementClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.keyvault.secrets.aio import SecretClient
+from .base import Base
+from deploy.utils import context, log
+from deploy.utils.secrets import cache, generate_password
+
+class Keyvault(Base):
+    def __init__(self, subscription_id):
+        super().__init__(subscription_id)
+        self._set_clients()
+    
+    def _set_clients(self):
+        self._keyvault_client = self._get_client(KeyVaultManagementClient)
+
+    async def find_keyvault_by_prefix(self, rg_name, env_name) -> str:
+        prefix = context.get_keyvault_name_prefix(env_name)
+        try:
+            async for keyvault in self._keyvault_client.vaults.list_by_resource_group(rg_name):
+                if keyvault.name.startswith(prefix):
+                    return keyvault.name
+            return ''
+        except HttpResponseError as e:
+            log.error(f"An error occurred while checking the Key Vault: {e}")
+            raise e
+
+    generate_password = staticmethod(generate_password)
+
+    async def get_sql_password_from_keyvault(self, vault_name: str, secret_name: str) -> str:
+        return await cache.get_async(vault_name, secret_name, lambda: self.__get_secret(vault_name, secret_name))
+
+    async def __get_secret(self, vault_name: str, secret_name: str) -> str:
+        vault_url = context.get_vault_url(vault_name)
+        client = self._get_data_client(SecretClient, vault_url)
+        try:
+            secret = await client.get_secret(secret_name)
+            return secret.value
+        except ResourceNotFoundError:
+            log.info(f"Secret {secret_name} not found in Key Vault {vault_name}")
+            return ''
+        except HttpResponseError as e:
+            log.error(f"An error occurred while retrieving the secret from Key Vault: {e}")
+            raise e
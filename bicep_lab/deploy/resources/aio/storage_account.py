@@ -0,0 +1,84 @@
+from azure.mgmt.storage.aio import StorageManagementClient
+from azure.core.exceptions import HttpResponseError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+from .base import Base
+from deploy.utils import context, log, files
+import asyncio
+import os
+
+class StorageAccount(Base):
+    def __init__(self, subscription_id):
+        super().__init__(subscription_id)
+        self._set_clients()
+    
+    def _set_clients(self):
+        self._storage_client = self._get_client(StorageManagementClient)
+
+    async def find_storage_account_by_prefix(self, resource_group_name, env_name) -> str:
+        prefix = context.get_storage_account_name_prefix(env_name)
+        try:
+            async for account in self._storage_client.storage_accounts.list_by_resource_group(resource_group_name):
+                if account.name.startswith(prefix):
+                    return account.name
+            return ''
+        except HttpResponseError as e:
+            log.error(f"An error occurred while checking the storage accounts: {e}")
+            raise
+    
+    async def upload_file_to_container(self, account_name, container_name, file_path) -> bool:
+        try:
+            account_url = context.get_storage_account_url(account_name)
+            blob_service_client = self._get_blob_service_client(account_url)
+            blob_name = os.path.basename(file_path)
+            blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+            with open(file_path, "rb") as data:
+                await blob_client.upload_blob(data)
+            return True
+        except Exception as e:
+            log.error(f"An error occurred while uploading the file to the container: {e}")
+            raise e
+
+    async def sync_directory(self, account_name: str, container_name: str, dir_path: str,
+                             delete: bool = False, max_concurrency: int = 8) -> dict:
+        """
+        asyncio version of deploy.resources.StorageAccount.sync_directory.
+        """
+        try:
+            account_url = context.get_storage_account_url(account_name)
+            container_client = self._get_blob_service_client(account_url).get_container_client(container_name)
+            remote_md5s = {}
+            async for blob in container_client.list_blobs():
+                remote_md5s[blob.name] = bytes(blob.content_settings.content_md5 or b'')
+            local_md5s = {}
+            for file_name in files.get_file_names(dir_path):
+                local_md5s[file_name] = await asyncio.to_thread(files.get_file_md5, os.path.join(dir_path, file_name))
+
+            changed, orphaned = files.diff_md5s(local_md5s, remote_md5s, delete)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def upload(file_name: str):
+                async with semaphore:
+                    log.info(f"Uploading file {file_name} to the container {container_name} in the storage account {account_name}")
+                    with open(os.path.join(dir_path, file_name), 'rb') as data:
+                        await container_client.upload_blob(file_name, data, overwrite=True, max_concurrency=4,
+                                                           content_settings=ContentSettings(content_md5=local_md5s[file_name]))
+
+            async def remove(blob_name: str):
+                async with semaphore:
+                    log.info(f"Deleting blob {blob_name} from the container {container_name} in the storage account {account_name}")
+                    await container_client.delete_blob(blob_name)
+
+            await asyncio.gather(*[upload(name) for name in changed], *[remove(name) for name in orphaned])
+            return {
+                'uploaded': changed,
+                'unchanged': [name for name in local_md5s if name not in changed],
+                'deleted': orphaned
+            }
+        except Exception as e:
+            log.error(f"An error occurred while synchronizing {dir_path} to the container: {e}")
+            raise e
+
+    def _get_blob_service_client(self, account_url: str) -> BlobServiceClient:
+        return self._get_data_client(BlobServiceClient, account_url,
+                                     max_single_put_size=files.BLOB_BLOCK_SIZE, max_block_size=files.BLOB_BLOCK_SIZE)
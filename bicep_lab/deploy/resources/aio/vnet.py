@@ -0,0 +1,108 @@
+from azure.mgmt.network.aio import NetworkManagementClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.mgmt.network.models import VirtualNetwork
+from .base import Base
+from deploy.utils import log
+from deploy.utils.cidr_index import CidrIndex, is_subnet_of
+import asyncio
+import time
+
+class Vnet(Base):
+    CIDR_INDEX_TTL_SECONDS = 300
+    _cidr_indexes = {}
+
+    def __init__(self, subscription_id):
+        super().__init__(subscription_id)
+        self._set_clients()
+    
+    def _set_clients(self):
+        self._network_client = self._get_client(NetworkManagementClient)
+    
+    async def get_vnet_by_name(self, rg_name: str, vnet_name: str) -> VirtualNetwork:
+        try:
+            return await self._network_client.virtual_networks.get(rg_name, vnet_name)
+        except ResourceNotFoundError:
+            return None
+        except HttpResponseError as e:
+            log.error(f"An error occurred while checking the VNet: {e}")
+            raise e
+
+    async def get_cidr_index(self, refresh: bool = False) -> CidrIndex:
+        """
+        Returns the index of every VNet address space in the subscription.
+        Concurrent callers share one listing, and the index is cached for CIDR_INDEX_TTL_SECONDS.
+        """
+        # タスクはイベントループに紐づくため、ループごとにキャッシュする
+        key = (self.subscription_id, asyncio.get_running_loop())
+        cached = Vnet._cidr_indexes.get(key)
+        if cached and not refresh:
+            created_at, task = cached
+            if not task.done() or time.monotonic() - created_at < self.CIDR_INDEX_TTL_SECONDS:
+                return await asyncio.shield(task)
+        task = asyncio.ensure_future(self.__list_cidrs())
+        Vnet._cidr_indexes[key] = (time.monotonic(), task)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            Vnet._cidr_indexes.pop(key, None)
+            raise
+
+    async def __list_cidrs(self) -> CidrIndex:
+        try:
+            index = CidrIndex()
+            async for vnet in self._network_client.virtual_networks.list_all():
+                for address_prefix in (vnet.address_space.address_prefixes if vnet.address_space else []):
+                    index.add(address_prefix, vnet.id)
+            return index
+        except Exception as e:
+            log.error(f"An error occurred while listing the VNets: {e}")
+            raise e
+
+    async def check_vnet_cidr_availability(self, cidr: str, exclude_vnet_id: str = None) -> bool:
+        index = await self.get_cidr_index()
+        conflicts = index.overlaps(cidr, exclude_owner=exclude_vnet_id)
+        for network, vnet_id in conflicts:
+            log.info(f"CIDR {cidr} overlaps {network} of {vnet_id}")
+        return not conflicts
+
+    async def suggest_vnet_cidr(self, prefixlen: int, within: str = '10.0.0.0/8', exclude_vnet_id: str = None) -> str:
+        index = await self.get_cidr_index()
+        return index.next_free(prefixlen, within, exclude_owner=exclude_vnet_id)
+
+    async def get_subnet_cidr_index(self, vnet_name: str, rg_name: str) -> CidrIndex:
+        try:
+            index = CidrIndex()
+            async for subnet in self._network_client.subnets.list(rg_name, vnet_name):
+                for address_prefix in (subnet.address_prefixes or [subnet.address_prefix]):
+                    if address_prefix:
+                        index.add(address_prefix, subnet.name)
+            return index
+        except Exception as e:
+            log.error(f"An error occurred while listing the subnets: {e}")
+            raise e
+
+    async def check_subnet_cidr_availability(self, vnet_name: str, rg_name: str, cidr: str,
+                                             exclude_subnet_name: str = None) -> bool:
+        index = await self.get_subnet_cidr_index(vnet_name, rg_name)
+        conflicts = index.overlaps(cidr, exclude_owner=exclude_subnet_name)
+        for network, subnet_name in conflicts:
+            log.info(f"CIDR {cidr} overlaps {network} of subnet {subnet_name}")
+        return not conflicts
+
+    async def suggest_subnet_cidr(self, vnet_name: str, rg_name: str, prefixlen: int, within: str,
+                                  exclude_subnet_name: str = None) -> str:
+        index = await self.get_subnet_cidr_index(vnet_name, rg_name)
+        return index.next_free(prefixlen, within, exclude_owner=exclude_subnet_name)
+
+    is_subnet_of = staticmethod(is_subnet_of)
+
+    async def delete_vnet(self, rg_name: str, vnet_name: str) -> bool:
+        try:
+            delete_async_operation = await self._network_client.virtual_networks.begin_delete(rg_name, vnet_name)
+            await delete_async_operation.wait()
+            return True
+        except ResourceNotFoundError:
+            log.info(f"VNet {vnet_name} not found.")
+        except HttpResponseError as e:
+            log.info(f"An error occurred while deleting the VNet: {e}")
+            raise e
@@ -1,22 +1,67 @@
-from azure.identity import DefaultAzureCredential
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.resource.resources.models import DeploymentMode
-from deploy.utils import context, log
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from deploy.utils import context, log, files, events, process
+from deploy.utils.lro import poller
+from deploy.utils.template_cache import TemplateCache, compile_bicep
 from .base import Base
+from concurrent.futures import Future
 import json
 import os
-import subprocess
+import re
+import tempfile
+import threading
+import time
+
+ENGINE_SDK = 'sdk'
+ENGINE_CLI = 'cli'
+
+# 完了とみなすデプロイの状態
+FAILED_STATES = ('Failed', 'Canceled')
+
+# 送信後、デプロイメントが見つからない状態をこの時間 (秒) 以上続けば失敗とする
+NOT_FOUND_GRACE_SECONDS = 120
+
+# submit_batch の入れ子のデプロイメント
+NESTED_DEPLOYMENT_TYPE = 'Microsoft.Resources/deployments'
+NESTED_DEPLOYMENT_API_VERSION = '2022-09-01'
+
+# ISO 8601 の期間 (デプロイ操作の duration, 例: PT1M23.45S)
+__DURATION_PATTERN__ = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?)?$')
+
+class DeploymentError(Exception):
+    """
+    A deployment that ended in the Failed or Canceled state.
+    `error` is the ARM error of the deployment (with `code`, `message` and `details`), if any.
+    """
+    def __init__(self, message: str, error=None, state: str = 'Failed'):
+        super().__init__(message)
+        self.error = error
+        self.state = state
 
 class Bicep(Base):
-    def __init__(self, subscription_id):
+    def __init__(self, subscription_id, tmp_dir_path: str = None, engine: str = ENGINE_SDK,
+                 template_cache: TemplateCache = None):
         super().__init__(subscription_id)
+        if engine not in (ENGINE_SDK, ENGINE_CLI):
+            raise ValueError(f"Invalid deploy engine: {engine}")
+        self._tmp_dir_path = tmp_dir_path or tempfile.gettempdir()
+        self._engine = engine
+        self._template_cache = template_cache
+        self._templates = {}
+        self._template_locks = {}
+        self._template_locks_lock = threading.Lock()
         self._set_clients()
     
     def _set_clients(self):
-        self._resource_client = ResourceManagementClient(self.credential, self.subscription_id)
+        self._resource_client = self._get_client(ResourceManagementClient)
+
+    @property
+    def engine(self) -> str:
+        return self._engine
 
     def deploy(self, deploy_name: str, template_file_path: str, rg_name: str, 
-                              params_file_path : str, mode: str = 'incremental') -> bool:
+                              params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
         """
         Function to deploy a Bicep template
 
@@ -24,36 +69,421 @@ class Bicep(Base):
             deploy_name (str): Name of the bicep deployment
             template_file_path (str): Path to the template file
             rg_name (str): Name of the resource group
-            params_file_path  (str): Parameter information
+            params (dict): Parameters formatted for Bicep ({name: {"value": value}})
             mode (str): Deployment mode (only 'incremental' or 'complete' can be specified)
+            tags (dict): Tags of the deployment (sdk engine only)
 
+        Returns:
+            dict: {'name': str, 'status': str, 'outputs': dict}
         """
+        if mode not in ('incremental', 'complete'):
+            raise ValueError(f"Invalid deployment mode: {mode}")
+        if not os.path.isfile(template_file_path):
+            log.error(f"Template file not found: {template_file_path}")
+            raise FileNotFoundError(template_file_path)
         try:
-            with open(template_file_path, 'r') as f:
-                template = f.read()
-        except FileNotFoundError as e:
-            log.error(f"Template file not found: {e}")
-            raise
+            if self._engine == ENGINE_SDK:
+                return self.deploy_template_with_sdk(deploy_name, template_file_path, rg_name, params, mode, tags)
+            with files.params_file(self._tmp_dir_path, params) as params_file_path:
+                return self.deploy_bicep_with_params(deploy_name, template_file_path, rg_name, params_file_path, mode)
+        except Exception as e:
+            log.error(f"Error during deployment: {deploy_name}")
+            log.error(e)
+            raise e
+
+    def submit(self, deploy_name: str, template_file_path: str, rg_name: str,
+               params: dict, mode: str = 'incremental', tags: dict = None) -> Future:
+        """
+        Starts a deployment without waiting for it. The shared OperationPoller tracks it,
+        so no thread is held while ARM deploys the template.
+
+        While the deployment runs, the state changes of the deployment and of each of its
+        resources are published as progress events (see deploy.utils.events) when anything
+        is subscribed.
+
+        Args: Same as deploy().
+
+        Returns:
+            Future: Resolved with {'name': str, 'status': str, 'outputs': dict}, or
+                failed with DeploymentError when the deployment fails.
+        """
+        if mode not in ('incremental', 'complete'):
+            raise ValueError(f"Invalid deployment mode: {mode}")
+        if not os.path.isfile(template_file_path):
+            log.error(f"Template file not found: {template_file_path}")
+            raise FileNotFoundError(template_file_path)
+
+        def start():
+            if self._engine == ENGINE_SDK:
+                deployment = self.__get_deployment_body(template_file_path, params, mode, tags)
+                self._resource_client.deployments.begin_create_or_update(rg_name, deploy_name, deployment,
+                                                                         polling=False)
+            else:
+                with files.params_file(self._tmp_dir_path, params) as params_file_path:
+                    self.deploy_bicep_with_params(deploy_name, template_file_path, rg_name, params_file_path,
+                                                  mode, no_wait=True)
+        return self.__track(deploy_name, rg_name, start)
+
+    def submit_batch(self, deploy_name: str, rg_name: str, deployments: list, mode: str = 'incremental') -> Future:
+        """
+        Starts one composite deployment that runs several templates as nested deployments.
+        ARM orders the nested deployments by their dependencies, so the whole batch is submitted
+        and polled once instead of once per template.
+
+        The nested deployments keep their names and tags, so each of them can later be looked up
+        (e.g. by get_deployment_tags) like a deployment started with submit(). Their parameters are
+        passed as parameters of the composite deployment, so secure values are not stored in its template.
+
+        Args:
+            deploy_name (str): Name of the composite deployment
+            rg_name (str): Name of the resource group
+            deployments (list): Nested deployments: [{'name', 'template_file_path', 'params' (formatted for Bicep),
+                'tags', 'depends_on' (names of other nested deployments of the batch)}]
+            mode (str): Deployment mode of the nested deployments (the composite one is always incremental)
+
+        Returns:
+            Future: The composite deployment, done like the Future of submit(). Once it is done, settle_batch
+                returns the result of each nested deployment.
+        """
+        if mode not in ('incremental', 'complete'):
+            raise ValueError(f"Invalid deployment mode: {mode}")
+        for deployment in deployments:
+            if not os.path.isfile(deployment['template_file_path']):
+                log.error(f"Template file not found: {deployment['template_file_path']}")
+                raise FileNotFoundError(deployment['template_file_path'])
+        template, params = self.__get_batch_template(deployments, mode)
+
+        def start():
+            if self._engine == ENGINE_SDK:
+                deployment = {'properties': {'template': template, 'parameters': params,
+                                             'mode': DeploymentMode.INCREMENTAL}}
+                self._resource_client.deployments.begin_create_or_update(rg_name, deploy_name, deployment,
+                                                                         polling=False)
+            else:
+                # 複合テンプレートは ARM JSON のまま az に渡す
+                with files.params_file(self._tmp_dir_path, template) as template_file_path, \
+                        files.params_file(self._tmp_dir_path, params) as params_file_path:
+                    self.deploy_bicep_with_params(deploy_name, template_file_path, rg_name, params_file_path,
+                                                  no_wait=True)
+        return self.__track(deploy_name, rg_name, start)
+
+    def __track(self, deploy_name: str, rg_name: str, start) -> Future:
         try:
-            self.deploy_bicep_with_params(template_file_path, rg_name, params_file_path)
+            start()
         except Exception as e:
             log.error(f"Error during deployment: {deploy_name}")
             log.error(e)
             raise e
-        return True
+        events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state='Submitted')
+        # 前回の確認から変化した状態のみイベントにする
+        progress = {'state': None, 'operations': {}}
+        found = {'at': time.monotonic()}
+
+        def check():
+            state = None
+            try:
+                done, value = self.check_deployment(rg_name, deploy_name)
+                state = value['status'] if done else value
+                if state != 'NotFound':
+                    found['at'] = time.monotonic()
+                elif time.monotonic() - found['at'] >= NOT_FOUND_GRACE_SECONDS:
+                    message = f"Deployment {deploy_name} not found for {NOT_FOUND_GRACE_SECONDS}s after it was submitted"
+                    log.error(message)
+                    raise DeploymentError(message, None, 'NotFound')
+                return done, value
+            except DeploymentError as e:
+                state = e.state
+                raise
+            finally:
+                if state and events.bus.active:
+                    self.__report_progress(rg_name, deploy_name, state, progress)
+        return poller.track(deploy_name, check)
+
+    def __get_batch_template(self, deployments: list, mode: str) -> tuple:
+        names = {deployment['name'] for deployment in deployments}
+        parameters = {}
+        values = {}
+        resources = []
+        for index, deployment in enumerate(deployments):
+            template = self.build_template(deployment['template_file_path'])
+            nested_params = {}
+            for name, value in deployment['params'].items():
+                # 入れ子ごとに同名のパラメータがあるため、外側では番号を付ける
+                outer_name = f"d{index}_{name}"
+                parameters[outer_name] = {'type': template.get('parameters', {}).get(name, {}).get('type', 'object')}
+                values[outer_name] = value
+                nested_params[name] = {'value': f"[parameters('{outer_name}')]"}
+            resources.append({
+                'type': NESTED_DEPLOYMENT_TYPE,
+                'apiVersion': NESTED_DEPLOYMENT_API_VERSION,
+                'name': deployment['name'],
+                'tags': deployment.get('tags') or {},
+                'dependsOn': [f"[resourceId('{NESTED_DEPLOYMENT_TYPE}', '{name}')]"
+                              for name in deployment.get('depends_on', []) if name in names],
+                'properties': {
+                    'mode': mode.capitalize(),
+                    'expressionEvaluationOptions': {'scope': 'inner'},
+                    'template': template,
+                    'parameters': nested_params
+                }
+            })
+        template = {
+            '$schema': 'https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#',
+            'contentVersion': '1.0.0.0',
+            'parameters': parameters,
+            'resources': resources
+        }
+        return template, values
+
+    def settle_batch(self, rg_name: str, deploy_name: str, deployments: list, error: Exception = None) -> dict:
+        """
+        Gets the result of each nested deployment of a finished composite deployment (see submit_batch).
+        This calls ARM, so run it on a worker thread, not in a callback of the composite Future.
+
+        Args:
+            rg_name (str): Name of the resource group
+            deploy_name (str): Name of the composite deployment
+            deployments (list): Nested deployments passed to submit_batch
+            error (Exception): Exception of the composite deployment, if it failed
+
+        Returns:
+            dict: {nested deployment name: Future}. Each of these is done like the Future of submit();
+                a nested deployment that did not run (e.g. its dependency failed) fails with DeploymentError.
+        """
+        # 複合デプロイメントの操作 (入れ子のデプロイメントごとに一つ) から各結果を決める
+        try:
+            operations = {operation['resource_name']: operation
+                          for operation in self.get_deployment_operations(rg_name, deploy_name)
+                          if operation['resource_type'] == NESTED_DEPLOYMENT_TYPE}
+            return {deployment['name']: self.__get_nested_result(rg_name, deployment['name'],
+                                                                 operations.get(deployment['name']), error)
+                    for deployment in deployments}
+        except Exception as e:
+            log.error(f"An error occurred while getting the results of {deploy_name}: {e}")
+            raise e
+
+    def __get_nested_result(self, rg_name: str, deploy_name: str, operation: dict, error: Exception) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if operation is None:
+            message = f"Deployment {deploy_name} did not run" + (f": {error}" if error else '')
+            future.set_exception(DeploymentError(message, getattr(error, 'error', None), 'NotStarted'))
+        elif operation['state'] != 'Succeeded':
+            message = (f"Deployment {deploy_name} {operation['state'].lower()}: "
+                       f"{operation['error'] or operation['state']}")
+            log.error(message)
+            future.set_exception(DeploymentError(message, None, operation['state']))
+        else:
+            # このバッチで成功したため、同名のデプロイメントの出力はこの実行のもの
+            _, result = self.check_deployment(rg_name, deploy_name)
+            future.set_result(result)
+        return future
+
+    def check_deployment(self, rg_name: str, deploy_name: str):
+        """
+        Checks a submitted deployment once.
+
+        Returns:
+            tuple: (True, {'name', 'status', 'outputs'}) when it succeeded, otherwise (False, provisioning state)
+
+        Raises:
+            DeploymentError: If the deployment failed or was canceled.
+        """
+        try:
+            deployment = self._resource_client.deployments.get(rg_name, deploy_name)
+        except ResourceNotFoundError:
+            return False, 'NotFound'
+        state = deployment.properties.provisioning_state
+        if state == 'Succeeded':
+            return True, {
+                'name': deployment.name,
+                'status': state,
+                'outputs': _flatten_outputs(deployment.properties.outputs)
+            }
+        if state in FAILED_STATES:
+            error = deployment.properties.error
+            message = f"{error.code}: {error.message}" if error else state
+            log.error(f"Deployment {deploy_name} {state.lower()}: {message}")
+            raise DeploymentError(f"Deployment {deploy_name} {state.lower()}: {message}", error, state)
+        return False, state
+
+    def get_deployment_operations(self, rg_name: str, deploy_name: str) -> list:
+        """
+        Returns the operations of a deployment, one per resource it creates or updates.
+
+        Returns:
+            list: [{'operation_id', 'resource_type', 'resource_name', 'state', 'duration' (seconds),
+                'error' (str or None)}]. Operations without a target resource are omitted.
+        """
+        try:
+            operations = self._resource_client.deployment_operations.list(rg_name, deploy_name)
+            results = []
+            for operation in operations:
+                properties = operation.properties
+                target = properties.target_resource if properties else None
+                if target is None:
+                    continue
+                results.append({
+                    'operation_id': operation.operation_id,
+                    'resource_type': target.resource_type,
+                    'resource_name': target.resource_name,
+                    'state': properties.provisioning_state,
+                    'duration': _parse_duration(properties.duration),
+                    'error': _get_operation_error(properties.status_message)
+                })
+            return results
+        except ResourceNotFoundError:
+            return []
+        except HttpResponseError as e:
+            log.error(f"An error occurred while listing the operations of {deploy_name}: {e}")
+            raise e
+
+    def __report_progress(self, rg_name: str, deploy_name: str, state: str, progress: dict):
+        if progress['state'] != state:
+            progress['state'] = state
+            events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state=state)
+        try:
+            operations = self.get_deployment_operations(rg_name, deploy_name)
+        except Exception as e:
+            # 進捗の取得に失敗してもデプロイは続ける
+            log.debug(f"Could not get the operations of {deploy_name}: {e}")
+            return
+        for operation in operations:
+            key = operation.pop('operation_id')
+            if progress['operations'].get(key) == operation['state']:
+                continue
+            progress['operations'][key] = operation['state']
+            events.emit(events.EVENT_RESOURCE, deployment=deploy_name, **operation)
+
+    def build_template(self, template_file_path: str) -> dict:
+        """
+        Compiles a Bicep template to ARM JSON. Each template is compiled only once per instance,
+        and not at all when the template cache already holds its current content.
+
+        Args:
+            template_file_path (str): Path to the template file
+
+        Returns:
+            dict: Compiled ARM template
+        """
+        key = os.path.abspath(template_file_path)
+        with self._template_locks_lock:
+            lock = self._template_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._templates:
+                if self._template_cache:
+                    self._templates[key] = self._template_cache.get(template_file_path)
+                else:
+                    self._templates[key] = compile_bicep(template_file_path)
+            return self._templates[key]
+
+    def deploy_template_with_sdk(self, deploy_name: str, template_file_path: str, rg_name: str,
+                                 params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
+        deployment = self.__get_deployment_body(template_file_path, params, mode, tags)
+        operation = self._resource_client.deployments.begin_create_or_update(rg_name, deploy_name, deployment)
+        result = operation.result()
+        return {
+            'name': result.name,
+            'status': result.properties.provisioning_state,
+            'outputs': _flatten_outputs(result.properties.outputs)
+        }
+
+    def __get_deployment_body(self, template_file_path: str, params: dict, mode: str, tags: dict) -> dict:
+        return {
+            'tags': tags or {},
+            'properties': {
+                'template': self.build_template(template_file_path),
+                'parameters': params,
+                'mode': DeploymentMode.INCREMENTAL if mode == 'incremental' else DeploymentMode.COMPLETE
+            }
+        }
+
+    def get_deployment_tags(self, rg_name: str, deploy_name: str) -> dict:
+        """
+        Returns the tags of the last deployment with the given name, or an empty dict
+        when it does not exist or did not succeed.
+        """
+        try:
+            deployment = self._resource_client.deployments.get(rg_name, deploy_name)
+        except ResourceNotFoundError:
+            return {}
+        except HttpResponseError as e:
+            log.error(f"An error occurred while getting the deployment {deploy_name}: {e}")
+            raise e
+        if deployment.properties.provisioning_state != 'Succeeded':
+            return {}
+        return deployment.tags or {}
+
+    def get_output_resource_ids(self, rg_name: str, deploy_name: str) -> list:
+        """
+        Returns the IDs of the resources created by the deployment, or None when the deployment does not exist.
+        """
+        try:
+            deployment = self._resource_client.deployments.get(rg_name, deploy_name)
+        except ResourceNotFoundError:
+            return None
+        except HttpResponseError as e:
+            log.error(f"An error occurred while getting the deployment {deploy_name}: {e}")
+            raise e
+        return [resource.id for resource in (deployment.properties.output_resources or [])]
+
+    def delete_deployment(self, rg_name: str, deploy_name: str):
+        """
+        Deletes the deployment record (not the resources it created).
+        """
+        try:
+            self._resource_client.deployments.begin_delete(rg_name, deploy_name).result()
+        except ResourceNotFoundError:
+            log.info(f"Deployment {deploy_name} not found.")
+        except HttpResponseError as e:
+            log.error(f"An error occurred while deleting the deployment {deploy_name}: {e}")
+            raise e
 
     @staticmethod
-    def deploy_bicep_with_params(template_file, resource_group, params_file_path):
-        try:
-            cmd = [
-                "az", "deployment", "group", "create",
-                "--resource-group", resource_group,
-                "--template-file", template_file,
-                "--parameters", params_file_path
-            ]
-            
-            # コマンド実行
-            subprocess.run(cmd, check=True)
-        finally:
-            # 一時ファイルを削除
-            os.remove(params_file_path)
+    def deploy_bicep_with_params(deploy_name, template_file, resource_group, params_file_path, mode='incremental',
+                                 no_wait: bool = False) -> dict:
+        cmd = [
+            "az", "deployment", "group", "create",
+            "--name", deploy_name,
+            "--resource-group", resource_group,
+            "--template-file", template_file,
+            "--parameters", f"@{params_file_path}",
+            "--mode", mode.capitalize(),
+            "--output", "json"
+        ]
+        if no_wait:
+            # 送信のみ行い、完了は呼び出し側で確認する
+            cmd.append("--no-wait")
+        
+        # コマンド実行 (stderr はログに流し、エラー内容はスロットリング等の判定に使う)
+        completed = process.run(cmd, name=f"az {deploy_name}")
+        result = json.loads(completed.stdout) if completed.stdout.strip() else {}
+        properties = result.get('properties', {})
+        return {
+            'name': result.get('name', deploy_name),
+            'status': properties.get('provisioningState'),
+            'outputs': _flatten_outputs(properties.get('outputs'))
+        }
+
+def _flatten_outputs(outputs: dict) -> dict:
+    # ARMの出力 {name: {"type": ..., "value": ...}} を {name: value} に変換
+    return {name: output.get('value') for name, output in (outputs or {}).items()}
+
+def _parse_duration(duration: str):
+    # ISO 8601 の期間を秒に変換する (解釈できない場合は None)
+    match = __DURATION_PATTERN__.match(duration or '')
+    if not duration or not match:
+        return None
+    days, hours, minutes, seconds = (float(value or 0) for value in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def _get_operation_error(status_message):
+    # statusMessage はモデルまたは dict ({"status": ..., "error": {"code", "message"}})
+    if status_message is None:
+        return None
+    error = status_message.get('error') if isinstance(status_message, dict) else getattr(status_message, 'error', None)
+    if error is None:
+        return None
+    if isinstance(error, dict):
+        return f"{error.get('code')}: {error.get('message')}"
+    return f"{error.code}: {error.message}"
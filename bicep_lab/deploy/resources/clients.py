@@ -0,0 +1,145 @@
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from azure.identity import DefaultAzureCredential
+from azure.core.pipeline.policies import SansIOHTTPPolicy, HTTPPolicy, RetryPolicy
+from azure.core.pipeline.transport import RequestsTransport
+from urllib.parse import urlparse
+from deploy.utils import log, trace, ratelimit
+
+class TracePolicy(SansIOHTTPPolicy):
+    """Records every HTTP request of the SDK clients as an 'sdk' span."""
+    def on_request(self, request):
+        url = urlparse(request.http_request.url)
+        request.context['trace_span'] = trace.tracer.start_span(
+            f"{request.http_request.method} {url.path}", 'sdk', host=url.netloc)
+
+    def on_response(self, request, response):
+        span = request.context.get('trace_span')
+        if span:
+            span.attrs['status'] = response.http_response.status_code
+            span.end = time.perf_counter()
+
+    def on_exception(self, request):
+        span = request.context.get('trace_span')
+        if span:
+            span.attrs['error'] = 'exception'
+            span.end = time.perf_counter()
+
+class RateLimitPolicy(HTTPPolicy):
+    """
+    Waits while the subscription (or data plane host) of the request is throttled, and
+    shares the throttling headers of every response with the other workers (see deploy.utils.ratelimit).
+    """
+    def send(self, request):
+        key = ratelimit.get_key(request.http_request.url)
+        ratelimit.limiter.wait(key)
+        response = self.next.send(request)
+        ratelimit.limiter.observe(key, response.http_response.status_code, response.http_response.headers)
+        return response
+
+class JitterRetryPolicy(RetryPolicy):
+    """RetryPolicy whose exponential backoff uses full jitter, so that workers do not retry in lockstep."""
+    def get_backoff_time(self, settings):
+        backoff = random.uniform(0, super().get_backoff_time(settings))
+        ratelimit.limiter.record_retry(backoff)
+        return backoff
+
+class ClientRegistry():
+    """
+    Process-wide registry of Azure SDK clients.
+
+    All clients share one DefaultAzureCredential (so tokens are fetched once and cached),
+    and the clients of a subscription share one keep-alive HTTP transport.
+    The registry is safe to use from ThreadPoolExecutor workers.
+    """
+    POOL_MAXSIZE = 32
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._credential = None
+        self._sessions = {}
+        self._transports = {}
+        self._clients = {}
+
+    @property
+    def credential(self) -> DefaultAzureCredential:
+        with self._lock:
+            if self._credential is None:
+                self._credential = DefaultAzureCredential()
+            return self._credential
+
+    def get_client(self, client_cls, subscription_id: str, scoped: bool = True):
+        """
+        Returns the shared management client of the given class for the subscription.
+
+        Args:
+            client_cls (type): Management client class (e.g. NetworkManagementClient).
+            subscription_id (str): Subscription ID.
+            scoped (bool): False for clients that do not take a subscription ID (e.g. SubscriptionClient).
+        """
+        key = (client_cls, subscription_id)
+        with self._lock:
+            if key not in self._clients:
+                args = [self.credential, subscription_id] if scoped else [self.credential]
+                self._clients[key] = client_cls(*args, transport=self._get_transport(subscription_id),
+                                                per_retry_policies=self._get_policies(),
+                                                retry_policy=self._get_retry_policy())
+            return self._clients[key]
+
+    def get_data_client(self, client_cls, url: str, subscription_id: str, **client_kwargs):
+        """
+        Returns the shared data plane client (e.g. SecretClient, BlobServiceClient) for the URL.
+
+        Args:
+            client_cls (type): Data plane client class.
+            url (str): Vault URL or account URL.
+            subscription_id (str): Subscription that owns the resource. Used to select the transport.
+            client_kwargs: Client configuration (e.g. max_block_size). Only used when the client is created.
+        """
+        key = (client_cls, url)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = client_cls(url, self.credential, transport=self._get_transport(subscription_id),
+                                               per_retry_policies=self._get_policies(),
+                                               retry_policy=self._get_retry_policy(), **client_kwargs)
+            return self._clients[key]
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    log.warning(f"An error occurred while closing the client: {e}")
+            for session in self._sessions.values():
+                session.close()
+            if self._credential is not None:
+                self._credential.close()
+            self._clients.clear()
+            self._transports.clear()
+            self._sessions.clear()
+            self._credential = None
+
+    @staticmethod
+    def _get_policies() -> list:
+        return [TracePolicy(), RateLimitPolicy()]
+
+    @staticmethod
+    def _get_retry_policy() -> JitterRetryPolicy:
+        limiter = ratelimit.limiter
+        return JitterRetryPolicy(retry_total=limiter.max_attempts - 1, retry_backoff_factor=limiter.base_delay / 2,
+                                 retry_backoff_max=limiter.max_delay)
+
+    def _get_transport(self, subscription_id: str) -> RequestsTransport:
+        if subscription_id not in self._transports:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.POOL_MAXSIZE, pool_maxsize=self.POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            self._sessions[subscription_id] = session
+            self._transports[subscription_id] = RequestsTransport(session=session, session_owner=False)
+        return self._transports[subscription_id]
+
+registry = ClientRegistry()
@@ -0,0 +1,466 @@
+# In-process stand-in for the resource classes, used to run and measure the deployment
+# managers without an Azure subscription (see benchmarks/). It imports no Azure SDK module.
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from deploy.utils import log, ratelimit, events
+from deploy.utils.secrets import cache
+from deploy.utils.lro import poller
+from deploy.utils.cidr_index import CidrIndex, is_subnet_of
+
+class FakeHttpResponseError(Exception):
+    """Mimics azure.core.exceptions.HttpResponseError (status_code and response.headers)."""
+    def __init__(self, message: str, status_code: int, headers: dict = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = type('FakeResponse', (), {'headers': headers or {}, 'status_code': status_code})()
+
+class FakeAzure():
+    """
+    Shared state of the fake backend: latencies, injected failures and API call counters.
+
+    Latencies are given in simulated seconds and multiplied by `time_scale`.
+
+    Args:
+        time_scale (float): Real seconds per simulated second.
+        latencies (dict): Operation ('lookup', 'secret', 'list_vnets', 'compile', 'upload') -> simulated seconds.
+        deploy_latencies (dict): Component -> simulated deployment seconds.
+        failure_rate (float): Probability that an API call fails with HTTP 500.
+        throttle_rate (float): Probability that an API call fails with HTTP 429.
+        retry_after (float): Retry-After (simulated seconds) of throttled calls.
+        failing_components (list): Components whose deployment always fails.
+        seed (int): Random seed for reproducible runs.
+    """
+    DEFAULT_LATENCIES = {'lookup': 0.5, 'secret': 0.3, 'list_vnets': 1.5, 'compile': 2.0, 'upload': 0.2,
+                         'submit': 1.0, 'poll': 0.2}
+    DEFAULT_DEPLOY_LATENCIES = {
+        'vnet': 20, 'acr': 40, 'sa': 30, 'keyvault': 35, 'role': 10, 'dev_vm': 120,
+        'db': 300, 'app_container': 90, 'scheduler': 60, 'back': 60, 'front': 60
+    }
+
+    def __init__(self, time_scale: float = 0.01, latencies: dict = None, deploy_latencies: dict = None,
+                 failure_rate: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 5.0,
+                 failing_components: list = None, seed: int = None):
+        self.time_scale = time_scale
+        self.latencies = {**self.DEFAULT_LATENCIES, **(latencies or {})}
+        self.deploy_latencies = {**self.DEFAULT_DEPLOY_LATENCIES, **(deploy_latencies or {})}
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.failing_components = set(failing_components or [])
+        self.deployments = {}
+        self.secrets = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._threads = set()
+
+    @property
+    def calls(self) -> dict:
+        with self._lock:
+            return dict(self._calls)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def thread_count(self) -> int:
+        """Number of distinct threads that called the fake backend."""
+        with self._lock:
+            return len(self._threads)
+
+    def call(self, operation: str, latency: float = None, key: str = 'default'):
+        """
+        Counts and delays a synchronous API call, raising injected failures.
+
+        Like the SDK pipeline (RateLimitPolicy and the retry policy of the clients), throttled
+        and failed calls are retried. Deployments are not: the deployment managers retry them.
+        """
+        if operation == 'deploy':
+            time.sleep(self.__begin(operation, latency, key))
+        else:
+            ratelimit.retry(lambda: time.sleep(self.__begin(operation, latency, key)), operation, key)
+
+    async def call_async(self, operation: str, latency: float = None, key: str = 'default'):
+        """asyncio version of call()."""
+        if operation == 'deploy':
+            await asyncio.sleep(self.__begin(operation, latency, key))
+        else:
+            await ratelimit.retry_async(lambda: asyncio.sleep(self.__begin(operation, latency, key)), operation, key)
+
+    @contextmanager
+    def install(self, *modules):
+        """
+        Replaces the resource classes used by the given manager modules with the fake ones.
+        Async managers (modules importing deploy.resources.aio) get the async fakes.
+        """
+        saved = []
+        for module in modules:
+            is_async = module.__name__.endswith('async_deployment_manager')
+            classes = self.async_classes() if is_async else self.sync_classes()
+            for name, cls in classes.items():
+                if hasattr(module, name):
+                    saved.append((module, name, getattr(module, name)))
+                    setattr(module, name, cls)
+        try:
+            yield self
+        finally:
+            for module, name, original in reversed(saved):
+                setattr(module, name, original)
+
+    def sync_classes(self) -> dict:
+        azure = self
+        return {name: type(name, (cls,), {'_azure': azure}) for name, cls in __SYNC_CLASSES__.items()}
+
+    def async_classes(self) -> dict:
+        azure = self
+        classes = {name: type(name, (cls,), {'_azure': azure}) for name, cls in __ASYNC_CLASSES__.items()}
+        classes['registry'] = FakeRegistry()
+        return classes
+
+    def __begin(self, operation: str, latency: float, key: str) -> float:
+        with self._lock:
+            self._calls[operation] = self._calls.get(operation, 0) + 1
+            self._threads.add(threading.get_ident())
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            headers = {'Retry-After': str(self.retry_after * self.time_scale)}
+            ratelimit.limiter.observe(key, 429, headers)
+            raise FakeHttpResponseError(f"Too many requests: {operation}", 429, headers)
+        if roll < self.throttle_rate + self.failure_rate:
+            raise FakeHttpResponseError(f"Injected failure: {operation}", 500)
+        if latency is None:
+            latency = self.latencies.get(operation, 0.1)
+        return latency * self.time_scale
+
+class FakeRegistry():
+    async def close(self):
+        pass
+
+class FakeBase():
+    _azure: FakeAzure = None
+
+    def __init__(self, subscription_id, *args, **kwargs):
+        self._subscription_id = subscription_id
+
+    @property
+    def subscription_id(self) -> str:
+        return self._subscription_id
+
+    def _call(self, operation: str, latency: float = None):
+        self._azure.call(operation, latency, self._subscription_id.lower())
+
+    async def _call_async(self, operation: str, latency: float = None):
+        await self._azure.call_async(operation, latency, self._subscription_id.lower())
+
+class FakeBicep(FakeBase):
+    def __init__(self, subscription_id, tmp_dir_path: str = None, engine: str = 'sdk', template_cache=None):
+        super().__init__(subscription_id)
+        self._engine = engine
+        self._templates = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    def build_template(self, template_file_path: str) -> dict:
+        with self._lock:
+            compiled = template_file_path in self._templates
+            self._templates[template_file_path] = {'template': template_file_path}
+        if not compiled:
+            self._call('compile')
+        return self._templates[template_file_path]
+
+    def deploy(self, deploy_name: str, template_file_path: str, rg_name: str,
+               params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
+        component = _component_of(deploy_name)
+        self._call('deploy', self._azure.deploy_latencies.get(component, 30))
+        return _finish_deployment(self._azure, component, deploy_name, params, tags)
+
+    def submit(self, deploy_name: str, template_file_path: str, rg_name: str,
+               params: dict, mode: str = 'incremental', tags: dict = None) -> Future:
+        component = _component_of(deploy_name)
+        # 送信 (PUT) の後は OperationPoller が完了を確認する
+        self._call('deploy', self._azure.latencies['submit'])
+        started = time.monotonic()
+        done_at = started + self._azure.deploy_latencies.get(component, 30) * self._azure.time_scale
+        events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state='Submitted')
+
+        def check():
+            self._call('poll')
+            if time.monotonic() < done_at:
+                return False, 'Running'
+            state = 'Failed' if component in self._azure.failing_components else 'Succeeded'
+            events.emit(events.EVENT_RESOURCE, deployment=deploy_name, resource_type='Fake/components',
+                        resource_name=component, state=state, duration=time.monotonic() - started,
+                        error=f"Injected deployment failure: {component}" if state == 'Failed' else None)
+            events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state=state)
+            return True, _finish_deployment(self._azure, component, deploy_name, params, tags)
+        return poller.track(deploy_name, check)
+
+    def submit_batch(self, deploy_name: str, rg_name: str, deployments: list, mode: str = 'incremental') -> Future:
+        # 入れ子のデプロイメントは依存先の完了後に始まり (ARM の dependsOn)、全体を一度だけ確認する
+        self._call('deploy', self._azure.latencies['submit'])
+        started = time.monotonic()
+        by_name = {deployment['name']: deployment for deployment in deployments}
+        timeline = {}
+
+        def schedule(name: str) -> tuple:
+            if name not in timeline:
+                deps = [schedule(dep) for dep in by_name[name].get('depends_on', []) if dep in by_name]
+                if any(state != 'Succeeded' for _, _, state in deps):
+                    timeline[name] = (None, None, 'NotStarted')
+                else:
+                    component = _component_of(name)
+                    begin = max([started] + [end for _, end, _ in deps])
+                    end = begin + self._azure.deploy_latencies.get(component, 30) * self._azure.time_scale
+                    state = 'Failed' if component in self._azure.failing_components else 'Succeeded'
+                    timeline[name] = (begin, end, state)
+            return timeline[name]
+        for name in by_name:
+            schedule(name)
+        done_at = max([end for _, end, _ in timeline.values() if end is not None] + [started])
+        events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state='Submitted')
+
+        def check():
+            self._call('poll')
+            if time.monotonic() < done_at:
+                return False, 'Running'
+            outcomes = self._batches[deploy_name] = {}
+            for name, (begin, end, state) in timeline.items():
+                if state == 'NotStarted':
+                    outcomes[name] = FakeHttpResponseError(f"Deployment {name} did not run", 400)
+                    continue
+                events.emit(events.EVENT_RESOURCE, deployment=deploy_name,
+                            resource_type='Microsoft.Resources/deployments', resource_name=name, state=state, duration=end - begin,
+                            error=f"Injected deployment failure: {_component_of(name)}" if state == 'Failed' else None)
+                try:
+                    outcomes[name] = _finish_deployment(self._azure, _component_of(name), name,
+                                                        by_name[name]['params'], by_name[name].get('tags'))
+                except FakeHttpResponseError as e:
+                    outcomes[name] = e
+            failed = any(state != 'Succeeded' for _, _, state in timeline.values())
+            events.emit(events.EVENT_DEPLOYMENT, deployment=deploy_name, state='Failed' if failed else 'Succeeded')
+            if failed:
+                raise FakeHttpResponseError(f"Deployment {deploy_name} failed", 400)
+            return True, {'name': deploy_name, 'status': 'Succeeded', 'outputs': {}}
+        return poller.track(deploy_name, check)
+
+    def settle_batch(self, rg_name: str, deploy_name: str, deployments: list, error: Exception = None) -> dict:
+        # 入れ子のデプロイメントの結果の取得 (操作一覧の取得) を一回の呼び出しとする
+        self._call('lookup')
+        results = {}
+        for name, outcome in self._batches.pop(deploy_name).items():
+            future = results[name] = Future()
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+        return results
+
+    def get_deployment_tags(self, rg_name: str, deploy_name: str) -> dict:
+        self._call('lookup')
+        return self._azure.deployments.get(deploy_name, {}).get('tags', {})
+
+class FakeVnet(FakeBase):
+    def get_vnet_by_name(self, rg_name: str, vnet_name: str):
+        self._call('lookup')
+        return None
+
+    def get_cidr_index(self, refresh: bool = False) -> CidrIndex:
+        self._call('list_vnets')
+        return CidrIndex()
+
+    def check_vnet_cidr_availability(self, cidr: str, exclude_vnet_id: str = None) -> bool:
+        return self.get_cidr_index().is_available(cidr, exclude_vnet_id)
+
+    def suggest_vnet_cidr(self, prefixlen: int, within: str = '10.0.0.0/8', exclude_vnet_id: str = None) -> str:
+        return self.get_cidr_index().next_free(prefixlen, within, exclude_vnet_id)
+
+    def get_subnet_cidr_index(self, vnet_name: str, rg_name: str) -> CidrIndex:
+        self._call('lookup')
+        return CidrIndex()
+
+    def check_subnet_cidr_availability(self, vnet_name: str, rg_name: str, cidr: str,
+                                       exclude_subnet_name: str = None) -> bool:
+        self._call('lookup')
+        return True
+
+    def suggest_subnet_cidr(self, vnet_name: str, rg_name: str, prefixlen: int, within: str,
+                            exclude_subnet_name: str = None) -> str:
+        self._call('lookup')
+        return CidrIndex().next_free(prefixlen, within)
+
+    is_subnet_of = staticmethod(is_subnet_of)
+
+class FakeKeyvault(FakeBase):
+    @staticmethod
+    def generate_password(length=16):
+        return 'fake-password-' + 'x' * max(length - 14, 0)
+
+    def get_sql_password_from_keyvault(self, vault_name: str, secret_name: str) -> str:
+        return cache.get(vault_name, secret_name, lambda: self._get_secret(secret_name))
+
+    def _get_secret(self, secret_name: str) -> str:
+        self._call('secret')
+        return self._azure.secrets.get(secret_name, '')
+
+class FakeStorageAccount(FakeBase):
+    def sync_directory(self, account_name: str, container_name: str, dir_path: str,
+                       delete: bool = False, max_concurrency: int = 8) -> dict:
+        self._call('upload')
+        return {'uploaded': [], 'unchanged': [], 'deleted': []}
+
+class FakeInventory(FakeBase):
+    def __init__(self, subscription_id, rg_name: str = None, state=None, ttl: float = None):
+        super().__init__(subscription_id)
+        self._rg_name = rg_name
+        self._state = state
+        self._ttl = ttl
+        self._listed = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        self._call('lookup')
+        self._listed = True
+
+    def invalidate(self):
+        self._listed = False
+
+    def find_by_prefix(self, resource_type: str, prefix: str) -> str:
+        with self._lock:
+            if not self._listed:
+                self.refresh()
+        return ''
+
+    def find_acr(self, env_name: str) -> str:
+        return self._get_known_name('acr') or self.find_by_prefix('acr', env_name)
+
+    def find_keyvault(self, env_name: str) -> str:
+        return self._get_known_name('keyvault') or self.find_by_prefix('keyvault', env_name)
+
+    def find_sql_server(self, env_name: str) -> str:
+        return self._get_known_name('db') or self.find_by_prefix('sql', env_name)
+
+    def find_storage_account(self, env_name: str) -> str:
+        return self._get_known_name('sa') or self.find_by_prefix('sa', env_name)
+
+    def remember(self, component: str, name: str):
+        if self._state is not None and name:
+            self._state.put('names', component, name)
+
+    def forget(self, component: str):
+        if self._state is not None:
+            self._state.delete('names', component)
+
+    def _get_known_name(self, component: str) -> str:
+        return (self._state.get_fresh('names', component, self._ttl) if self._state is not None else None) or ''
+
+class FakeAsyncBicep(FakeBicep):
+    async def build_template(self, template_file_path: str) -> dict:
+        compiled = template_file_path in self._templates
+        self._templates[template_file_path] = {'template': template_file_path}
+        if not compiled:
+            await self._call_async('compile')
+        return self._templates[template_file_path]
+
+    async def deploy(self, deploy_name: str, template_file_path: str, rg_name: str,
+                     params: dict, mode: str = 'incremental', tags: dict = None) -> dict:
+        component = _component_of(deploy_name)
+        await self._call_async('deploy', self._azure.deploy_latencies.get(component, 30))
+        return _finish_deployment(self._azure, component, deploy_name, params, tags)
+
+    async def get_deployment_tags(self, rg_name: str, deploy_name: str) -> dict:
+        await self._call_async('lookup')
+        return self._azure.deployments.get(deploy_name, {}).get('tags', {})
+
+class FakeAsyncVnet(FakeVnet):
+    async def get_vnet_by_name(self, rg_name: str, vnet_name: str):
+        await self._call_async('lookup')
+        return None
+
+    async def get_cidr_index(self, refresh: bool = False) -> CidrIndex:
+        await self._call_async('list_vnets')
+        return CidrIndex()
+
+    async def get_subnet_cidr_index(self, vnet_name: str, rg_name: str) -> CidrIndex:
+        await self._call_async('lookup')
+        return CidrIndex()
+
+    async def check_vnet_cidr_availability(self, cidr: str, exclude_vnet_id: str = None) -> bool:
+        await self._call_async('list_vnets')
+        return True
+
+    async def suggest_vnet_cidr(self, prefixlen: int, within: str = '10.0.0.0/8', exclude_vnet_id: str = None) -> str:
+        await self._call_async('list_vnets')
+        return CidrIndex().next_free(prefixlen, within)
+
+    async def check_subnet_cidr_availability(self, vnet_name: str, rg_name: str, cidr: str,
+                                             exclude_subnet_name: str = None) -> bool:
+        await self._call_async('lookup')
+        return True
+
+    async def suggest_subnet_cidr(self, vnet_name: str, rg_name: str, prefixlen: int, within: str,
+                                  exclude_subnet_name: str = None) -> str:
+        await self._call_async('lookup')
+        return CidrIndex().next_free(prefixlen, within)
+
+class FakeAsyncKeyvault(FakeKeyvault):
+    async def get_sql_password_from_keyvault(self, vault_name: str, secret_name: str) -> str:
+        return await cache.get_async(vault_name, secret_name, lambda: self._get_secret_async(secret_name))
+
+    async def _get_secret_async(self, secret_name: str) -> str:
+        await self._call_async('secret')
+        return self._azure.secrets.get(secret_name, '')
+
+class FakeAsyncStorageAccount(FakeStorageAccount):
+    async def sync_directory(self, account_name: str, container_name: str, dir_path: str,
+                             delete: bool = False, max_concurrency: int = 8) -> dict:
+        await self._call_async('upload')
+        return {'uploaded': [], 'unchanged': [], 'deleted': []}
+
+class FakeAsyncInventory(FakeInventory):
+    async def find_by_prefix(self, resource_type: str, prefix: str) -> str:
+        if not self._listed:
+            self._listed = True
+            await self._call_async('lookup')
+        return ''
+
+    async def find_acr(self, env_name: str) -> str:
+        return self._get_known_name('acr') or await self.find_by_prefix('acr', env_name)
+
+    async def find_keyvault(self, env_name: str) -> str:
+        return self._get_known_name('keyvault') or await self.find_by_prefix('keyvault', env_name)
+
+    async def find_sql_server(self, env_name: str) -> str:
+        return self._get_known_name('db') or await self.find_by_prefix('sql', env_name)
+
+    async def find_storage_account(self, env_name: str) -> str:
+        return self._get_known_name('sa') or await self.find_by_prefix('sa', env_name)
+
+def _component_of(deploy_name: str) -> str:
+    # context.get_deployment_name: "{env_name}-{component}-deployment"
+    return deploy_name[:-len('-deployment')].rsplit('-', 1)[-1] if deploy_name.endswith('-deployment') else deploy_name
+
+def _finish_deployment(azure: FakeAzure, component: str, deploy_name: str, params: dict, tags: dict) -> dict:
+    if component in azure.failing_components:
+        raise FakeHttpResponseError(f"Injected deployment failure: {component}", 400)
+    azure.deployments[deploy_name] = {'params': params, 'tags': tags or {}}
+    log.debug(f"Fake deployment finished: {deploy_name}")
+    return {'name': deploy_name, 'status': 'Succeeded', 'outputs': {}}
+
+__SYNC_CLASSES__ = {
+    'Bicep': FakeBicep, 'Vnet': FakeVnet, 'Keyvault': FakeKeyvault,
+    'StorageAccount': FakeStorageAccount, 'Inventory': FakeInventory
+}
+
+__ASYNC_CLASSES__ = {
+    'Bicep': FakeAsyncBicep, 'Vnet': FakeAsyncVnet, 'Keyvault': FakeAsyncKeyvault,
+    'StorageAccount': FakeAsyncStorageAccount, 'Inventory': FakeAsyncInventory
+}
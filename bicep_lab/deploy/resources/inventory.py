@@ -0,0 +1,134 @@
+from azure.mgmt.resource import ResourceManagementClient
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from deploy.utils import context, log
+from deploy.utils.state import StateStore
+from .base import Base
+import bisect
+import threading
+
+ACR_TYPE = 'Microsoft.ContainerRegistry/registries'
+KEYVAULT_TYPE = 'Microsoft.KeyVault/vaults'
+SQL_SERVER_TYPE = 'Microsoft.DBforMySQL/flexibleServers'
+STORAGE_ACCOUNT_TYPE = 'Microsoft.Storage/storageAccounts'
+
+# 解決したリソース名を記録する StateStore のセクション (コンポーネント名 -> リソース名)
+NAMES_SECTION = 'names'
+
+class Inventory(Base):
+    """
+    Snapshot of the resources in one resource group.
+
+    The resource group is listed once (on first use or after invalidate()), and the
+    resources are indexed by type and name so prefix lookups are answered from memory.
+
+    With a state store, the names of generated resources (ACR, Key Vault, storage account,
+    SQL server) are also remembered across runs. A recorded name younger than `ttl` seconds
+    that still matches the environment's prefix is used without listing the resource group.
+
+    Args:
+        subscription_id (str): Subscription ID.
+        rg_name (str): Resource group name.
+        state (StateStore): State of the environment. Names are not remembered if omitted.
+        ttl (float): Seconds a recorded name is trusted. No limit if omitted.
+    """
+    def __init__(self, subscription_id, rg_name: str, state: StateStore = None, ttl: float = None):
+        super().__init__(subscription_id)
+        self._rg_name = rg_name
+        self._state = state
+        self._ttl = ttl
+        self._index = None
+        self._lock = threading.RLock()
+        self._set_clients()
+
+    def _set_clients(self):
+        self._resource_client = self._get_client(ResourceManagementClient)
+
+    @property
+    def rg_name(self) -> str:
+        return self._rg_name
+
+    def refresh(self):
+        """Lists the resource group and rebuilds the index."""
+        with self._lock:
+            self._index = self.__list_resources()
+
+    def __list_resources(self) -> dict:
+        index = {}
+        try:
+            for resource in self._resource_client.resources.list_by_resource_group(self._rg_name):
+                index.setdefault(resource.type.lower(), []).append(resource.name)
+        except ResourceNotFoundError:
+            log.info(f"Resource group {self._rg_name} not found. The inventory is empty.")
+        except HttpResponseError as e:
+            log.error(f"An error occurred while listing the resource group {self._rg_name}: {e}")
+            raise e
+        for names in index.values():
+            names.sort()
+        return index
+
+    def invalidate(self):
+        """Drops the snapshot. The next lookup lists the resource group again."""
+        with self._lock:
+            self._index = None
+
+    def find_by_prefix(self, resource_type: str, prefix: str) -> str:
+        """
+        Returns the first resource name of the type that starts with the prefix, or '' if none.
+
+        Args:
+            resource_type (str): Resource type (e.g. 'Microsoft.KeyVault/vaults')
+            prefix (str): Name prefix
+        """
+        # 同時に呼ばれても一覧取得は一度だけ行う
+        with self._lock:
+            if self._index is None:
+                self.refresh()
+            index = self._index
+        names = index.get(resource_type.lower(), [])
+        position = bisect.bisect_left(names, prefix)
+        if position < len(names) and names[position].startswith(prefix):
+            return names[position]
+        return ''
+
+    def find_acr(self, env_name: str) -> str:
+        return self.__find('acr', ACR_TYPE, context.get_acr_name_prefix(env_name))
+
+    def find_keyvault(self, env_name: str) -> str:
+        return self.__find('keyvault', KEYVAULT_TYPE, context.get_keyvault_name_prefix(env_name))
+
+    def find_sql_server(self, env_name: str) -> str:
+        return self.__find('db', SQL_SERVER_TYPE, context.get_sql_name_prefix(env_name))
+
+    def find_storage_account(self, env_name: str) -> str:
+        return self.__find('sa', STORAGE_ACCOUNT_TYPE, context.get_storage_account_name_prefix(env_name))
+
+    def remember(self, component: str, name: str):
+        """Records the resource name of a component (e.g. after deploying it)."""
+        _remember_name(self._state, component, name)
+
+    def forget(self, component: str):
+        """Drops the recorded resource name of a component."""
+        if self._state is not None:
+            self._state.delete(NAMES_SECTION, component)
+
+    def __find(self, component: str, resource_type: str, prefix: str) -> str:
+        name = _get_known_name(self._state, component, prefix, self._ttl)
+        if name:
+            return name
+        name = self.find_by_prefix(resource_type, prefix)
+        _remember_name(self._state, component, name)
+        return name
+
+def _get_known_name(state: StateStore, component: str, prefix: str, ttl: float) -> str:
+    # 記録済みの名前は有効期間内で、環境のプレフィックスに一致する場合のみ使う
+    if state is None:
+        return ''
+    name = state.get_fresh(NAMES_SECTION, component, ttl,
+                           lambda value: isinstance(value, str) and value.startswith(prefix))
+    if name:
+        log.debug(f"Using the recorded name of {component}: {name}")
+    return name or ''
+
+def _remember_name(state: StateStore, component: str, name: str):
+    if state is not None and name:
+        state.put(NAMES_SECTION, component, name)
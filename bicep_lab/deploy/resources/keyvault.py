@@ -3,7 +3,7 @@ from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.keyvault.secrets import SecretClient
 from .base import Base
 from deploy.utils import context, log
-import random, string
+from deploy.utils.secrets import cache, generate_password
 
 class Keyvault(Base):
     def __init__(self, subscription_id):
@@ -11,7 +11,7 @@ class Keyvault(Base):
         self._set_clients()
     
     def _set_clients(self):
-        self._keyvault_client = KeyVaultManagementClient(self.credential, self.subscription_id)
+        self._keyvault_client = self._get_client(KeyVaultManagementClient)
 
     def find_keyvault_by_prefix(self, rg_name, env_name) -> str:
         prefix = context.get_keyvault_name_prefix(env_name)
@@ -25,15 +25,18 @@ class Keyvault(Base):
             log.error(f"An error occurred while checking the Key Vault: {e}")
             raise e
     
-    @staticmethod
-    def generate_password(length=16):
-        characters = string.ascii_letters + string.digits + string.punctuation
-        password = ''.join(random.choice(characters) for i in range(length))
-        return password
+    generate_password = staticmethod(generate_password)
 
     def get_sql_password_from_keyvault(self, vault_name: str, secret_name: str) -> str:
+        """
+        Returns the value of the secret, or '' if it does not exist.
+        The value is read once per run and shared by all workers (see deploy.utils.secrets).
+        """
+        return cache.get(vault_name, secret_name, lambda: self.__get_secret(vault_name, secret_name))
+
+    def __get_secret(self, vault_name: str, secret_name: str) -> str:
         vault_url = context.get_vault_url(vault_name)
-        client = SecretClient(vault_url=vault_url, credential=self.credential)
+        client = self._get_data_client(SecretClient, vault_url)
         try:
             secret = client.get_secret(secret_name)
             return secret.value
@@ -1,15 +1,22 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from azure.mgmt.resource import ResourceManagementClient
 from azure.core.exceptions import ResourceNotFoundError, HttpResponseError
 from deploy.utils import log
 from .base import Base
 
 class ResourceGroup(Base):
+    # (サブスクリプション, リソースプロバイダー名前空間) -> {リソースタイプ: API バージョン}
+    _api_versions = {}
+    _api_versions_lock = threading.Lock()
+
     def __init__(self, subscription_id):
         super().__init__(subscription_id)
         self._set_clients()
     
     def _set_clients(self):
-        self._resource_client = ResourceManagementClient(self.credential, self.subscription_id)
+        self._resource_client = self._get_client(ResourceManagementClient)
 
     def check_resource_group_exists(self, rg_name):
         try:
@@ -32,13 +39,116 @@ class ResourceGroup(Base):
             log.error(f"An error occurred while creating the resource group: {e}")
             raise e
         
-    def delete_resource_group(self, rg_name: str):
+    def delete_resource_group(self, rg_name: str, progress_interval: float = 15):
+        """
+        Deletes the resource group and waits for the deletion, logging the progress.
+        """
         try:
             delete_async_operation = self._resource_client.resource_groups.begin_delete(rg_name)
-            delete_async_operation.wait()
+            start = time.monotonic()
+            while not delete_async_operation.done():
+                delete_async_operation.wait(timeout=progress_interval)
+                if not delete_async_operation.done():
+                    log.info(f"Deleting resource group {rg_name}... ({time.monotonic() - start:.0f}s)")
+            delete_async_operation.result()
+            log.info(f"Resource group {rg_name} deleted ({time.monotonic() - start:.0f}s).")
             return True
         except ResourceNotFoundError:
             log.info(f"Resource group {rg_name} not found.")
         except HttpResponseError as e:
             log.info(f"An error occurred while deleting the resource group: {e}")
             raise e
+
+    def begin_delete_resource_group(self, rg_name: str) -> bool:
+        """
+        Starts deleting the resource group without waiting. Use get_resource_group_state to follow it.
+
+        Returns:
+            bool: False if the resource group does not exist
+        """
+        try:
+            self._resource_client.resource_groups.begin_delete(rg_name, polling=False)
+            return True
+        except ResourceNotFoundError:
+            log.info(f"Resource group {rg_name} not found.")
+            return False
+        except HttpResponseError as e:
+            log.error(f"An error occurred while deleting the resource group: {e}")
+            raise e
+
+    def get_resource_group_state(self, rg_name: str) -> str:
+        """
+        Returns the provisioning state of the resource group ('Deleting' while it is being deleted),
+        or None when it does not exist.
+        """
+        try:
+            return self._resource_client.resource_groups.get(rg_name).properties.provisioning_state
+        except ResourceNotFoundError:
+            return None
+        except HttpResponseError as e:
+            log.error(f"An error occurred while getting the resource group: {e}")
+            raise e
+
+    def delete_resources_by_id(self, resource_ids: list, max_workers: int = 8) -> list:
+        """
+        Deletes resources in parallel. Nested resources are tried first; a resource that cannot be
+        deleted yet (e.g. still in use by another one of the list) is retried after the others.
+
+        Args:
+            resource_ids (list): Resource IDs
+            max_workers (int): Maximum number of concurrent deletions
+
+        Returns:
+            list: Deleted resource IDs (including the ones that were already gone)
+
+        Raises:
+            Exception: The error of a resource that could not be deleted in a round without progress.
+        """
+        pending = sorted(set(resource_ids), key=lambda resource_id: resource_id.count('/'), reverse=True)
+        deleted = []
+        while pending:
+            with ThreadPoolExecutor(max_workers=max(min(max_workers, len(pending)), 1)) as executor:
+                errors = list(executor.map(self.__try_delete_resource, pending))
+            failed = [(resource_id, error) for resource_id, error in zip(pending, errors) if error is not None]
+            deleted += [resource_id for resource_id, error in zip(pending, errors) if error is None]
+            if len(failed) == len(pending):
+                log.error(f"Failed to delete {len(failed)} resource(s): {', '.join(r for r, _ in failed)}")
+                raise failed[0][1]
+            pending = [resource_id for resource_id, _ in failed]
+        return deleted
+
+    def delete_resource_by_id(self, resource_id: str):
+        """
+        Deletes one resource and waits for the deletion.
+        """
+        api_version = self.__get_api_version(resource_id)
+        log.info(f"Deleting resource: {resource_id}")
+        self._resource_client.resources.begin_delete_by_id(resource_id, api_version).result()
+
+    def __try_delete_resource(self, resource_id: str):
+        try:
+            self.delete_resource_by_id(resource_id)
+            return None
+        except ResourceNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Could not delete {resource_id} yet: {e}")
+            return e
+
+    def __get_api_version(self, resource_id: str) -> str:
+        # 拡張リソース (ロール割り当て等) は最後の providers 以降で判定する
+        provider_path = resource_id.rsplit('/providers/', 1)[1].split('/')
+        namespace = provider_path[0]
+        resource_type = '/'.join(provider_path[1::2])
+        key = (self.subscription_id, namespace.lower())
+        with self._api_versions_lock:
+            if key not in self._api_versions:
+                provider = self._resource_client.providers.get(namespace)
+                self._api_versions[key] = {
+                    rt.resource_type.lower(): next((v for v in rt.api_versions if 'preview' not in v), rt.api_versions[0])
+                    for rt in provider.resource_types if rt.api_versions
+                }
+            api_versions = self._api_versions[key]
+        if resource_type.lower() not in api_versions:
+            raise ValueError(f"No API version found for the resource type {namespace}/{resource_type}")
+        return api_versions[resource_type.lower()]
@@ -8,10 +8,10 @@ class SqlDb(Base):
         self._set_clients()
     
     def _set_clients(self):
-        self._sql_client = MySQLManagementClient(self.credential, self.subscription_id)
+        self._sql_client = self._get_client(MySQLManagementClient)
 
     def find_sql_db_by_prefix(self, resource_group_name, env_name) -> str:
-        prefix = context.get_sql_db_name_prefix(env_name)
+        prefix = context.get_sql_name_prefix(env_name)
         try:
             dbs = self._sql_client.servers.list_by_resource_group(resource_group_name)
             for db in dbs:
@@ -1,18 +1,20 @@
-from azure.mgmt.containerregistry import ContainerRegistryManagementClient
 from azure.mgmt.storage import StorageManagementClient
 from azure.core.exceptions import HttpResponseError
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from concurrent.futures import ThreadPoolExecutor
 from .base import Base
-from deploy.utils import context, log
+from deploy.utils import context, log, files
 import os
 
 class StorageAccount(Base):
+    BLOCK_SIZE = files.BLOB_BLOCK_SIZE
+
     def __init__(self, subscription_id):
         super().__init__(subscription_id)
         self._set_clients()
     
     def _set_clients(self):
-        self._storage_client = StorageManagementClient(self.credential, self.subscription_id)
+        self._storage_client = self._get_client(StorageManagementClient)
 
     def find_storage_account_by_prefix(self, resource_group_name, env_name) -> str:
         prefix = context.get_storage_account_name_prefix(env_name)
@@ -29,7 +31,7 @@ class StorageAccount(Base):
     def upload_file_to_container(self, account_name, container_name, file_path) -> bool:
         try:
             account_url = context.get_storage_account_url(account_name)
-            blob_service_client = BlobServiceClient(account_url=account_url, credential=self.credential)
+            blob_service_client = self._get_blob_service_client(account_url)
             blob_name = os.path.basename(file_path)
             blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
             with open(file_path, "rb") as data:
@@ -38,3 +40,57 @@ class StorageAccount(Base):
         except Exception as e:
             log.error(f"An error occurred while uploading the file to the container: {e}")
             raise e
+
+    def sync_directory(self, account_name: str, container_name: str, dir_path: str,
+                       delete: bool = False, max_concurrency: int = 8) -> dict:
+        """
+        Synchronizes the files of a directory to a blob container.
+
+        Only files whose MD5 differs from the Content-MD5 of the blob are uploaded (overwriting the blob).
+        Files are uploaded concurrently, and large files are uploaded as parallel blocks.
+
+        Args:
+            account_name (str): Storage account name
+            container_name (str): Container name
+            dir_path (str): Local directory
+            delete (bool): Delete blobs that do not exist in the directory
+            max_concurrency (int): Maximum number of concurrent uploads
+
+        Returns:
+            dict: {'uploaded': list, 'unchanged': list, 'deleted': list} of blob names
+        """
+        try:
+            account_url = context.get_storage_account_url(account_name)
+            container_client = self._get_blob_service_client(account_url).get_container_client(container_name)
+            remote_md5s = {blob.name: bytes(blob.content_settings.content_md5 or b'')
+                           for blob in container_client.list_blobs()}
+            local_md5s = {file_name: files.get_file_md5(os.path.join(dir_path, file_name))
+                          for file_name in files.get_file_names(dir_path)}
+
+            changed, orphaned = files.diff_md5s(local_md5s, remote_md5s, delete)
+
+            def upload(file_name: str):
+                log.info(f"Uploading file {file_name} to the container {container_name} in the storage account {account_name}")
+                with open(os.path.join(dir_path, file_name), 'rb') as data:
+                    container_client.upload_blob(file_name, data, overwrite=True, max_concurrency=4,
+                                                 content_settings=ContentSettings(content_md5=local_md5s[file_name]))
+
+            def remove(blob_name: str):
+                log.info(f"Deleting blob {blob_name} from the container {container_name} in the storage account {account_name}")
+                container_client.delete_blob(blob_name)
+
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                list(executor.map(upload, changed))
+                list(executor.map(remove, orphaned))
+            return {
+                'uploaded': changed,
+                'unchanged': [name for name in local_md5s if name not in changed],
+                'deleted': orphaned
+            }
+        except Exception as e:
+            log.error(f"An error occurred while synchronizing {dir_path} to the container: {e}")
+            raise e
+
+    def _get_blob_service_client(self, account_url: str) -> BlobServiceClient:
+        return self._get_data_client(BlobServiceClient, account_url,
+                                     max_single_put_size=self.BLOCK_SIZE, max_block_size=self.BLOCK_SIZE)
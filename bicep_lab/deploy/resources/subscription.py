@@ -8,7 +8,7 @@ class Subscription(Base):
         self._set_clients()
     
     def _set_clients(self):
-        self._subscription_client = SubscriptionClient(self.credential)
+        self._subscription_client = self._get_client(SubscriptionClient, scoped=False)
     
     def get_subscription_info(self):
         try:
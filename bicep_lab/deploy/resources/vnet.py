@@ -3,14 +3,22 @@ from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
 from azure.mgmt.network.models import VirtualNetwork
 from .base import Base
 from deploy.utils import log
+from deploy.utils.cidr_index import CidrIndex, is_subnet_of
+import threading
+import time
 
 class Vnet(Base):
+    # サブスクリプション全体のVNetアドレス空間のインデックス (サブスクリプションID -> (作成時刻, インデックス))
+    CIDR_INDEX_TTL_SECONDS = 300
+    _cidr_indexes = {}
+    _cidr_indexes_lock = threading.Lock()
+
     def __init__(self, subscription_id):
         super().__init__(subscription_id)
         self._set_clients()
     
     def _set_clients(self):
-        self._network_client = NetworkManagementClient(self.credential, self.subscription_id)
+        self._network_client = self._get_client(NetworkManagementClient)
     
     def get_vnet_by_name(self, rg_name: str, vnet_name: str) -> VirtualNetwork:
         try:
@@ -24,28 +32,83 @@ class Vnet(Base):
             log.error(f"An error occurred while checking the VNet: {e}")
             raise e
     
-    def check_vnet_cidr_availability(self, cidr: str) -> bool:
-        try:
-            vnets = self._network_client.virtual_networks.list_all()
-            address_spaces = [address_space for vnet in vnets for address_space in vnet.address_space.address_prefixes]
-            if cidr in address_spaces:
-                return False
-            return True
-        except Exception as e:
-            log.error(f"An error occurred while checking the CIDR availability: {e}")
-            raise e
-    
-    def check_subnet_cidr_availability(self, vnet_name: str, rg_name: str, cidr: str) -> bool:
+    def get_cidr_index(self, refresh: bool = False) -> CidrIndex:
+        """
+        Returns the index of every VNet address space in the subscription.
+        The VNets are streamed page by page and the index is cached for CIDR_INDEX_TTL_SECONDS.
+        """
+        with Vnet._cidr_indexes_lock:
+            cached = Vnet._cidr_indexes.get(self.subscription_id)
+            if cached and not refresh and time.monotonic() - cached[0] < self.CIDR_INDEX_TTL_SECONDS:
+                return cached[1]
+            try:
+                index = CidrIndex()
+                for vnet in self._network_client.virtual_networks.list_all():
+                    for address_prefix in (vnet.address_space.address_prefixes if vnet.address_space else []):
+                        index.add(address_prefix, vnet.id)
+            except Exception as e:
+                log.error(f"An error occurred while listing the VNets: {e}")
+                raise e
+            Vnet._cidr_indexes[self.subscription_id] = (time.monotonic(), index)
+            return index
+
+    def check_vnet_cidr_availability(self, cidr: str, exclude_vnet_id: str = None) -> bool:
+        """
+        Returns False if the CIDR overlaps the address space of any VNet in the subscription.
+
+        Args:
+            cidr (str): Address block to check
+            exclude_vnet_id (str): VNet to ignore (e.g. the VNet being updated)
+        """
+        conflicts = self.get_cidr_index().overlaps(cidr, exclude_owner=exclude_vnet_id)
+        for network, vnet_id in conflicts:
+            log.info(f"CIDR {cidr} overlaps {network} of {vnet_id}")
+        return not conflicts
+
+    def suggest_vnet_cidr(self, prefixlen: int, within: str = '10.0.0.0/8', exclude_vnet_id: str = None) -> str:
+        """
+        Returns the first block of the requested size that no VNet in the subscription uses, or ''.
+        """
+        return self.get_cidr_index().next_free(prefixlen, within, exclude_owner=exclude_vnet_id)
+
+    def get_subnet_cidr_index(self, vnet_name: str, rg_name: str) -> CidrIndex:
         try:
-            subnets = self._network_client.subnets.list(rg_name, vnet_name)
-            subnet_cidrs = [subnet.address_prefix for subnet in subnets]
-            if cidr in subnet_cidrs:
-                return False
-            return True
+            index = CidrIndex()
+            for subnet in self._network_client.subnets.list(rg_name, vnet_name):
+                for address_prefix in (subnet.address_prefixes or [subnet.address_prefix]):
+                    if address_prefix:
+                        index.add(address_prefix, subnet.name)
+            return index
         except Exception as e:
-            log.error(f"An error occurred while checking the CIDR availability: {e}")
+            log.error(f"An error occurred while listing the subnets: {e}")
             raise e
 
+    def check_subnet_cidr_availability(self, vnet_name: str, rg_name: str, cidr: str,
+                                       exclude_subnet_name: str = None) -> bool:
+        """
+        Returns False if the CIDR overlaps any subnet of the VNet.
+
+        Args:
+            vnet_name (str): VNet name
+            rg_name (str): Resource group name
+            cidr (str): Address block to check
+            exclude_subnet_name (str): Subnet to ignore (e.g. the subnet being updated)
+        """
+        conflicts = self.get_subnet_cidr_index(vnet_name, rg_name).overlaps(cidr, exclude_owner=exclude_subnet_name)
+        for network, subnet_name in conflicts:
+            log.info(f"CIDR {cidr} overlaps {network} of subnet {subnet_name}")
+        return not conflicts
+
+    def suggest_subnet_cidr(self, vnet_name: str, rg_name: str, prefixlen: int, within: str,
+                            exclude_subnet_name: str = None) -> str:
+        """
+        Returns the first block of the requested size inside `within` that no subnet of the VNet uses, or ''.
+        """
+        index = self.get_subnet_cidr_index(vnet_name, rg_name)
+        return index.next_free(prefixlen, within, exclude_owner=exclude_subnet_name)
+
+    is_subnet_of = staticmethod(is_subnet_of)
+
     def delete_vnet(self, rg_name: str, vnet_name: str) -> bool:
         try:
             delete_async_operation = self._network_client.virtual_networks.begin_delete(rg_name, vnet_name)
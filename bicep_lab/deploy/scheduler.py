@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from deploy.utils import log, trace
+
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+class Continuation():
+    """
+    Returned by a run_dag worker that started a long-running operation instead of waiting for it.
+
+    The task does not hold a worker thread while `future` is pending. When it is done,
+    `then(result)` runs on a worker thread and its return value (which may be another
+    Continuation) becomes the task result. Without `then`, the result of the future is the task result.
+    A worker may also return a plain Future, which is the same as Continuation(future).
+    """
+    def __init__(self, future: Future, then=None):
+        self.future = future
+        self.then = then
+
+def run_dag(tasks: list, dependencies: dict, worker, max_workers: int = None, category: str = 'task') -> dict:
+    """
+    Runs worker(task) for every task as soon as all of its own dependencies have finished.
+
+    Dependencies that are not part of `tasks` are treated as already satisfied.
+    When a task fails, every task that depends on it (directly or transitively) is skipped.
+
+    Args:
+        tasks (list): Task names. The order is used as the submission order for ready tasks.
+        dependencies (dict): Task name -> list of task names it depends on.
+        worker (callable): Function called with a task name. May return a Future or a Continuation.
+        max_workers (int): Maximum number of worker threads. Tasks waiting on a Future do not use one.
+        category (str): Trace category of the task spans (e.g. 'prepare', 'deploy').
+
+    Returns:
+        dict: Task name -> {'status': str, 'result': any, 'error': Exception}
+    """
+    pending = {task: [dep for dep in dependencies.get(task, []) if dep in tasks] for task in tasks}
+    __topological_order(pending)
+
+    results = {}
+    # Future -> (タスク名, タスクのスパン, 完了待ちの Continuation (ワーカー実行中は None))
+    running = {}
+    contexts = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for task in [task for task in tasks if task in pending]:
+                deps = pending[task]
+                blocked_by = [dep for dep in deps if dep in results and results[dep]['status'] != STATUS_SUCCEEDED]
+                if blocked_by:
+                    log.warning(f"Skipping {task} because its dependencies did not succeed: {', '.join(blocked_by)}")
+                    results[task] = {'status': STATUS_SKIPPED, 'result': None, 'error': None}
+                    del pending[task]
+                elif all(dep in results for dep in deps):
+                    queued = trace.tracer.start_span(task, 'queue', component=task)
+                    contexts[task] = contextvars.copy_context()
+                    future = executor.submit(contexts[task].run, __run_step, worker, task, task, category, None, queued)
+                    running[future] = (task, None, None)
+                    del pending[task]
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, span, continuation = running.pop(future)
+                try:
+                    if continuation is None:
+                        value, span = future.result()
+                    elif continuation.then is not None:
+                        next_step = executor.submit(contexts[task].run, __run_step, continuation.then, future.result(),
+                                                    task, category, span)
+                        running[next_step] = (task, span, None)
+                        continue
+                    else:
+                        value = future.result()
+                        span.end = time.perf_counter()
+                    if isinstance(value, Continuation):
+                        running[value.future] = (task, span, value)
+                        continue
+                    results[task] = {'status': STATUS_SUCCEEDED, 'result': value, 'error': None}
+                except Exception as e:
+                    if span is not None and span.end is None:
+                        span.attrs['error'] = str(e)
+                        span.end = time.perf_counter()
+                    log.error(f"Error running task: {task}")
+                    log.error(e)
+                    results[task] = {'status': STATUS_FAILED, 'result': None, 'error': e}
+    return results
+
+async def run_dag_async(tasks: list, dependencies: dict, worker, max_concurrency: int = None, category: str = 'task') -> dict:
+    """
+    asyncio version of run_dag. `worker` is a coroutine function and every task runs on the current event loop.
+
+    Args:
+        tasks (list): Task names.
+        dependencies (dict): Task name -> list of task names it depends on.
+        worker (callable): Coroutine function called with a task name.
+        max_concurrency (int): Maximum number of workers running at the same time.
+        category (str): Trace category of the task spans (e.g. 'prepare', 'deploy').
+
+    Returns:
+        dict: Task name -> {'status': str, 'result': any, 'error': Exception}
+    """
+    graph = {task: [dep for dep in dependencies.get(task, []) if dep in tasks] for task in tasks}
+    order = __topological_order(graph)
+    semaphore = asyncio.Semaphore(max_concurrency or max(len(tasks), 1))
+    results = {}
+    runners = {}
+
+    async def run(task: str):
+        await asyncio.gather(*(runners[dep] for dep in graph[task]))
+        blocked_by = [dep for dep in graph[task] if results[dep]['status'] != STATUS_SUCCEEDED]
+        if blocked_by:
+            log.warning(f"Skipping {task} because its dependencies did not succeed: {', '.join(blocked_by)}")
+            results[task] = {'status': STATUS_SKIPPED, 'result': None, 'error': None}
+            return
+        queued = trace.tracer.start_span(task, 'queue', component=task)
+        async with semaphore:
+            queued.end = time.perf_counter()
+            try:
+                with trace.span(task, category, component=task):
+                    result = await worker(task)
+                results[task] = {'status': STATUS_SUCCEEDED, 'result': result, 'error': None}
+            except Exception as e:
+                log.error(f"Error running task: {task}")
+                log.error(e)
+                results[task] = {'status': STATUS_FAILED, 'result': None, 'error': e}
+
+    # 依存先のタスクを先に作成する
+    for task in order:
+        runners[task] = asyncio.ensure_future(run(task))
+    await asyncio.gather(*runners.values())
+    return results
+
+def __run_step(fn, arg, task: str, category: str, span, queued=None):
+    # キュー待ちの終了を記録してからタスク (またはその続き) を実行する
+    if queued is not None:
+        queued.end = time.perf_counter()
+    if span is None:
+        span = trace.tracer.start_span(task, category, component=task)
+    try:
+        with trace.tracer.activate(span):
+            value = fn(arg)
+    except Exception as e:
+        span.attrs['error'] = str(e)
+        span.end = time.perf_counter()
+        raise
+    if isinstance(value, Future):
+        value = Continuation(value)
+    # 長時間の操作を待つ場合はスパンを続ける
+    if not isinstance(value, Continuation):
+        span.end = time.perf_counter()
+    return value, span
+
+def __topological_order(graph: dict) -> list:
+    # 循環依存があれば ValueError を送出する
+    visiting, visited = set(), []
+
+    def visit(node, path):
+        if node in visited:
+            return
+        if node in visiting:
+            raise ValueError(f"Circular dependency detected: {' -> '.join(path + [node])}")
+        visiting.add(node)
+        for dep in graph.get(node, []):
+            visit(dep, path + [node])
+        visiting.remove(node)
+        visited.append(node)
+
+    for node in graph:
+        visit(node, [])
+    return visited
@@ -0,0 +1,73 @@
+from deploy.utils import log, context, trace
+from deploy.utils.state import StateStore, get_state_dir
+from deploy.resources.inventory import NAMES_SECTION
+from deploy.resources import Bicep, Vnet, ResourceGroup
+from deploy.common import component_dependencies, default_max_workers
+from deploy import scheduler
+
+def run_undeploy(conf: dict, sorted_components: list) -> dict:
+    """
+    Deletes the resources of the components, dependents first.
+
+    A component is deleted after every selected component that depends on it
+    (e.g. front before back, dev_vm before vnet). Components that nothing selected
+    depends on any more are deleted in parallel.
+
+    Args:
+        conf (dict): Configuration of the environment
+        sorted_components (list): Components to delete
+
+    Returns:
+        dict: Component name -> {'status', 'result', 'error'}
+    """
+    with trace.span(conf['env_name'], 'run'):
+        return __run_undeploy(conf, sorted_components)
+
+def get_reverse_dependencies(components: list) -> dict:
+    """
+    Returns component -> components that must be deleted before it (its dependents among the given components).
+    """
+    return {
+        component: [dependent for dependent in components if component in component_dependencies.get(dependent, [])]
+        for component in components
+    }
+
+def __run_undeploy(conf: dict, sorted_components: list) -> dict:
+    env_name = conf['env_name']
+    rg_name = context.get_main_rg_name(env_name)
+    bicep = Bicep(conf['subscription_id'])
+    resource_group = ResourceGroup(conf['subscription_id'])
+    state = StateStore(get_state_dir(conf), conf['subscription_id'], env_name)
+
+    def delete_component(component: str):
+        """
+        Deletes the resources created by the component's deployment, then the deployment itself.
+        """
+        deploy_name = context.get_deployment_name(env_name, component)
+        log.info(f"Deleting component: {component}")
+        resource_ids = bicep.get_output_resource_ids(rg_name, deploy_name)
+        if resource_ids is None:
+            resource_ids = []
+            log.warning(f"Deployment {deploy_name} not found. Only known resources of {component} are deleted.")
+        deleted = []
+        if component == 'vnet':
+            # VNet はサブネットごと削除する
+            vnet_name = context.get_vnet_name(env_name)
+            Vnet(conf['subscription_id']).delete_vnet(rg_name, vnet_name)
+            vnet_id = f"/providers/Microsoft.Network/virtualNetworks/{vnet_name}".lower()
+            deleted += [resource_id for resource_id in resource_ids if vnet_id in resource_id.lower()]
+            resource_ids = [resource_id for resource_id in resource_ids if vnet_id not in resource_id.lower()]
+        deleted += resource_group.delete_resources_by_id(resource_ids)
+        bicep.delete_deployment(rg_name, deploy_name)
+        state.delete('fingerprints', component)
+        state.delete('outputs', component)
+        state.delete(NAMES_SECTION, component)
+        log.info(f"Successfully deleted component: {component} ({len(deleted)} resources)")
+        return deleted
+
+    max_workers = conf.get('max_workers') or default_max_workers
+    results = scheduler.run_dag(sorted_components, get_reverse_dependencies(sorted_components), delete_component,
+                                max_workers=max_workers, category='undeploy')
+    for component in sorted_components:
+        log.info(f"{component}: {results[component]['status']}")
+    return results
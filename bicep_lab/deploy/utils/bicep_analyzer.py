@@ -0,0 +1,206 @@
+import os
+import re
+
+# param <名前> <型> [= <既定値>]
+__PARAM_PATTERN__ = re.compile(r"^param\s+(\w+)\s+(.+?)(?:\s*=\s*(.+))?$")
+# resource <シンボル> '<型>@<API バージョン>' [existing] = ... / module <シンボル> '<パス>' = ...
+__DECLARATION_PATTERN__ = re.compile(r"^(resource|module)\s+(\w+)\s+'([^']+)'\s+(existing\s+)?=")
+__PROPERTY_PATTERN__ = re.compile(r"^(\w+)\s*:\s*(.+)$")
+__LITERAL_PATTERN__ = re.compile(r"^'([^'$]*)'$")
+__IDENTIFIER_PATTERN__ = re.compile(r"^[A-Za-z_]\w*$")
+
+def parse_template(file_path: str) -> dict:
+    """
+    Reads the declarations of a Bicep file that matter for the deployment order.
+
+    This is a line based reader for the templates of this repository, not a full Bicep parser:
+    declarations must start a line and the `name` and `params` properties must be on one line.
+
+    Returns:
+        dict: {
+            'params': name -> {'type', 'default'} (default is the expression, or None if required),
+            'resources': list of {'symbol', 'type', 'existing', 'name'},
+            'modules': list of {'symbol', 'path', 'params'} (params: module parameter -> expression)
+        }
+    """
+    with open(file_path, 'r', encoding='utf-8') as bicep_file:
+        lines = __strip_comments(bicep_file.read()).splitlines()
+    template = {'params': {}, 'resources': [], 'modules': []}
+    declaration = None
+    depth = 0
+    in_params = False
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if depth == 0:
+            declaration = None
+            match = __PARAM_PATTERN__.match(line)
+            if match:
+                template['params'][match.group(1)] = {'type': match.group(2), 'default': match.group(3)}
+            match = __DECLARATION_PATTERN__.match(line)
+            if match and match.group(1) == 'resource':
+                declaration = {'symbol': match.group(2), 'type': match.group(3).split('@')[0],
+                               'existing': bool(match.group(4)), 'name': None}
+                template['resources'].append(declaration)
+            elif match:
+                declaration = {'symbol': match.group(2), 'path': match.group(3), 'params': {}}
+                template['modules'].append(declaration)
+        elif declaration is not None:
+            match = __PROPERTY_PATTERN__.match(line)
+            if match and depth == 1:
+                in_params = match.group(1) == 'params' and 'path' in declaration
+                if match.group(1) == 'name' and 'type' in declaration:
+                    declaration['name'] = match.group(2)
+            elif match and depth == 2 and in_params:
+                declaration['params'][match.group(1)] = match.group(2)
+        # 文字列中の '${...}' は同じ行で閉じるため、そのまま数えてよい
+        depth += line.count('{') + line.count('[') - line.count('}') - line.count(']')
+    return template
+
+def analyze(bicep_dir_path: str, deploy_files: dict) -> dict:
+    """
+    Derives, for each component, the parameters of its template and the components it depends on.
+
+    A component depends on another one when its template (or one of its modules) references an
+    `existing` resource that the other component's template creates. The reference is matched on
+    the resource type and, when several components create that type, on the name (same parameter
+    name, or the same literal). Resources created by the component itself are not dependencies.
+
+    Args:
+        bicep_dir_path (str): Directory of the Bicep files.
+        deploy_files (dict): Component name -> template file name
+
+    Returns:
+        dict: Component name -> {
+            'template': file path,
+            'params': name -> {'type', 'default'},
+            'required': set of parameters without a default value,
+            'dependencies': set of component names,
+            'unresolved': list of (resource type, name) not created by any component, or by several,
+            'errors': list of messages (missing template or module)
+        }
+    """
+    trees = {}
+    for component, file_name in deploy_files.items():
+        errors = []
+        created, existing = __collect(os.path.join(bicep_dir_path, file_name), {}, set(), errors)
+        trees[component] = {'created': created, 'existing': existing, 'errors': errors}
+
+    analysis = {}
+    for component, file_name in deploy_files.items():
+        file_path = os.path.join(bicep_dir_path, file_name)
+        params = parse_template(file_path)['params'] if os.path.isfile(file_path) else {}
+        dependencies = set()
+        unresolved = []
+        for resource_type, aliases in trees[component]['existing']:
+            if __find_creators({component: trees[component]}, resource_type, aliases, by_name=True):
+                continue
+            others = {name: tree for name, tree in trees.items() if name != component}
+            creators = __resolve(others, resource_type, aliases)
+            if creators:
+                dependencies.update(creators)
+            else:
+                unresolved.append((resource_type, __describe(aliases)))
+        analysis[component] = {
+            'template': file_path,
+            'params': params,
+            'required': {name for name, param in params.items() if param['default'] is None},
+            'dependencies': dependencies,
+            'unresolved': unresolved,
+            'errors': trees[component]['errors']
+        }
+    return analysis
+
+def __collect(file_path: str, substitutions: dict, seen: set, errors: list) -> tuple:
+    # テンプレートとそのモジュールが作成するリソースと参照する既存リソース ((型, 名前の別名) のリスト)
+    if not os.path.isfile(file_path):
+        errors.append(f"Template not found: {file_path}")
+        return [], []
+    if file_path in seen:
+        return [], []
+    template = parse_template(file_path)
+    created = []
+    existing = []
+    for resource in template['resources']:
+        aliases = __get_aliases(resource['name'], template['params'], substitutions)
+        (existing if resource['existing'] else created).append((resource['type'], aliases))
+    for module in template['modules']:
+        # レジストリ (br:, ts:) のモジュールは対象外
+        if ':' in module['path']:
+            continue
+        module_substitutions = {name: __get_aliases(expression, template['params'], substitutions)
+                                for name, expression in module['params'].items()}
+        module_created, module_existing = __collect(os.path.join(os.path.dirname(file_path), module['path']),
+                                                    module_substitutions, seen | {file_path}, errors)
+        created += module_created
+        existing += module_existing
+    return created, existing
+
+def __get_aliases(expression: str, params: dict, substitutions: dict) -> frozenset:
+    # 同じリソースを指す名前の表現 (パラメータ名、既定値のリテラル) の集合
+    if expression is None:
+        return frozenset()
+    expression = expression.strip()
+    match = __LITERAL_PATTERN__.match(expression)
+    if match:
+        return frozenset({('literal', match.group(1))})
+    if __IDENTIFIER_PATTERN__.match(expression) and expression in params:
+        if expression in substitutions:
+            return substitutions[expression]
+        aliases = {('param', expression)}
+        default = params[expression]['default']
+        match = __LITERAL_PATTERN__.match(default.strip()) if default else None
+        if match:
+            aliases.add(('literal', match.group(1)))
+        return frozenset(aliases)
+    return frozenset({('expression', re.sub(r'\s+', '', expression))})
+
+def __resolve(trees: dict, resource_type: str, aliases: frozenset) -> set:
+    while '/' in resource_type:
+        creators = __find_creators(trees, resource_type, aliases, by_name=False)
+        if creators:
+            named = __find_creators(trees, resource_type, aliases, by_name=True)
+            if named:
+                return named
+            # 名前で絞り込めない場合、作成するコンポーネントが一つなら依存先とする
+            return creators if len(creators) == 1 else set()
+        # 子リソース (例: virtualNetworks/subnets) は親リソースを作成するコンポーネントに依存する
+        resource_type = resource_type.rsplit('/', 1)[0]
+    return set()
+
+def __find_creators(trees: dict, resource_type: str, aliases: frozenset, by_name: bool) -> set:
+    return {component for component, tree in trees.items()
+            if any(created_type.lower() == resource_type.lower() and (not by_name or aliases & created_aliases)
+                   for created_type, created_aliases in tree['created'])}
+
+def __describe(aliases: frozenset) -> str:
+    return ' / '.join(sorted(value for _, value in aliases)) or '?'
+
+def __strip_comments(text: str) -> str:
+    # 文字列 ('https://...' など) の中の // はコメントではない
+    result = []
+    index = 0
+    in_string = False
+    while index < len(text):
+        char = text[index]
+        if in_string:
+            if char == '\\':
+                result.append(text[index:index + 2])
+                index += 2
+                continue
+            if char == "'":
+                in_string = False
+        elif char == "'":
+            in_string = True
+        elif text.startswith('//', index):
+            end = text.find('\n', index)
+            index = len(text) if end == -1 else end
+            continue
+        elif text.startswith('/*', index):
+            end = text.find('*/', index + 2)
+            index = len(text) if end == -1 else end + 2
+            continue
+        result.append(char)
+        index += 1
+    return ''.join(result)
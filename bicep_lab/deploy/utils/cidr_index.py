@@ -0,0 +1,113 @@
+import bisect
+import ipaddress
+import threading
+
+class CidrIndex():
+    """
+    Interval index over IP address blocks.
+
+    Blocks are kept sorted by their first address together with a running maximum of
+    their last address, so overlap queries only visit the blocks that can overlap.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._entries = {4: [], 6: []}
+        self._starts = {4: [], 6: []}
+        self._max_ends = {4: [], 6: []}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values()) + len(self._pending)
+
+    def add(self, cidr: str, owner: str = None):
+        """
+        Adds an address block.
+
+        Args:
+            cidr (str): Address block (e.g. '10.0.0.0/16')
+            owner (str): Identifier of the resource that uses the block (e.g. a VNet ID)
+        """
+        self._pending.append((ipaddress.ip_network(cidr, strict=False), owner))
+
+    def overlaps(self, cidr: str, exclude_owner: str = None) -> list:
+        """
+        Returns the blocks that overlap the given block.
+
+        Args:
+            cidr (str): Address block to check
+            exclude_owner (str): Owner whose blocks are ignored (e.g. the VNet being updated)
+
+        Returns:
+            list: (network, owner) tuples
+        """
+        network = ipaddress.ip_network(cidr, strict=False)
+        return [entry for entry in self.__overlapping(network) if exclude_owner is None or entry[1] != exclude_owner]
+
+    def is_available(self, cidr: str, exclude_owner: str = None) -> bool:
+        return not self.overlaps(cidr, exclude_owner)
+
+    def next_free(self, prefixlen: int, within: str = '10.0.0.0/8', exclude_owner: str = None) -> str:
+        """
+        Returns the first free block of the requested size inside `within`, or '' if there is none.
+
+        Args:
+            prefixlen (int): Prefix length of the requested block (e.g. 16)
+            within (str): Address range to search
+            exclude_owner (str): Owner whose blocks are ignored
+        """
+        area = ipaddress.ip_network(within, strict=False)
+        if prefixlen < area.prefixlen or prefixlen > area.max_prefixlen:
+            raise ValueError(f"Prefix length /{prefixlen} does not fit in {within}")
+        block_size = 2 ** (area.max_prefixlen - prefixlen)
+        candidate = int(area.network_address)
+        last = int(area.broadcast_address)
+        while candidate + block_size - 1 <= last:
+            network = ipaddress.ip_network((candidate, prefixlen))
+            conflicts = [entry for entry in self.__overlapping(network)
+                         if exclude_owner is None or entry[1] != exclude_owner]
+            if not conflicts:
+                return str(network)
+            # 衝突しているブロックの末尾の次の境界まで進める
+            conflict_end = max(int(entry[0].broadcast_address) for entry in conflicts)
+            candidate = (conflict_end // block_size + 1) * block_size
+        return ''
+
+    def __overlapping(self, network) -> list:
+        self.__build()
+        version = network.version
+        starts, max_ends, entries = self._starts[version], self._max_ends[version], self._entries[version]
+        first, last = int(network.network_address), int(network.broadcast_address)
+        result = []
+        position = bisect.bisect_right(starts, last) - 1
+        while position >= 0 and max_ends[position] >= first:
+            entry = entries[position]
+            if int(entry[0].broadcast_address) >= first:
+                result.append(entry)
+            position -= 1
+        return result
+
+    def __build(self):
+        with self._lock:
+            if self._pending:
+                self.__merge_pending()
+
+    def __merge_pending(self):
+        for network, owner in self._pending:
+            self._entries[network.version].append((network, owner))
+        self._pending = []
+        for version, entries in self._entries.items():
+            entries.sort(key=lambda entry: int(entry[0].network_address))
+            self._starts[version] = [int(entry[0].network_address) for entry in entries]
+            max_ends, current = [], -1
+            for entry in entries:
+                current = max(current, int(entry[0].broadcast_address))
+                max_ends.append(current)
+            self._max_ends[version] = max_ends
+
+def is_subnet_of(subnet_cidr: str, vnet_cidr: str) -> bool:
+    """
+    Returns True if the subnet block is inside the VNet block (of the same IP version).
+    """
+    subnet = ipaddress.ip_network(subnet_cidr, strict=False)
+    vnet = ipaddress.ip_network(vnet_cidr, strict=False)
+    return subnet.version == vnet.version and subnet.subnet_of(vnet)
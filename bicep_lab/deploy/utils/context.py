@@ -23,6 +23,9 @@ def get_dev_vm_name(env_name: str) -> str:
 def get_dev_vmss_name(env_name: str) -> str:
     return f"{env_name}-dev-vmss"
 
+def get_dev_vm_nsg_name(env_name: str) -> str:
+    return f"{env_name}-dev-vm-nsg"
+
 def get_apps_container_env_name(env_name: str) -> str:
     return f"{env_name}-apps-container-env"
 
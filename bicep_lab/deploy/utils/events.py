@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+from deploy.utils import log, trace
+
+# イベントの種類
+EVENT_DEPLOYMENT = 'deployment'
+EVENT_RESOURCE = 'resource'
+
+class EventBus():
+    """
+    Delivers progress events (e.g. the state of each resource of a deployment) to subscribers.
+
+    An event is a dict with `time`, `type`, `run` and `component` (taken from the current
+    trace span) and the fields given to emit(). Subscribers are called synchronously on the
+    emitting thread, so they must be quick. A subscriber that raises does not stop the others.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    @property
+    def active(self) -> bool:
+        """Whether anything is subscribed (producers can skip collecting events otherwise)."""
+        return bool(self._subscribers)
+
+    def subscribe(self, subscriber):
+        """
+        Args:
+            subscriber (callable): Called with each event.
+
+        Returns:
+            callable: Unsubscribes.
+        """
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return lambda: self.unsubscribe(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def emit(self, event_type: str, **fields):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        span = trace.current_span()
+        event = {
+            'time': time.time(),
+            'type': event_type,
+            'run': span.run if span else None,
+            'component': span.component if span else None,
+            **fields
+        }
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                log.debug(f"Event subscriber failed: {e}")
+
+    def close(self):
+        """Unsubscribes everything and closes the subscribers that have a close() method."""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            if hasattr(subscriber, 'close'):
+                subscriber.close()
+
+class JsonLinesWriter():
+    """
+    Subscriber that appends each event as one JSON line to a file.
+
+    Args:
+        file_path (str): Output file. Created (with its directory) if missing.
+    """
+    def __init__(self, file_path: str):
+        dir_path = os.path.dirname(file_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        self._file = open(file_path, 'a', encoding='utf-8')
+
+    def __call__(self, event: dict):
+        line = json.dumps(log.redact(event), default=str, ensure_ascii=False)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + '\n')
+            # 実行中に tail -f で追えるように行ごとに書き出す
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                log.info(f"Events written to {self._file_path}")
+
+def log_event(event: dict):
+    """
+    Subscriber that writes progress events to the console log.
+    """
+    prefix = f"[{event['run']}] " if event.get('run') else ''
+    name = event.get('component') or event.get('deployment')
+    if event['type'] == EVENT_RESOURCE:
+        duration = f" ({event['duration']:.1f}s)" if event.get('duration') is not None else ''
+        message = f"{prefix}{name}: {event['resource_type']}/{event['resource_name']} {event['state']}{duration}"
+        if event.get('error'):
+            log.error(f"{message}: {event['error']}")
+        else:
+            log.info(message)
+    elif event['type'] == EVENT_DEPLOYMENT:
+        log.info(f"{prefix}{name}: deployment {event['state']}")
+
+bus = EventBus()
+
+def emit(event_type: str, **fields):
+    bus.emit(event_type, **fields)
@@ -1,7 +1,8 @@
 import os
-import time
 import json
+import hashlib
 import tempfile
+from contextlib import contextmanager
 from deploy.utils import log
 
 def get_file_names(dir_path: str) -> list:
@@ -20,10 +21,97 @@ def get_file_names(dir_path: str) -> list:
         log.error(f"An error occurred while listing files in {dir_path}: {e}")
         raise e
 
-# パラメータを一時ファイルに書き出す関数
-def write_params_to_tempfile(tmp_path: str, params_dict: dict) -> str:
-    temp_file = tempfile.NamedTemporaryFile(dir=tmp_path, delete=False, suffix=".json", mode="w")
-    json.dump(params_dict, temp_file, indent=2)  # JSON ファイルとして書き込み
-    temp_file.close()  # ファイルを閉じて保存
-    time.sleep(10)  # 3秒待つ
-    return temp_file.name  # ファイルパスを返す
+def get_file_md5(file_path: str, chunk_size: int = 4 * 1024 * 1024) -> bytes:
+    """
+    Computes the MD5 digest of a file (the value Azure Storage keeps as Content-MD5).
+
+    Args:
+        file_path (str): The path of file.
+
+    Returns:
+        bytes: MD5 digest.
+    """
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+# 4MiB を超えるファイルは Blob のブロック単位で並列にアップロードする
+BLOB_BLOCK_SIZE = 4 * 1024 * 1024
+
+def diff_md5s(local_md5s: dict, remote_md5s: dict, delete: bool = False) -> tuple:
+    """
+    Compares the MD5 digests of local files with the Content-MD5 of the blobs.
+
+    Args:
+        local_md5s (dict): File name -> MD5 digest of the local files.
+        remote_md5s (dict): Blob name -> Content-MD5 of the blobs.
+        delete (bool): Also return the blobs that do not exist locally.
+
+    Returns:
+        tuple: (names of the changed or new files, names of the orphaned blobs)
+    """
+    changed = [name for name, md5 in local_md5s.items() if remote_md5s.get(name) != md5]
+    orphaned = [name for name in remote_md5s if name not in local_md5s] if delete else []
+    return changed, orphaned
+
+PARAMS_FILE_PREFIX = 'params-'
+
+@contextmanager
+def params_file(tmp_path: str, params_dict: dict):
+    """
+    Writes the parameters to a private JSON file and removes it when the block exits.
+
+    The file is fully written and fsynced before its path is handed out,
+    so the consumer never sees a partial file and no wait is required.
+
+    Args:
+        tmp_path (str): Directory for the parameter file.
+        params_dict (dict): Parameters formatted for Bicep.
+
+    Yields:
+        str: Path of the parameter file.
+    """
+    os.makedirs(tmp_path, exist_ok=True)
+    fd, file_path = tempfile.mkstemp(dir=tmp_path, prefix=f"{PARAMS_FILE_PREFIX}{os.getpid()}-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(params_dict, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        yield file_path
+    finally:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+def remove_stale_params_files(tmp_path: str):
+    """
+    Removes parameter files left behind by processes that are no longer running.
+
+    Args:
+        tmp_path (str): Directory for the parameter files.
+    """
+    if not os.path.isdir(tmp_path):
+        return
+    for file_name in get_file_names(tmp_path):
+        if not file_name.startswith(PARAMS_FILE_PREFIX):
+            continue
+        try:
+            pid = int(file_name[len(PARAMS_FILE_PREFIX):].split('-')[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not __is_process_alive(pid):
+            log.info(f"Removing stale parameter file: {file_name}")
+            os.remove(os.path.join(tmp_path, file_name))
+
+def __is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,42 @@
+import hmac
+import json
+import hashlib
+
+FINGERPRINT_TAG = 'fingerprint'
+# ARM テンプレートの secure なパラメータの型 (値は鍵付きハッシュに置き換える)
+SECURE_TYPES = ('securestring', 'secureobject')
+SECURE_VALUE_PREFIX = 'hmac-sha256:'
+
+def compute(template: dict, params: dict, key: bytes) -> str:
+    """
+    Computes the fingerprint of a component deployment.
+
+    The values of the secure parameters (securestring / secureObject in the compiled template) are
+    replaced by their HMAC with the environment key, because the fingerprint is stored in a deployment
+    tag and the state file. A rotated secret changes the fingerprint without its value being stored.
+
+    Args:
+        template (dict): Compiled ARM template.
+        params (dict): Parameters formatted for Bicep.
+        key (bytes): Secret key of the environment (see StateStore.get_key).
+
+    Returns:
+        str: SHA-256 hex digest of the template and the normalized parameters.
+    """
+    normalized = json.dumps({'template': template, 'parameters': mask_secure_params(template, params, key)},
+                            sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def mask_secure_params(template: dict, params: dict, key: bytes) -> dict:
+    """
+    Returns the parameters with the values of the secure parameters of the template replaced by their HMAC.
+    """
+    declared = template.get('parameters', {}) if isinstance(template, dict) else {}
+    return {name: {**param, 'value': __hash_secure_value(param.get('value'), key)}
+            if str(declared.get(name, {}).get('type', '')).lower() in SECURE_TYPES and isinstance(param, dict)
+            else param
+            for name, param in params.items()}
+
+def __hash_secure_value(value, key: bytes) -> str:
+    serialized = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return SECURE_VALUE_PREFIX + hmac.new(key, serialized.encode('utf-8'), hashlib.sha256).hexdigest()
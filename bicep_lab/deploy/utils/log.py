@@ -1,11 +1,94 @@
+import os
 import sys
+import json
+import queue
+import atexit
 import logging
+import threading
+import contextvars
+import logging.handlers
 
 __logger__ = logging.getLogger('logger')
 __logger__.propagate = False
 __logger__.setLevel(logging.INFO)
 
-__console_handler__ = []
+# ログや状態ファイルに出力しない値 (パスワードなど)
+__secrets__ = set()
+__secrets_lock__ = threading.Lock()
+
+REDACTED = '***'
+
+# ログに付ける (実行, コンポーネント)。スレッドと asyncio タスクのそれぞれで独立
+__context__ = contextvars.ContextVar('log_context', default=(None, None))
+
+# ハンドラはキューの先の別スレッドで呼ぶ (ファイル出力等でワーカーを止めないため)
+__queue__ = queue.Queue(-1)
+__handlers__ = {}
+__listener__ = []
+__handlers_lock__ = threading.Lock()
+
+__FORMAT__ = "%(asctime)s [%(levelname)8s] %(tag)s%(message)s"
+__DATE_FORMAT__ = '%Y-%m-%d %H:%M:%S'
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run, record.component = __context__.get()
+        tag = '/'.join(value for value in (record.run, record.component) if value)
+        record.tag = f"[{tag}] " if tag else ''
+        return True
+
+class _RedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if __secrets__:
+            record.msg = redact(record.getMessage())
+            record.args = None
+        return True
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'run': getattr(record, 'run', None),
+            'component': getattr(record, 'component', None),
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }, ensure_ascii=False)
+
+class _ComponentFileHandler(logging.Handler):
+    """
+    Writes the records of each component to its own file: <dir>/<run>/<component>.log.
+    Records without a component go to main.log. Only called from the listener thread.
+    """
+    def __init__(self, dir_path: str, level: int):
+        super().__init__(level)
+        self._dir_path = dir_path
+        self._streams = {}
+        self.setFormatter(logging.Formatter("%(asctime)s [%(levelname)8s] %(message)s", datefmt=__DATE_FORMAT__))
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            run = getattr(record, 'run', None)
+            file_path = os.path.join(self._dir_path, *([run] if run else []),
+                                     f"{getattr(record, 'component', None) or 'main'}.log")
+            stream = self._streams.get(file_path)
+            if stream is None:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                stream = self._streams[file_path] = open(file_path, 'a', encoding='utf-8')
+            stream.write(self.format(record) + '\n')
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for stream in self._streams.values():
+            stream.close()
+        self._streams = {}
+        super().close()
+
+__logger__.addFilter(_ContextFilter())
+__logger__.addFilter(_RedactingFilter())
+__logger__.addHandler(logging.handlers.QueueHandler(__queue__))
 
 __LOG_LEVEL__ = {
     'debug': logging.DEBUG,
@@ -18,18 +101,53 @@ __LOG_LEVEL__ = {
 def set_console_handler(level: str):
     handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(__get_log_level(level))
-    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)8s] %(message)s",
-                                           datefmt='%Y-%m-%d %H:%M:%S'))
-    try:
-        __logger__.addHandler(handler)
-        try:
-            if len(__console_handler__) ==1 :
-                __logger__.removeHandler(__console_handler__.pop())
-        except Exception as e:
-            __logger__.removeHandler(handler)
-    except Exception as e:
-        raise e
-    __console_handler__.append(handler)
+    handler.setFormatter(logging.Formatter(__FORMAT__, datefmt=__DATE_FORMAT__))
+    __set_handler('console', handler)
+
+def set_component_log_dir(dir_path: str, level: str = 'debug'):
+    """
+    Writes the logs of each component to its own file under the directory
+    (<dir>/<environment>/<component>.log), so concurrent deployments do not interleave.
+    """
+    __set_handler('components', _ComponentFileHandler(dir_path, __get_log_level(level)))
+
+def set_json_handler(file_path: str, level: str = 'debug'):
+    """
+    Appends every record as one JSON line (time, level, run, component, thread, message) to the file.
+    """
+    dir_path = os.path.dirname(file_path)
+    if dir_path:
+        os.makedirs(dir_path, exist_ok=True)
+    handler = logging.FileHandler(file_path, encoding='utf-8')
+    handler.setLevel(__get_log_level(level))
+    handler.setFormatter(_JsonFormatter())
+    __set_handler('json', handler)
+
+def set_context(run: str = None, component: str = None):
+    """
+    Tags the following records of the current thread or asyncio task with the run and component.
+
+    Returns:
+        Token to pass to reset_context().
+    """
+    return __context__.set((run, component))
+
+def reset_context(token):
+    __context__.reset(token)
+
+def flush():
+    """Waits until the queued records have been written (e.g. before prompting the user)."""
+    if __listener__:
+        __queue__.join()
+
+def shutdown():
+    """Writes the queued records and closes the handlers."""
+    with __handlers_lock__:
+        while __listener__:
+            __listener__.pop().stop()
+        for handler in __handlers__.values():
+            handler.close()
+        __handlers__.clear()
 
 def debug(msg: str, *args, **kwargs):
     __logger__.debug(msg, *args, **kwargs)
@@ -46,6 +164,52 @@ def error(msg: str, *args, **kwargs):
 def critical(msg: str, *args, **kwargs):
     __logger__.critical(msg, *args, **kwargs)
 
+def add_secret(value: str):
+    """
+    Registers a secret value. It is replaced by '***' in every following log message
+    and in the values passed to redact().
+    """
+    # 短すぎる値は通常の文字列まで置き換えてしまうため対象外にする
+    if isinstance(value, str) and len(value) >= 4:
+        with __secrets_lock__:
+            __secrets__.add(value)
+
+def redact(value):
+    """
+    Returns the value with the registered secrets replaced by '***'.
+    Strings are searched, dicts, lists and tuples are copied recursively.
+    """
+    if not __secrets__:
+        return value
+    if isinstance(value, str):
+        with __secrets_lock__:
+            secrets = sorted(__secrets__, key=len, reverse=True)
+        for secret in secrets:
+            value = value.replace(secret, REDACTED)
+        return value
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    return value
+
+def __set_handler(name: str, handler: logging.Handler):
+    # リスナーのハンドラは変更できないため、入れ替えて再起動する (キューに残ったログは先に出力される)
+    with __handlers_lock__:
+        while __listener__:
+            __listener__.pop().stop()
+        previous = __handlers__.get(name)
+        __handlers__[name] = handler
+        if previous is not None:
+            previous.close()
+        listener = logging.handlers.QueueListener(__queue__, *__handlers__.values(), respect_handler_level=True)
+        listener.start()
+        __listener__.append(listener)
+        # 出力されないレベルのログはキューに入れない
+        __logger__.setLevel(min(handler.level for handler in __handlers__.values()))
+
 def __get_log_level(level: str) -> int:
     if level.lower() in __LOG_LEVEL__:
         return __LOG_LEVEL__[level.lower()]
+
+atexit.register(shutdown)
@@ -0,0 +1,123 @@
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from deploy.utils import log
+
+class OperationTimeout(Exception):
+    """
+    An operation that did not finish within its timeout. The operation itself may still be running.
+    """
+
+class OperationPoller():
+    """
+    Tracks many long-running operations (e.g. ARM deployments) from a single background thread.
+
+    Each operation is checked on its own adaptive interval: it starts at `min_interval`,
+    grows by `backoff` after every check that shows no change, and goes back to
+    `min_interval` when the reported status changes.
+
+    Args:
+        min_interval (float): Seconds between the first checks of an operation.
+        max_interval (float): Upper bound of the interval.
+        backoff (float): Growth factor of the interval while the status does not change.
+        timeout (float): Seconds after which an operation that is still not done fails with
+            OperationTimeout. None waits without limit.
+    """
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 30.0, backoff: float = 1.5,
+                 timeout: float = None):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._thread = None
+        self.configure(min_interval, max_interval, backoff, timeout)
+
+    def configure(self, min_interval: float = 5.0, max_interval: float = 30.0, backoff: float = 1.5,
+                  timeout: float = None):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def track(self, name: str, check, timeout: float = None) -> Future:
+        """
+        Starts tracking an operation.
+
+        Args:
+            name (str): Name of the operation for the logs.
+            check (callable): Called without arguments on the poller thread. Returns (done, value):
+                the result when done is True, otherwise the current status (e.g. 'Running').
+                An exception fails the operation. Runs in a copy of the caller's context, so
+                trace spans and events of the check belong to the caller's component.
+            timeout (float): Seconds to wait for the operation. Defaults to the timeout of the poller.
+
+        Returns:
+            Future: Resolved with the result of the operation, or failed with OperationTimeout.
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        timeout = timeout if timeout is not None else self.timeout
+        operation = {'name': name, 'check': check, 'context': contextvars.copy_context(), 'future': future,
+                     'status': None, 'interval': self.min_interval, 'timeout': timeout,
+                     'deadline': time.monotonic() + timeout if timeout is not None else None}
+        with self._condition:
+            self.__schedule(operation, self.min_interval)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.__run, name='operation-poller', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    @property
+    def outstanding(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def __schedule(self, operation: dict, delay: float):
+        heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), operation))
+
+    def __run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    # 追跡する操作が無くなったらスレッドを終了する
+                    if not self._condition.wait(timeout=60):
+                        if not self._queue:
+                            self._thread = None
+                            return
+                due, _, operation = self._queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._queue)
+            self.__check(operation)
+
+    def __check(self, operation: dict):
+        try:
+            done, value = operation['context'].run(operation['check'])
+        except Exception as e:
+            log.debug(f"Operation {operation['name']} failed: {e}")
+            operation['future'].set_exception(e)
+            return
+        if done:
+            operation['future'].set_result(value)
+            return
+        if operation['deadline'] is not None and time.monotonic() >= operation['deadline']:
+            message = f"Operation {operation['name']} did not finish within {operation['timeout']:g}s ({value})"
+            log.error(message)
+            operation['future'].set_exception(OperationTimeout(message))
+            return
+        if value != operation['status']:
+            if operation['status'] is not None:
+                log.info(f"{operation['name']}: {value}")
+            operation['status'] = value
+            operation['interval'] = self.min_interval
+        else:
+            operation['interval'] = min(operation['interval'] * self.backoff, self.max_interval)
+        with self._condition:
+            self.__schedule(operation, operation['interval'])
+
+poller = OperationPoller()
@@ -0,0 +1,65 @@
+import os
+import asyncio
+import threading
+import subprocess
+import contextvars
+from deploy.utils import log
+
+def run(cmd: list, name: str = None) -> subprocess.CompletedProcess:
+    """
+    Runs a command and streams its stderr (progress, warnings, errors) through the logger line by line,
+    tagged with the current component. The stdout is returned (e.g. the JSON output of `az`).
+
+    Args:
+        cmd (list): Command and arguments.
+        name (str): Prefix of the streamed lines. The program name if omitted.
+
+    Returns:
+        subprocess.CompletedProcess: With the stdout and stderr as text.
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails. Includes the stderr.
+    """
+    name = name or os.path.basename(cmd[0])
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    lines = []
+    # 読み取りスレッドのログにも呼び出し元のコンポーネントを付ける
+    context = contextvars.copy_context()
+    reader = threading.Thread(target=context.run, args=(__stream_lines, process.stderr, name, lines), daemon=True)
+    reader.start()
+    stdout = process.stdout.read()
+    returncode = process.wait()
+    reader.join()
+    return __complete(cmd, name, returncode, stdout, ''.join(lines))
+
+async def run_async(cmd: list, name: str = None) -> subprocess.CompletedProcess:
+    """
+    asyncio version of run().
+    """
+    name = name or os.path.basename(cmd[0])
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+    async def stream_stderr() -> str:
+        lines = []
+        async for line in process.stderr:
+            line = line.decode(errors='replace')
+            lines.append(line)
+            if line.strip():
+                log.info(f"{name}: {line.rstrip()}")
+        return ''.join(lines)
+
+    stdout, stderr = await asyncio.gather(process.stdout.read(), stream_stderr())
+    returncode = await process.wait()
+    return __complete(cmd, name, returncode, stdout.decode(errors='replace'), stderr)
+
+def __stream_lines(stream, name: str, lines: list):
+    for line in stream:
+        lines.append(line)
+        if line.strip():
+            log.info(f"{name}: {line.rstrip()}")
+
+def __complete(cmd: list, name: str, returncode: int, stdout: str, stderr: str) -> subprocess.CompletedProcess:
+    if returncode != 0:
+        log.error(f"{name} exited with code {returncode}")
+        raise subprocess.CalledProcessError(returncode, cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
@@ -0,0 +1,326 @@
+import re
+import time
+import random
+import asyncio
+import threading
+import contextvars
+import subprocess
+from concurrent.futures import Future
+from urllib.parse import urlparse
+from deploy.utils import log, trace
+
+# 再試行する HTTP ステータス
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+# 再試行する ARM のエラーコード (リクエストのエラーの最上位のコード。デプロイ内部の失敗理由は対象外)
+RETRYABLE_ERROR_CODES = ('TooManyRequests', 'RetryableError', 'ServerBusy', 'ServiceUnavailable',
+                         'InternalServerError', 'GatewayTimeout', 'AnotherOperationInProgress')
+# 完了して失敗したことを表す例外 (同じ内容で再実行しても失敗するため再試行しない)
+NON_RETRYABLE_ERRORS = ('DeploymentError', 'OperationTimeout')
+# ARM の残りリクエスト数ヘッダ (x-ms-ratelimit-remaining-subscription-reads など)
+REMAINING_HEADER_PREFIX = 'x-ms-ratelimit-remaining-'
+
+__SUBSCRIPTION_PATTERN__ = re.compile(r'/subscriptions/([^/]+)', re.IGNORECASE)
+# az CLI のエラー出力の最上位のエラーコード ("(Code) Message", "Code: Code" または JSON の "code")
+__CLI_ERROR_CODE_PATTERN__ = re.compile(r'\((\w+)\)|\bCode:\s*(\w+)|"code"\s*:\s*"(\w+)"')
+
+class RateLimiter():
+    """
+    Throttling state shared by every worker of the process.
+
+    Requests are grouped by key: the subscription for ARM requests, the host for data
+    plane requests (Key Vault, Blob). When a response asks to slow down (429 with
+    Retry-After, or few requests left according to the x-ms-ratelimit-remaining-* headers),
+    the key is paused and every worker waits before its next request of that key.
+
+    Args:
+        max_attempts (int): Attempts per operation in retry()/retry_async(), including the first one.
+        base_delay (float): Backoff of the first retry in seconds. Doubles on each attempt.
+        max_delay (float): Upper bound of one backoff in seconds.
+        low_remaining (int): Remaining request count below which requests of the key are paced.
+        pace_delay (float): Pause in seconds when no request is left. Scales down as more are left.
+    """
+    def __init__(self, max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 60.0,
+                 low_remaining: int = 20, pace_delay: float = 5.0):
+        self._lock = threading.Lock()
+        self._blocked_until = {}
+        self._stats = {}
+        self.configure(max_attempts, base_delay, max_delay, low_remaining, pace_delay)
+
+    def configure(self, max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 60.0,
+                  low_remaining: int = 20, pace_delay: float = 5.0):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_remaining = low_remaining
+        self.pace_delay = pace_delay
+
+    def wait(self, key: str):
+        """Blocks until requests of the key are allowed."""
+        delay = self.__get_delay(key)
+        if delay > 0:
+            with trace.span('throttled', 'throttle', key=key):
+                time.sleep(delay)
+            self.__count('throttled_seconds', delay)
+
+    async def wait_async(self, key: str):
+        """asyncio version of wait()."""
+        delay = self.__get_delay(key)
+        if delay > 0:
+            with trace.span('throttled', 'throttle', key=key):
+                await asyncio.sleep(delay)
+            self.__count('throttled_seconds', delay)
+
+    def observe(self, key: str, status_code: int, headers) -> float:
+        """
+        Updates the state of the key from a response.
+
+        Returns:
+            float: Seconds the key is paused for (0 if not paused).
+        """
+        delay = 0.0
+        retry_after = get_retry_after(headers)
+        if status_code in (429, 503) and retry_after is not None:
+            delay = retry_after
+        if status_code == 429:
+            self.record_throttled()
+            delay = max(delay, self.base_delay)
+        remaining = _get_remaining(headers)
+        if remaining is not None and remaining < self.low_remaining:
+            delay = max(delay, self.pace_delay * (self.low_remaining - remaining) / self.low_remaining)
+        if delay > 0:
+            self.block(key, delay)
+        return delay
+
+    def block(self, key: str, delay: float):
+        """Pauses requests of the key for `delay` seconds."""
+        with self._lock:
+            until = time.monotonic() + delay
+            if until > self._blocked_until.get(key, 0.0):
+                self._blocked_until[key] = until
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry (1 = first retry)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: {'throttled_responses', 'throttled_seconds', 'retries', 'retry_seconds'}
+        """
+        with self._lock:
+            return {name: self._stats.get(name, 0) for name in
+                    ('throttled_responses', 'throttled_seconds', 'retries', 'retry_seconds')}
+
+    def log_stats(self):
+        stats = self.stats()
+        if any(stats.values()):
+            log.info(f"Throttling: {stats['throttled_responses']} throttled responses, "
+                     f"{stats['throttled_seconds']:.1f}s paused, {stats['retries']} retries "
+                     f"({stats['retry_seconds']:.1f}s of backoff)")
+
+    def record_throttled(self):
+        self.__count('throttled_responses', 1)
+
+    def record_retry(self, delay: float):
+        self.__count('retries', 1)
+        self.__count('retry_seconds', delay)
+
+    def __get_delay(self, key: str) -> float:
+        with self._lock:
+            return self._blocked_until.get(key, 0.0) - time.monotonic()
+
+    def __count(self, name: str, value):
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + value
+
+def get_key(url: str) -> str:
+    """
+    Returns the throttling key of a request URL: the subscription for ARM, otherwise the host.
+    """
+    parsed = urlparse(url)
+    match = __SUBSCRIPTION_PATTERN__.search(parsed.path)
+    if parsed.netloc.startswith('management.') and match:
+        return match.group(1).lower()
+    return parsed.netloc
+
+def get_retry_after(headers) -> float:
+    """
+    Returns the Retry-After (or retry-after-ms) of the headers in seconds, or None.
+    """
+    if not headers:
+        return None
+    for name, scale in (('retry-after-ms', 0.001), ('x-ms-retry-after-ms', 0.001), ('Retry-After', 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(float(value) * scale, 0.0)
+        except ValueError:
+            # HTTP日付形式は使われないため無視する
+            continue
+    return None
+
+def classify(error: Exception):
+    """
+    Decides whether an operation that raised the error should be retried.
+
+    Only throttling and transient request errors are retried, judged by the status code and the
+    top-level ARM error code: azure-core errors (status_code, response.headers, error.code),
+    `az` failures (subprocess.CalledProcessError with its stderr) and connection errors.
+    A deployment that ARM reports as failed (DeploymentError) is never retried, and neither is an
+    azure-core error the retry policy of the clients has already retried (see deploy.resources.clients).
+
+    Returns:
+        tuple: (retryable (bool), status code or None, Retry-After in seconds or None)
+    """
+    if type(error).__name__ in NON_RETRYABLE_ERRORS:
+        return False, None, None
+    status_code = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    retry_after = get_retry_after(headers)
+    if isinstance(error, subprocess.CalledProcessError):
+        output = f"{error.stderr or ''}{error.output or ''}"
+        error_code = __get_cli_error_code(output)
+        if error_code in RETRYABLE_ERROR_CODES or 'status code 429' in output.lower():
+            return True, 429 if error_code == 'TooManyRequests' or 'status code 429' in output.lower() else None, None
+        return False, None, None
+    # SDK のクライアントは再試行ポリシーでステータスと接続エラーを再試行済み
+    retried_by_client = type(error).__module__.startswith('azure.')
+    if status_code in RETRYABLE_STATUS_CODES:
+        return not retried_by_client, status_code, retry_after
+    if type(error).__name__ in ('ServiceRequestError', 'ServiceResponseError'):
+        return not retried_by_client, None, None
+    error_code = getattr(getattr(error, 'error', None), 'code', None) or ''
+    if error_code in RETRYABLE_ERROR_CODES:
+        return True, status_code, retry_after
+    # 接続エラー
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True, None, None
+    return False, status_code, retry_after
+
+def __get_cli_error_code(output: str) -> str:
+    match = __CLI_ERROR_CODE_PATTERN__.search(output)
+    return next((code for code in match.groups() if code), '') if match else ''
+
+def retry(func, operation: str, key: str = 'default', rate_limiter: RateLimiter = None):
+    """
+    Calls `func()` and retries it on throttling and transient errors.
+
+    Each retry waits for the larger of the Retry-After of the error and an exponential
+    backoff with full jitter. A 429 also pauses the key for every other worker.
+
+    Args:
+        func (callable): Operation without arguments.
+        operation (str): Name of the operation for the logs.
+        key (str): Throttling key (e.g. the subscription ID).
+        rate_limiter (RateLimiter): Limiter to use. The process-wide limiter if omitted.
+
+    Returns:
+        The return value of func.
+    """
+    rate_limiter = rate_limiter or limiter
+    attempt = 0
+    while True:
+        rate_limiter.wait(key)
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            delay = __get_retry_delay(rate_limiter, e, operation, key, attempt)
+            if delay is None:
+                raise
+        time.sleep(delay)
+
+async def retry_async(func, operation: str, key: str = 'default', rate_limiter: RateLimiter = None):
+    """
+    asyncio version of retry(). `func()` returns an awaitable.
+    """
+    rate_limiter = rate_limiter or limiter
+    attempt = 0
+    while True:
+        await rate_limiter.wait_async(key)
+        try:
+            return await func()
+        except Exception as e:
+            attempt += 1
+            delay = __get_retry_delay(rate_limiter, e, operation, key, attempt)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+
+def retry_future(start, operation: str, key: str = 'default', rate_limiter: RateLimiter = None) -> Future:
+    """
+    retry() for operations that are started and then complete in the background.
+
+    `start()` submits the operation and returns a Future. When the operation fails with a
+    retryable error, it is started again after the backoff, from a timer thread, so no
+    thread waits for the operation or the backoff.
+
+    Returns:
+        Future: Resolved with the result of the first successful attempt, or the last error.
+    """
+    rate_limiter = rate_limiter or limiter
+    # 再実行も呼び出し元のコンテキスト (トレースのスパン) で行う
+    context = contextvars.copy_context()
+    outer = Future()
+    outer.set_running_or_notify_cancel()
+
+    def attempt(number: int):
+        try:
+            rate_limiter.wait(key)
+            inner = start()
+        except Exception as e:
+            fail(e, number)
+            return
+        inner.add_done_callback(lambda future: finish(future, number))
+
+    def finish(future: Future, number: int):
+        try:
+            outer.set_result(future.result())
+        except Exception as e:
+            fail(e, number)
+
+    def fail(error: Exception, number: int):
+        delay = __get_retry_delay(rate_limiter, error, operation, key, number)
+        if delay is None:
+            outer.set_exception(error)
+        else:
+            timer = threading.Timer(delay, context.run, [attempt, number + 1])
+            timer.daemon = True
+            timer.start()
+
+    attempt(1)
+    return outer
+
+def __get_retry_delay(limiter: RateLimiter, error: Exception, operation: str, key: str, attempt: int):
+    retryable, status_code, retry_after = classify(error)
+    if not retryable or attempt >= limiter.max_attempts:
+        return None
+    if status_code == 429:
+        # 他のワーカーも同じキーへのリクエストを控える
+        limiter.block(key, max(retry_after or 0.0, limiter.base_delay))
+        if getattr(error, 'response', None) is None:
+            # HTTP レスポンスは RateLimitPolicy で数えているため、az CLI の失敗のみ数える
+            limiter.record_throttled()
+    delay = max(retry_after or 0.0, limiter.backoff(attempt))
+    limiter.record_retry(delay)
+    log.warning(f"{operation} failed ({status_code or type(error).__name__}), "
+                f"retrying in {delay:.1f}s ({attempt}/{limiter.max_attempts - 1}): {error}")
+    return delay
+
+def _get_remaining(headers):
+    # 複数の残数ヘッダがある場合は最小値を使う
+    if not headers:
+        return None
+    remaining = None
+    for name, value in headers.items():
+        if name.lower().startswith(REMAINING_HEADER_PREFIX):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+            remaining = value if remaining is None else min(remaining, value)
+    return remaining
+
+limiter = RateLimiter()
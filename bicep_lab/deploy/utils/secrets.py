@@ -0,0 +1,133 @@
+import time
+import random
+import string
+import asyncio
+import threading
+from concurrent.futures import Future
+from deploy.utils import log
+
+class SecretCache():
+    """
+    Secret values (e.g. the SQL password in Key Vault) fetched during a run, shared by all workers.
+
+    Concurrent lookups of the same secret share one request, and a value is reused
+    for `ttl` seconds or until it is invalidated. Every cached value is registered with
+    log.add_secret(), so it never appears in the logs, the state files or the traces.
+    Empty values (secret not found) are not cached.
+
+    Args:
+        ttl (float): Seconds a fetched value is reused.
+    """
+    def __init__(self, ttl: float = 300):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pending = {}
+        self._pending_async = {}
+        self.configure(ttl)
+
+    def configure(self, ttl: float = 300):
+        self.ttl = ttl
+
+    def get(self, vault_name: str, secret_name: str, fetch) -> str:
+        """
+        Returns the cached value of the secret, or calls `fetch()` once for all the callers waiting for it.
+
+        Args:
+            vault_name (str): Key Vault name.
+            secret_name (str): Secret name.
+            fetch (callable): Reads the secret. Called without arguments.
+        """
+        key = self.__get_key(vault_name, secret_name)
+        with self._lock:
+            value = self.__get_value(key)
+            if value is not None:
+                return value
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(key, None)
+            future.set_exception(e)
+            raise
+        self.__store(key, value)
+        with self._lock:
+            self._pending.pop(key, None)
+        future.set_result(value)
+        return value
+
+    async def get_async(self, vault_name: str, secret_name: str, fetch) -> str:
+        """
+        asyncio version of get(). `fetch()` returns an awaitable.
+        """
+        key = self.__get_key(vault_name, secret_name)
+        with self._lock:
+            value = self.__get_value(key)
+            if value is not None:
+                return value
+            task = self._pending_async.get(key)
+            if task is None:
+                task = self._pending_async[key] = asyncio.ensure_future(fetch())
+                task.add_done_callback(lambda done: self.__finish_async(key, done))
+        return await asyncio.shield(task)
+
+    def put(self, vault_name: str, secret_name: str, value: str):
+        """Caches a value known to be in the vault (e.g. just written by a deployment)."""
+        self.__store(self.__get_key(vault_name, secret_name), value)
+
+    def invalidate(self, vault_name: str = None, secret_name: str = None):
+        """
+        Drops cached values: one secret, every secret of a vault, or everything if no vault is given.
+        """
+        with self._lock:
+            if vault_name is None:
+                self._values.clear()
+                return
+            vault_name = vault_name.lower()
+            for key in list(self._values):
+                if key[0] == vault_name and (secret_name is None or key[1] == secret_name):
+                    del self._values[key]
+
+    def __finish_async(self, key: tuple, task):
+        with self._lock:
+            self._pending_async.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.__store(key, task.result())
+
+    def __store(self, key: tuple, value: str):
+        if not value:
+            return
+        log.add_secret(value)
+        with self._lock:
+            self._values[key] = (time.monotonic() + self.ttl, value)
+
+    def __get_value(self, key: tuple):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    @staticmethod
+    def __get_key(vault_name: str, secret_name: str) -> tuple:
+        # Key Vault 名は大文字小文字を区別しない
+        return (vault_name.lower(), secret_name)
+
+cache = SecretCache()
+
+def generate_password(length=16) -> str:
+    """
+    Generates a random password and registers it with log.add_secret().
+    """
+    characters = string.ascii_letters + string.digits + string.punctuation
+    password = ''.join(random.choice(characters) for i in range(length))
+    log.add_secret(password)
+    return password
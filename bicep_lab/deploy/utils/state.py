@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import secrets
+import tempfile
+import threading
+from deploy.utils import log
+
+class StateStore():
+    """
+    Local JSON state of one environment, keyed by subscription and environment name.
+
+    The data is organised in sections ({section: {name: value}}). Every update is
+    written back atomically, and the store can be shared by worker threads.
+
+    Values stored with put() carry the time they were recorded, and get_fresh() only
+    returns them while they are younger than a TTL and pass the caller's validation.
+    """
+    def __init__(self, state_dir: str, subscription_id: str, env_name: str):
+        self._path = os.path.join(state_dir, subscription_id or 'default', f"{env_name}.json")
+        self._lock = threading.Lock()
+        self._data = self.__load(self._path)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def get_key(self) -> bytes:
+        """
+        Returns the secret key of the environment, created on first use.
+
+        The key is kept in its own file next to the state file (readable by the owner only) and is
+        used to hash secret values that must be compared between runs (see deploy.utils.fingerprint).
+        """
+        key_path = os.path.splitext(self._path)[0] + '.key'
+        with self._lock:
+            try:
+                with open(key_path, 'r', encoding='utf-8') as f:
+                    return bytes.fromhex(f.read().strip())
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(key_path), exist_ok=True)
+            try:
+                fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # 他のプロセスが先に作成した
+                with open(key_path, 'r', encoding='utf-8') as f:
+                    return bytes.fromhex(f.read().strip())
+            key = secrets.token_bytes(32)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(key.hex())
+            return key
+
+    def get(self, section: str, name: str, default=None):
+        with self._lock:
+            return self._data.get(section, {}).get(name, default)
+
+    def set(self, section: str, name: str, value):
+        with self._lock:
+            self._data.setdefault(section, {})[name] = value
+            self.__save()
+
+    def delete(self, section: str, name: str):
+        with self._lock:
+            if self._data.get(section, {}).pop(name, None) is not None:
+                self.__save()
+
+    def put(self, section: str, name: str, value):
+        """Stores a value with the time it was recorded (read it back with get_fresh())."""
+        self.set(section, name, {'value': value, 'updated_at': time.time()})
+
+    def get_fresh(self, section: str, name: str, max_age: float = None, validate=None):
+        """
+        Returns a value stored with put(), or None when it is missing or stale.
+
+        Args:
+            section (str): Section name.
+            name (str): Entry name.
+            max_age (float): Seconds after which the entry is stale. No limit if omitted.
+            validate (callable): Called with the value. The entry is stale if it returns False.
+
+        Returns:
+            The value, or None. Stale entries are removed.
+        """
+        entry = self.get(section, name)
+        if not isinstance(entry, dict) or 'updated_at' not in entry:
+            return None
+        age = time.time() - entry['updated_at']
+        if (max_age is not None and age > max_age) or (validate is not None and not validate(entry['value'])):
+            log.debug(f"Dropping stale state entry {section}/{name} ({age:.0f}s old)")
+            self.delete(section, name)
+            return None
+        return entry['value']
+
+    def clear(self, section: str = None):
+        """Removes a section, or every section if omitted."""
+        with self._lock:
+            if section is None:
+                self._data = {}
+            elif self._data.pop(section, None) is None:
+                return
+            self.__save()
+
+    @staticmethod
+    def __load(path: str) -> dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            log.warning(f"Ignoring corrupted state file: {path}")
+            return {}
+
+    def __save(self):
+        state_dir = os.path.dirname(self._path)
+        os.makedirs(state_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=state_dir, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                # シークレットは状態ファイルに書き込まない
+                json.dump(log.redact(self._data), f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+def get_state_dir(conf: dict) -> str:
+    return os.path.join(conf['RootPath'], '.state')
@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from deploy.utils import log, process
+
+# キャッシュ形式を変更した場合はこの値を上げる
+CACHE_VERSION = '1'
+# 書き込み中の一時ファイルの接頭辞と、prune で削除しない期間 (秒、書き込みが中断されたファイルのみ削除する)
+TMP_PREFIX = '.tmp-'
+TMP_GRACE_SECONDS = 3600
+
+# module 'x.bicep' / loadTextContent('x') などで参照されるファイル
+__REFERENCE_PATTERNS__ = [
+    re.compile(r"^\s*module\s+\w+\s+'([^']+)'", re.MULTILINE),
+    re.compile(r"load(?:TextContent|FileAsBase64|JsonContent|YamlContent)\(\s*'([^']+)'"),
+]
+
+def compile_bicep(template_file_path: str) -> dict:
+    """
+    Compiles a Bicep template to ARM JSON with the bicep CLI (or `az bicep` when it is not installed).
+
+    Args:
+        template_file_path (str): Path to the template file
+
+    Returns:
+        dict: Compiled ARM template
+    """
+    if shutil.which('bicep'):
+        cmd = ["bicep", "build", template_file_path, "--stdout"]
+    else:
+        cmd = ["az", "bicep", "build", "--file", template_file_path, "--stdout"]
+    completed = process.run(cmd)
+    return json.loads(completed.stdout)
+
+def collect_template_files(template_file_path: str) -> list:
+    """
+    Returns the template and every file it includes (modules and load*() functions), recursively.
+
+    Args:
+        template_file_path (str): Path to the template file
+
+    Returns:
+        list: Absolute file paths, the template itself first.
+    """
+    collected = []
+    stack = [os.path.abspath(template_file_path)]
+    while stack:
+        file_path = stack.pop()
+        if file_path in collected:
+            continue
+        collected.append(file_path)
+        if not file_path.endswith('.bicep'):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        base_dir = os.path.dirname(file_path)
+        for pattern in __REFERENCE_PATTERNS__:
+            for reference in pattern.findall(content):
+                # レジストリ参照 (br:/ts:) はローカルファイルではないので対象外
+                if ':' in reference.split('/')[0]:
+                    continue
+                stack.append(os.path.normpath(os.path.join(base_dir, reference)))
+    return collected
+
+def template_hash(template_file_path: str) -> str:
+    """
+    Hashes the template together with everything it includes.
+
+    Args:
+        template_file_path (str): Path to the template file
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    base_dir = os.path.dirname(os.path.abspath(template_file_path))
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    for file_path in sorted(collect_template_files(template_file_path)):
+        digest.update(os.path.relpath(file_path, base_dir).encode())
+        digest.update(b'\0')
+        with open(file_path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def get_template_cache_dir(conf: dict) -> str:
+    return os.path.join(conf['RootPath'], '.bicep_cache')
+
+class TemplateCache():
+    """
+    Content-addressed cache of compiled ARM templates.
+
+    Entries are written atomically (temporary file + os.replace), so several workers
+    or processes can share the cache directory.
+    """
+    def __init__(self, cache_dir: str, compiler=compile_bicep):
+        self._cache_dir = cache_dir
+        self._compiler = compiler
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    def entry_path(self, template_file_path: str, key: str = None) -> str:
+        key = key or template_hash(template_file_path)
+        name = os.path.splitext(os.path.basename(template_file_path))[0]
+        return os.path.join(self._cache_dir, f"{name}-{key}.json")
+
+    def get(self, template_file_path: str) -> dict:
+        """
+        Returns the compiled template, compiling it only when no entry matches its current content.
+
+        Args:
+            template_file_path (str): Path to the template file
+
+        Returns:
+            dict: Compiled ARM template
+        """
+        entry_path = self.entry_path(template_file_path)
+        with self._locks_lock:
+            lock = self._locks.setdefault(entry_path, threading.Lock())
+        with lock:
+            template = self.__read_entry(entry_path)
+            if template is not None:
+                log.debug(f"Template cache hit: {os.path.basename(template_file_path)}")
+                return template
+            log.info(f"Compiling template: {os.path.basename(template_file_path)}")
+            template = self._compiler(template_file_path)
+            self.__write_entry(entry_path, template)
+            return template
+
+    def warm(self, bicep_dir_path: str, max_workers: int = None) -> list:
+        """
+        Compiles every template under the directory that is not cached yet.
+
+        Returns:
+            list: Template paths that were processed.
+        """
+        template_paths = self.__list_templates(bicep_dir_path)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self.get, template_paths))
+        return template_paths
+
+    def prune(self, bicep_dir_path: str) -> list:
+        """
+        Removes entries that do not match the current content of any template under the directory.
+        Temporary files of writers (another process may be compiling) are kept for TMP_GRACE_SECONDS.
+
+        Returns:
+            list: Removed entry paths.
+        """
+        if not os.path.isdir(self._cache_dir):
+            return []
+        valid = {os.path.basename(self.entry_path(path)) for path in self.__list_templates(bicep_dir_path)}
+        removed = []
+        for file_name in os.listdir(self._cache_dir):
+            if file_name in valid:
+                continue
+            entry_path = os.path.join(self._cache_dir, file_name)
+            try:
+                if file_name.startswith(TMP_PREFIX) and time.time() - os.path.getmtime(entry_path) < TMP_GRACE_SECONDS:
+                    continue
+                os.remove(entry_path)
+            except FileNotFoundError:
+                # 書き込みが完了した (os.replace された) か、他のプロセスが削除した
+                continue
+            removed.append(entry_path)
+        return removed
+
+    @staticmethod
+    def __list_templates(bicep_dir_path: str) -> list:
+        return sorted(os.path.join(bicep_dir_path, file_name)
+                      for file_name in os.listdir(bicep_dir_path) if file_name.endswith('.bicep'))
+
+    @staticmethod
+    def __read_entry(entry_path: str) -> dict:
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            log.warning(f"Ignoring corrupted template cache entry: {entry_path}")
+            return None
+
+    def __write_entry(self, entry_path: str, template: dict):
+        os.makedirs(self._cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, prefix=TMP_PREFIX, suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(template, f)
+            os.replace(tmp_path, entry_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from deploy.utils import log
+
+# 現在のスパン (スレッドとasyncioタスクのそれぞれで独立)
+__current_span__ = contextvars.ContextVar('current_span', default=None)
+
+class Span():
+    def __init__(self, span_id: int, name: str, category: str, parent, component: str, attrs: dict):
+        self.span_id = span_id
+        self.name = name
+        self.category = category
+        self.parent_id = parent.span_id if parent else None
+        self.component = component or (parent.component if parent else None)
+        # 'run' スパン (環境ごとのデプロイ) の名前を子孫スパンに引き継ぐ
+        self.run = name if category == 'run' else (parent.run if parent else None)
+        self.attrs = attrs
+        self.lane = _get_lane()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+class Tracer():
+    """
+    Collects timing spans of a deployment process.
+
+    Spans nest per thread and per asyncio task. The collected spans can be exported
+    as a Chrome trace (chrome://tracing, Perfetto) and summarized per component.
+    Log records written inside a span are tagged with its run and component.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = []
+        self._next_id = 1
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, category: str = 'step', component: str = None, **attrs):
+        """
+        Records the duration of the enclosed block.
+
+        Args:
+            name (str): Span name.
+            category (str): Span category (e.g. 'run', 'prepare', 'deploy', 'sdk').
+            component (str): Component the span belongs to. Inherited from the parent span if omitted.
+        """
+        span = self.start_span(name, category, component, **attrs)
+        token = __current_span__.set(span)
+        log_token = log.set_context(span.run, span.component)
+        try:
+            yield span
+        except Exception as e:
+            span.attrs['error'] = str(e)
+            raise
+        finally:
+            log.reset_context(log_token)
+            __current_span__.reset(token)
+            span.end = time.perf_counter()
+
+    @contextmanager
+    def activate(self, span: Span):
+        """Makes a started span the parent of the spans of the enclosed block, without ending it."""
+        token = __current_span__.set(span)
+        log_token = log.set_context(span.run, span.component)
+        try:
+            yield span
+        finally:
+            log.reset_context(log_token)
+            __current_span__.reset(token)
+
+    def start_span(self, name: str, category: str = 'step', component: str = None, **attrs) -> Span:
+        """Starts a span without making it current. Set `span.end` to finish it."""
+        with self._lock:
+            span = Span(self._next_id, name, category, __current_span__.get(), component, attrs)
+            self._next_id += 1
+            self._spans.append(span)
+        return span
+
+    def spans(self, category: str = None) -> list:
+        with self._lock:
+            return [span for span in self._spans if category is None or span.category == category]
+
+    def export_chrome_trace(self, file_path: str):
+        """
+        Writes the spans in the Chrome trace event format.
+        """
+        events = []
+        for span in self.spans():
+            args = log.redact(dict(span.attrs))
+            if span.component:
+                args['component'] = span.component
+            if span.run:
+                args['run'] = span.run
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round((span.start - self._origin) * 1e6),
+                'dur': round(span.duration * 1e6),
+                'pid': os.getpid(),
+                'tid': span.lane,
+                'args': args
+            })
+        dir_path = os.path.dirname(file_path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        log.info(f"Trace written to {file_path}")
+
+    def critical_path(self, dependencies: dict, category: str = 'deploy', run: str = None) -> list:
+        """
+        Returns the chain of task spans that determined the end of the run.
+
+        Starting from the task that finished last, each step goes back to the
+        dependency that finished last before the task started.
+
+        Args:
+            dependencies (dict): Task name -> list of task names it depends on.
+            category (str): Category of the task spans.
+            run (str): Only consider the spans of this run. All runs if omitted.
+
+        Returns:
+            list: Spans, first task first.
+        """
+        tasks = {span.name: span for span in self.spans(category)
+                 if span.end is not None and (run is None or span.run == run)}
+        if not tasks:
+            return []
+        path = [max(tasks.values(), key=lambda span: span.end)]
+        while True:
+            deps = [tasks[dep] for dep in dependencies.get(path[-1].name, []) if dep in tasks]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda span: span.end))
+        return list(reversed(path))
+
+    def log_summary(self, dependencies: dict):
+        """
+        Logs the time spent per component and phase (including time paused by throttling),
+        marking the components on the critical path.
+        With several runs (one per environment), a table is logged for each run.
+        """
+        columns = ['queue', 'prepare', 'compile', 'submit', 'deploy', 'sdk', 'throttle']
+        totals = {}
+        sdk_calls = {}
+        for span in self.spans():
+            if span.end is None or not span.component:
+                continue
+            phase = span.category if span.category in columns else span.name if span.name in columns else None
+            if phase is None:
+                continue
+            row = totals.setdefault(span.run, {}).setdefault(span.component, dict.fromkeys(columns, 0.0))
+            row[phase] += span.duration
+            if phase == 'sdk':
+                key = (span.run, span.component)
+                sdk_calls[key] = sdk_calls.get(key, 0) + 1
+        for run, components in totals.items():
+            critical = [span.name for span in self.critical_path(dependencies, run=run)]
+            log.info(f"Timing summary{f' of {run}' if run else ''} (seconds, * = critical path):")
+            log.info(f"  {'component':<16}" + ''.join(f"{column:>10}" for column in columns) + f"{'calls':>8}")
+            for component, row in components.items():
+                mark = '*' if component in critical else ' '
+                log.info(f"{mark} {component:<16}" + ''.join(f"{row[column]:>10.1f}" for column in columns)
+                         + f"{sdk_calls.get((run, component), 0):>8}")
+            if critical:
+                log.info(f"Critical path: {' -> '.join(critical)}")
+        for span in self.spans('run'):
+            log.info(f"Run {span.name}: {span.duration:.1f}s")
+
+def _get_lane() -> int:
+    # asyncioタスクごとに別レーンとして出力する
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task else threading.get_ident()
+
+tracer = Tracer()
+
+def span(name: str, category: str = 'step', component: str = None, **attrs):
+    return tracer.span(name, category, component, **attrs)
+
+def current_span():
+    """Returns the current span of the thread or asyncio task, or None."""
+    return __current_span__.get()
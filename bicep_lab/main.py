@@ -1,11 +1,15 @@
 import os
+import time
 import docopt
 import traceback
 import yaml
-from deploy.resources import ResourceGroup, Subscription
-from deploy.utils import context, log
-import deploy.deployment_manager as deployment_manager
-from deploy.common import core_deploy_files, apps_deploy_files
+# Azure SDK を読み込むモジュールは使用時に読み込む (起動時間短縮のため)
+from deploy import resources, fanout
+from deploy.preflight import Preflight, check_templates
+from deploy.utils import context, log, trace, ratelimit, lro, events, secrets
+from deploy.utils.template_cache import TemplateCache, get_template_cache_dir
+from deploy.utils.state import StateStore, get_state_dir
+from deploy.common import core_deploy_files, apps_deploy_files, component_dependencies
 
 log.set_console_handler('INFO')
 root_path = os.path.dirname(__file__)
@@ -15,54 +19,182 @@ def main():
     args = docopt.docopt(__read_usage())
     config = __read_config()
     config['RootPath'] = root_path
+    __set_log_outputs(config.get('logging') or {})
+    ratelimit.limiter.configure(**(config.get('retry') or {}))
+    lro.poller.configure(**(config.get('poller') or {}))
+    secrets.cache.configure(config.get('secret_cache_ttl', 300))
     # オプションのリストを作成
     options = [
         args.get('--core-deploy', False), args.get('--apps-deploy', False),
-        args.get('--undeploy', False), args.get('--destroy', False)
+        args.get('--undeploy', False), args.get('--destroy', False),
+        args.get('--destroy-status', False), args.get('--bicep-cache')
     ]
 
     # オプションがただ一つだけ含まれていることを確認
     if sum(bool(option) for option in options) != 1:
         log.error("Exactly one of the options must be specified.")
         raise ValueError("Exactly one of the options must be specified.")
-    
-    if not __confirm_user_input(args, config):
+
+    if args.get('--bicep-cache'):
+        bicep_cache(args, config)
+        return
+
+    # 対象の環境 (config.yml の environments、--envs で絞り込み)
+    environments = fanout.get_environments(config, args.get('--envs'))
+    if args.get('--destroy-status', False):
+        destroy_status(args, config, environments)
         return
 
-    if args.get('--core-deploy', False) or args.get('--apps-deploy', False):
-        deploy(args, config)
+    deploying = args.get('--core-deploy', False) or args.get('--apps-deploy', False)
+    if deploying:
+        # 登録内容とテンプレートの不一致は、クラウドを呼ぶ前に検出する
+        check_templates(os.path.join(root_path, 'bicep'), __get_deploy_components(args))
+
+    # 事前チェックを開始し、確認の入力中に並行して実行する
+    preflight = Preflight(environments, __get_deploy_components(args) if deploying else None)
+    if not __confirm_user_input(args, environments, preflight):
+        preflight.cancel()
+        return
+    # 失敗したチェックはまとめて報告し、何もデプロイしない
+    prepared = preflight.result()
+
+    if deploying:
+        deploy(args, config, environments, prepared)
     elif args.get('--undeploy', False):
-        undeploy(args, config)
+        undeploy(args, config, environments)
     elif args.get('--destroy', False):
-        destroy(args, config)
+        destroy(args, config, environments)
     else:
         log.error("Invalid option.")
         raise ValueError("Invalid option.")
 
-def destroy(args, config):
-    log.info("Destroying the resource group.")
-    rg = ResourceGroup(config['subscription_id'])
-    rg.delete_resource_group(context.get_main_rg_name(config['env_name']))
+def bicep_cache(args, config):
+    action = args['--bicep-cache']
+    bicep_dir_path = os.path.join(root_path, 'bicep')
+    cache = TemplateCache(get_template_cache_dir(config))
+    if action == 'warm':
+        template_paths = cache.warm(bicep_dir_path, config.get('max_workers'))
+        log.info(f"Template cache is up to date for {len(template_paths)} templates.")
+    elif action == 'prune':
+        removed = cache.prune(bicep_dir_path)
+        log.info(f"Removed {len(removed)} stale template cache entries.")
+    else:
+        log.error(f"Invalid bicep cache action: {action}")
+        raise ValueError(f"Invalid bicep cache action: {action}")
 
-def undeploy(args, config):
-    ## TOBE: Implement undeploy function
-    pass
+def destroy(args, config, environments):
+    # 全環境の削除を開始してから、まとめて完了を待つ
+    started = []
+    for conf in environments:
+        rg_name = context.get_main_rg_name(conf['env_name'])
+        log.info(f"Destroying the resource group {rg_name} of {conf['env_name']}.")
+        rg = resources.ResourceGroup(conf['subscription_id'])
+        if rg.begin_delete_resource_group(rg_name):
+            started.append(conf)
+        # 記録したリソース名・出力・フィンガープリントは削除後には使えない
+        StateStore(get_state_dir(conf), conf['subscription_id'], conf['env_name']).clear()
+    if args.get('--no-wait', False):
+        log.info("Deletion started. Run main.py --destroy-status to follow it.")
+        return
+    destroy_status(args, config, started, just_started=True)
 
-def deploy(args, config):
-    components = []
+def destroy_status(args, config, environments, interval: float = 15, just_started: bool = False):
+    """
+    Polls the resource groups of the environments until none of them is being deleted.
+
+    Args:
+        just_started (bool): The deletions were just requested. ARM may not report the resource groups
+            as Deleting yet, so another state on the first poll is treated as pending.
+    """
+    pending = list(environments)
+    start = time.monotonic()
+    first_poll = True
+    while pending:
+        deleting = []
+        for conf in pending:
+            rg_name = context.get_main_rg_name(conf['env_name'])
+            state = resources.ResourceGroup(conf['subscription_id']).get_resource_group_state(rg_name)
+            if state is None:
+                log.info(f"{rg_name}: deleted")
+            elif state == 'Deleting':
+                deleting.append(conf)
+            elif just_started and first_poll:
+                log.info(f"{rg_name}: {state} (deletion requested)")
+                deleting.append(conf)
+            else:
+                log.info(f"{rg_name}: {state} (not being deleted)")
+        first_poll = False
+        if deleting:
+            log.info(f"Deleting {', '.join(context.get_main_rg_name(conf['env_name']) for conf in deleting)}... "
+                     f"({time.monotonic() - start:.0f}s)")
+            time.sleep(interval)
+        pending = deleting
+
+def undeploy(args, config, environments):
+    components = __get_valid_components(args['--components'], {**core_deploy_files, **apps_deploy_files})
+    sorted_components = sorted(components, key=lambda x: all_components_with_order.index(x))
+    try:
+        import deploy.undeploy_manager as undeploy_manager
+        summary = fanout.deploy_environments(
+            environments, lambda conf: undeploy_manager.run_undeploy(conf, sorted_components),
+            config.get('max_parallel_environments'))
+        fanout.log_summary(summary)
+    finally:
+        ratelimit.limiter.log_stats()
+        if args.get('--trace'):
+            trace.tracer.export_chrome_trace(args['--trace'])
+
+def deploy(args, config, environments, prepared: dict):
     try:
-        if args.get('--core-deploy', False):
-            components = __get_valid_components(args['--components'], core_deploy_files)
-        if args.get('--apps-deploy', False):
-            components = __get_valid_components(args['--components'], apps_deploy_files)
-        
-        __validate_resource_group(components, config)
-        sorted_components = sorted(components, key=lambda x: all_components_with_order.index(x))
-        deployment_manager.run_deployment(config, sorted_components)
+        sorted_components = __get_deploy_components(args)
+        for conf in environments:
+            __validate_resource_group(sorted_components, conf)
+        if args.get('--async', False):
+            if len(environments) != 1:
+                log.error("--async supports exactly one environment.")
+                raise ValueError("--async supports exactly one environment.")
+            if args.get('--events'):
+                log.warning("--events is not supported with --async and is ignored.")
+            if args.get('--batch'):
+                log.warning("--batch is not supported with --async and is ignored.")
+            import asyncio
+            import deploy.async_deployment_manager as async_deployment_manager
+            asyncio.run(async_deployment_manager.run_deployment(environments[0], sorted_components,
+                                                                force=args.get('--force', False),
+                                                                prepared=prepared[environments[0]['env_name']]))
+        else:
+            import deploy.deployment_manager as deployment_manager
+            # リソースごとの進捗をコンソールと (指定時は) JSON Lines ファイルに出力する
+            events.bus.subscribe(events.log_event)
+            if args.get('--events'):
+                events.bus.subscribe(events.JsonLinesWriter(args['--events']))
+            limits = fanout.ConcurrencyLimits.from_config(config)
+            summary = fanout.deploy_environments(
+                environments,
+                lambda conf: deployment_manager.run_deployment(conf, sorted_components,
+                                                               force=args.get('--force', False), limits=limits,
+                                                               prepared=prepared[conf['env_name']],
+                                                               batch=args.get('--batch', False)),
+                config.get('max_parallel_environments'))
+            fanout.log_summary(summary)
     except Exception as e:
         log.error(f"Error deploying the components: {e}")
         log.error(traceback.format_exc())
         raise e
+    finally:
+        events.bus.close()
+        trace.tracer.log_summary(component_dependencies)
+        ratelimit.limiter.log_stats()
+        if args.get('--trace'):
+            trace.tracer.export_chrome_trace(args['--trace'])
+
+def __get_deploy_components(args) -> list:
+    # --core-deploy / --apps-deploy の対象コンポーネント (デプロイ順)
+    if args.get('--core-deploy', False):
+        components = __get_valid_components(args['--components'], core_deploy_files)
+    else:
+        components = __get_valid_components(args['--components'], apps_deploy_files)
+    return sorted(components, key=lambda x: all_components_with_order.index(x))
 
 def __get_valid_components(raw_components_str, valid_components_dict):
     raw_components = raw_components_str.split(',')
@@ -82,6 +214,14 @@ def __read_usage():
     with open(os.path.join(root_path, 'deploy', 'usage'), 'r') as usage_file:
         return usage_file.read().strip()
 
+def __set_log_outputs(logging_config: dict):
+    # 相対パスは main.py のディレクトリを基準にする
+    if logging_config.get('component_dir'):
+        log.set_component_log_dir(os.path.join(root_path, logging_config['component_dir']),
+                                  logging_config.get('level', 'debug'))
+    if logging_config.get('json_file'):
+        log.set_json_handler(os.path.join(root_path, logging_config['json_file']), logging_config.get('level', 'debug'))
+
 def __read_config():
     with open(os.path.join(root_path, 'config', 'config.yml'), 'r') as config_file:
         return yaml.safe_load(config_file)
@@ -89,24 +229,27 @@ def __read_config():
 def __validate_resource_group(components, config):
     rg_name = context.get_main_rg_name(config['env_name'])
     location = config['location']
-    resource_group = ResourceGroup(config['subscription_id'])
+    resource_group = resources.ResourceGroup(config['subscription_id'])
 
+    # アプリケーションのみの場合、リソースグループの存在は事前チェックで確認済み
     if any([component in components for component in core_deploy_files.keys()]):
         resource_group.create_resource_group(rg_name, location)
-    else:
-        if not resource_group.check_resource_group_exists(rg_name):
-            log.error(f"Before deploying the application components, the resource group {rg_name} must exist.")
-            raise ValueError(f"Before deploying the application components, the resource group {rg_name} must exist.")
-        else:
-            log.info(f"validated resource group {rg_name} ok.")
-
-def __confirm_user_input(args:dict, config: dict):
-    subscription = Subscription(config['subscription_id'])
-    sub_info = subscription.get_subscription_info()
-    log.info(f"Subscription ID: {sub_info['id']}")
-    log.info(f"Subscription Name: {sub_info['name']}")
-    log.info(f"Tenant ID: {sub_info['tenant_id']}")
+
+def __confirm_user_input(args:dict, environments: list, preflight: Preflight):
+    # 全環境をまとめて表示し、確認は一度だけ行う (サブスクリプション以外のチェックは入力中も続ける)
+    for conf in environments:
+        try:
+            sub_info = preflight.get_subscription_info(conf['subscription_id'])
+        except Exception:
+            # 表示できない場合は他のチェックの結果と合わせて報告する
+            preflight.result()
+            raise
+        log.info(f"Environment: {conf['env_name']} (Resource Group: {context.get_main_rg_name(conf['env_name'])})")
+        log.info(f"  Subscription ID: {sub_info['id']}")
+        log.info(f"  Subscription Name: {sub_info['name']}")
+        log.info(f"  Tenant ID: {sub_info['tenant_id']}")
     log.info(f"Componets: {args['--components']}")
+    log.flush()
     confirm = input("Would you like to proceed with the deployment? (yes/y to confirm): ").strip().lower()
     if confirm != 'yes' and confirm != 'y':
         log.info("Deployment cancelled.")
@@ -114,4 +257,8 @@ def __confirm_user_input(args:dict, config: dict):
     return True
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        resources.close_registry()
+        log.shutdown()
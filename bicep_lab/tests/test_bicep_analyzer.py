@@ -0,0 +1,107 @@
+import os
+import pytest
+from deploy.utils import bicep_analyzer
+from deploy.common import core_deploy_files, apps_deploy_files, component_parameters
+from deploy import preflight
+
+BICEP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bicep')
+DEPLOY_FILES = {**core_deploy_files, **apps_deploy_files}
+
+@pytest.fixture(scope='module')
+def analysis():
+    return bicep_analyzer.analyze(BICEP_DIR, DEPLOY_FILES)
+
+def test_dependency_graph_of_the_repository_templates(analysis):
+    dependencies = {component: result['dependencies'] for component, result in analysis.items()}
+    assert dependencies == {
+        'vnet': set(),
+        'role': set(),
+        'keyvault': set(),
+        'acr': {'role'},
+        'sa': {'role'},
+        'dev_vm': {'vnet'},
+        'db': set(),
+        'app_container': set(),
+        'scheduler': {'acr', 'app_container'},
+        'back': {'acr', 'app_container', 'keyvault', 'scheduler'},
+        'front': {'acr', 'app_container'}
+    }
+    assert all(not result['errors'] for result in analysis.values())
+
+def test_required_parameters(analysis):
+    assert analysis['front']['required'] == {'acrName', 'app_name', 'env_name', 'imageTag'}
+    assert analysis['back']['required'] == {'acrName', 'ai_connection_string', 'app_name', 'env_name',
+                                            'imageTag', 'vaultName'}
+    assert analysis['scheduler']['required'] == {'acrName', 'ai_connection_string', 'env_name'}
+    assert analysis['scheduler']['params']['imageTag'] == {'type': 'string', 'default': "'latest'"}
+
+def test_component_parameters_match_the_templates(analysis):
+    for component, result in analysis.items():
+        prepared = set(component_parameters[component])
+        assert prepared <= set(result['params']), component
+        assert result['required'] <= prepared, component
+
+def test_check_templates_accepts_every_component():
+    preflight.check_templates(BICEP_DIR, list(DEPLOY_FILES))
+
+def test_check_templates_reports_only_the_selected_components(monkeypatch):
+    monkeypatch.setitem(preflight.component_parameters, 'front', ['env_name'])
+    preflight.check_templates(BICEP_DIR, ['vnet'])
+    with pytest.raises(ValueError, match='front: required parameter acrName, app_name, imageTag'):
+        preflight.check_templates(BICEP_DIR, ['front'])
+
+def test_check_templates_reports_missing_dependencies(monkeypatch):
+    monkeypatch.setitem(preflight.component_dependencies, 'back', ['app_container', 'acr'])
+    with pytest.raises(ValueError, match='back: backendapp.bicep references resources of keyvault, scheduler'):
+        preflight.check_templates(BICEP_DIR, ['back'])
+
+def test_parse_template_ignores_comments_and_reads_modules(tmp_path):
+    (tmp_path / 'main.bicep').write_text(
+        "// param commented string\n"
+        "param name string\n"
+        "param url string = 'https://example.com' // 文字列中の // はコメントではない\n"
+        "/* resource hidden 'Microsoft.Web/sites@2022-03-01' = {} */\n"
+        "resource vault 'Microsoft.KeyVault/vaults@2023-07-01' existing = {\n"
+        "  name: name\n"
+        "}\n"
+        "module child 'child.bicep' = {\n"
+        "  name: 'child'\n"
+        "  params: {\n"
+        "    vaultName: name\n"
+        "  }\n"
+        "}\n", encoding='utf-8')
+    template = bicep_analyzer.parse_template(str(tmp_path / 'main.bicep'))
+    assert template['params'] == {'name': {'type': 'string', 'default': None},
+                                  'url': {'type': 'string', 'default': "'https://example.com'"}}
+    assert template['resources'] == [{'symbol': 'vault', 'type': 'Microsoft.KeyVault/vaults', 'existing': True,
+                                      'name': 'name'}]
+    assert template['modules'] == [{'symbol': 'child', 'path': 'child.bicep', 'params': {'vaultName': 'name'}}]
+
+def test_analyze_resolves_references_through_modules(tmp_path):
+    (tmp_path / 'vault.bicep').write_text(
+        "param vaultName string\n"
+        "resource vault 'Microsoft.KeyVault/vaults@2023-07-01' = {\n"
+        "  name: vaultName\n"
+        "}\n", encoding='utf-8')
+    (tmp_path / 'app.bicep').write_text(
+        "param vaultName string\n"
+        "module secrets 'secrets.bicep' = {\n"
+        "  name: 'secrets'\n"
+        "  params: {\n"
+        "    kv: vaultName\n"
+        "  }\n"
+        "}\n", encoding='utf-8')
+    (tmp_path / 'secrets.bicep').write_text(
+        "param kv string\n"
+        "resource vault 'Microsoft.KeyVault/vaults@2023-07-01' existing = {\n"
+        "  name: kv\n"
+        "}\n"
+        "resource secret 'Microsoft.KeyVault/vaults/secrets@2023-07-01' = {\n"
+        "  parent: vault\n"
+        "  name: 'password'\n"
+        "}\n", encoding='utf-8')
+    result = bicep_analyzer.analyze(str(tmp_path), {'vault': 'vault.bicep', 'app': 'app.bicep',
+                                                    'missing': 'missing.bicep'})
+    assert result['app']['dependencies'] == {'vault'}
+    assert result['vault']['dependencies'] == set()
+    assert result['missing']['errors']
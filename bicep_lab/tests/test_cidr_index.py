@@ -0,0 +1,66 @@
+import pytest
+from deploy.utils.cidr_index import CidrIndex
+
+def __index(*blocks) -> CidrIndex:
+    index = CidrIndex()
+    for cidr, owner in blocks:
+        index.add(cidr, owner)
+    return index
+
+def test_overlaps_containing_and_contained_blocks():
+    index = __index(('10.0.0.0/16', 'vnet1'), ('10.1.4.0/24', 'vnet2'))
+    assert [owner for _, owner in index.overlaps('10.0.8.0/24')] == ['vnet1']
+    assert [owner for _, owner in index.overlaps('10.1.0.0/16')] == ['vnet2']
+    assert sorted(owner for _, owner in index.overlaps('10.0.0.0/8')) == ['vnet1', 'vnet2']
+
+def test_adjacent_blocks_do_not_overlap():
+    index = __index(('10.0.0.0/16', 'vnet1'), ('10.2.0.0/16', 'vnet2'))
+    assert index.is_available('10.1.0.0/16')
+    assert index.is_available('10.1.255.0/24')
+    # 隣接するブロックの端のアドレスは重なる
+    assert [owner for _, owner in index.overlaps('10.0.255.255/32')] == ['vnet1']
+    assert [owner for _, owner in index.overlaps('10.2.0.0/32')] == ['vnet2']
+
+def test_overlap_behind_a_smaller_block():
+    # 開始位置が後のブロックより前のブロックの方が長く続く場合
+    index = __index(('10.0.0.0/8', 'big'), ('10.5.0.0/16', 'small'))
+    assert [owner for _, owner in index.overlaps('10.200.0.0/16')] == ['big']
+
+def test_exclude_owner():
+    index = __index(('10.0.0.0/16', 'vnet1'))
+    assert index.overlaps('10.0.0.0/24', exclude_owner='vnet1') == []
+    assert not index.is_available('10.0.0.0/24')
+
+def test_blocks_added_after_a_query_are_indexed():
+    index = CidrIndex()
+    assert index.is_available('10.0.0.0/16')
+    index.add('10.0.0.0/16', 'vnet1')
+    assert len(index) == 1
+    assert not index.is_available('10.0.1.0/24')
+
+def test_ip_versions_are_separate():
+    index = __index(('10.0.0.0/16', 'v4'), ('fd00::/48', 'v6'))
+    assert [owner for _, owner in index.overlaps('fd00:0:0:1::/64')] == ['v6']
+    assert [owner for _, owner in index.overlaps('10.0.0.0/24')] == ['v4']
+
+def test_next_free_skips_used_blocks():
+    index = __index(('10.0.0.0/16', 'vnet1'), ('10.1.0.0/16', 'vnet2'), ('10.3.0.0/16', 'vnet3'))
+    assert index.next_free(16) == '10.2.0.0/16'
+
+def test_next_free_aligns_after_a_smaller_block():
+    index = __index(('10.0.0.0/24', 'vnet1'))
+    assert index.next_free(16) == '10.1.0.0/16'
+    assert index.next_free(24) == '10.0.1.0/24'
+
+def test_next_free_within_a_range():
+    index = __index(('10.0.0.0/24', 'subnet1'), ('10.0.1.0/24', 'subnet2'))
+    assert index.next_free(24, '10.0.0.0/16') == '10.0.2.0/24'
+    assert index.next_free(24, '10.0.0.0/16', exclude_owner='subnet1') == '10.0.0.0/24'
+
+def test_next_free_returns_empty_when_full():
+    index = __index(('10.0.0.0/23', 'vnet1'))
+    assert index.next_free(24, '10.0.0.0/23') == ''
+
+def test_next_free_rejects_a_prefix_larger_than_the_range():
+    with pytest.raises(ValueError):
+        CidrIndex().next_free(8, '10.0.0.0/16')
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+import pytest
+from deploy import scheduler
+from deploy.scheduler import Continuation, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_SKIPPED
+
+def __resolve_later(value, delay: float = 0.01) -> Future:
+    future = Future()
+    future.set_running_or_notify_cancel()
+    threading.Timer(delay, future.set_result, [value]).start()
+    return future
+
+def test_runs_tasks_after_their_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def worker(task):
+        with lock:
+            order.append(task)
+        return task
+
+    dependencies = {'c': ['a', 'b'], 'b': ['a']}
+    results = scheduler.run_dag(['c', 'b', 'a'], dependencies, worker, max_workers=4)
+    assert order.index('a') < order.index('b') < order.index('c')
+    assert all(result['status'] == STATUS_SUCCEEDED for result in results.values())
+    assert results['c']['result'] == 'c'
+
+def test_dependencies_outside_the_tasks_are_satisfied():
+    results = scheduler.run_dag(['b'], {'b': ['a']}, lambda task: task)
+    assert results['b']['status'] == STATUS_SUCCEEDED
+
+def test_failure_skips_dependents_transitively():
+    def worker(task):
+        if task == 'a':
+            raise RuntimeError('boom')
+        return task
+
+    dependencies = {'b': ['a'], 'c': ['b'], 'd': []}
+    results = scheduler.run_dag(['a', 'b', 'c', 'd'], dependencies, worker, max_workers=2)
+    assert results['a']['status'] == STATUS_FAILED
+    assert str(results['a']['error']) == 'boom'
+    assert results['b']['status'] == STATUS_SKIPPED
+    assert results['c']['status'] == STATUS_SKIPPED
+    assert results['d']['status'] == STATUS_SUCCEEDED
+
+def test_cycle_raises():
+    with pytest.raises(ValueError):
+        scheduler.run_dag(['a', 'b', 'c'], {'a': ['c'], 'b': ['a'], 'c': ['b']}, lambda task: task)
+
+def test_continuations_are_chained():
+    def worker(task):
+        return Continuation(__resolve_later(1),
+                            lambda first: Continuation(__resolve_later(first + 1), lambda second: (task, second)))
+
+    results = scheduler.run_dag(['a'], {}, worker)
+    assert results['a'] == {'status': STATUS_SUCCEEDED, 'result': ('a', 2), 'error': None}
+
+def test_future_result_is_the_task_result():
+    results = scheduler.run_dag(['a', 'b'], {'b': ['a']}, lambda task: __resolve_later(task.upper()))
+    assert results['a']['result'] == 'A'
+    assert results['b']['result'] == 'B'
+
+def test_failed_continuation_skips_dependents():
+    def fail(_):
+        raise RuntimeError('then failed')
+
+    def worker(task):
+        return Continuation(__resolve_later(task), fail) if task == 'a' else task
+
+    results = scheduler.run_dag(['a', 'b'], {'b': ['a']}, worker)
+    assert results['a']['status'] == STATUS_FAILED
+    assert results['b']['status'] == STATUS_SKIPPED
+
+def test_async_failure_skips_dependents_transitively():
+    async def worker(task):
+        if task == 'a':
+            raise RuntimeError('boom')
+        return task
+
+    dependencies = {'b': ['a'], 'c': ['b']}
+    results = asyncio.run(scheduler.run_dag_async(['a', 'b', 'c', 'd'], dependencies, worker))
+    assert [results[task]['status'] for task in 'abcd'] == [STATUS_FAILED, STATUS_SKIPPED, STATUS_SKIPPED,
+                                                            STATUS_SUCCEEDED]
+
+def test_async_cycle_raises():
+    async def worker(task):
+        return task
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run_dag_async(['a', 'b'], {'a': ['b'], 'b': ['a']}, worker))
@@ -0,0 +1,28 @@
+import pytest
+from deploy.utils import context
+from deploy.deployment_manager import build_vnet_params
+from deploy.utils.cidr_index import CidrIndex
+
+CONF = {'env_name': 'dev', 'vnet_cidr': '10.1.0.0/16', 'dev_subnet_cidr': '10.1.0.0/24'}
+OWN_VNET_ID = '/subscriptions/s/resourceGroups/rg/providers/Microsoft.Network/virtualNetworks/own'
+
+def __index(*blocks) -> CidrIndex:
+    index = CidrIndex()
+    for cidr, owner in blocks:
+        index.add(cidr, owner)
+    return index
+
+def test_new_vnet_overlapping_another_vnet_raises():
+    with pytest.raises(ValueError, match='Vnet does not exist.*Next free block: 10.0.0.0/16'):
+        build_vnet_params(CONF, __index(('10.1.0.0/16', 'other')))
+
+def test_existing_vnet_is_checked_against_other_vnets():
+    with pytest.raises(ValueError, match='exists, but VNet CIDR 10.1.0.0/16 overlaps another VNet'):
+        build_vnet_params(CONF, __index(('10.1.0.0/16', OWN_VNET_ID), ('10.1.128.0/17', 'other')), OWN_VNET_ID,
+                          subnet_index=CidrIndex())
+
+def test_existing_vnet_does_not_overlap_itself():
+    subnet_index = __index((CONF['dev_subnet_cidr'], context.get_dev_subnet_name('dev')))
+    params = build_vnet_params(CONF, __index(('10.1.0.0/16', OWN_VNET_ID)), OWN_VNET_ID, subnet_index=subnet_index)
+    assert params['vnet_address_prefix'] == '10.1.0.0/16'
+    assert params['subnet_address_prefix'] == '10.1.0.0/24'